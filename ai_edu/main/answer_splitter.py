@@ -0,0 +1,77 @@
+"""
+prepare_final_questions 的答案切分：把大题的 answers 分配到各小题。
+原实现对每个小题分别在整段答案上 re.search 【小问N详解】，再分别搜索【答案】/【分析】/【详解】段和其中的 (N)，
+复杂度为 小题数 × 答案长度。这里对整段答案只做一次 finditer 得到全部标记，反向一遍算出每个标记的结束位置；
+每个段落内的 (N) 也只扫描一次，按编号建表，小题直接查表。切分结果与原来的逐个搜索完全一致：
+- 【小问N详解】 到下一个 【小问M详解】/【点睛】 为止，作为小题 N 的答案
+- 没有任何小问详解时，取第一个【答案】/【分析】/【详解】段中 (N) 到下一个 (M) 之间的内容拼接
+- 第一个【点睛】到结尾作为大题答案
+编号按数字串比较，与原先 rf'【小问{n}详解】' 的字面匹配一致（全角数字、前导零都不算同一编号）。
+"""
+import re
+from typing import Dict, List, Tuple
+
+_MARKER_RE = re.compile(r'【小问(\d+)详解】|【(答案|解析|分析|详解|点睛)】')
+_SUB_RE = re.compile(r'[（(](\d+)[）)]')
+
+_DETAIL = "小问"
+# 各类标记的内容到哪些标记之前为止
+_STOPS = {
+    _DETAIL: (_DETAIL, "点睛"),
+    "答案": ("解析", "分析", "详解", "点睛"),
+    "分析": ("详解", "点睛"),
+    "详解": ("点睛",),
+}
+# 小题内容中去掉重复的段落标记
+_CLEAN_RE = {name: re.compile(rf'【{name}】.*?$', re.DOTALL) for name in ("答案", "分析", "详解")}
+
+
+def _spans_by_number(content: str) -> Dict[str, str]:
+    """按 (N) 标记切分：每个编号第一次出现处到下一个 (数字) 标记之间的文本"""
+    marks = list(_SUB_RE.finditer(content))
+    spans = {}
+    for i, m in enumerate(marks):
+        if m.group(1) not in spans:
+            end = marks[i + 1].start() if i + 1 < len(marks) else len(content)
+            spans[m.group(1)] = content[m.end():end]
+    return spans
+
+
+def split_answers(text: str, numbers: List[int]) -> Tuple[Dict[int, str], str]:
+    """返回 ({小题号: 答案}, 大题答案)；没有分到内容的小题答案为空串"""
+    details: Dict[str, str] = {}   # 编号 -> 【小问N详解】的内容（第一次出现）
+    sections: Dict[str, str] = {}  # 段落名 -> 段落内容（第一次出现）
+    point = None                   # 第一个【点睛】的起点
+    nxt: Dict[str, int] = {}       # 各类标记在当前位置之后最近一次出现的起点
+    for m in reversed(list(_MARKER_RE.finditer(text))):
+        kind = _DETAIL if m.group(1) is not None else m.group(2)
+        if kind in _STOPS:
+            end = min((nxt[k] for k in _STOPS[kind] if k in nxt), default=len(text))
+            if kind == _DETAIL:
+                details[m.group(1)] = text[m.end():end]
+            else:
+                sections[kind] = text[m.end():end]
+        elif kind == "点睛":
+            point = m.start()
+        nxt[kind] = m.start()
+
+    answers = {n: details[str(n)].strip() if str(n) in details else "" for n in numbers}
+    if not any(answers.values()):
+        # 没有【小问N详解】格式，则综合提取各部分内容
+        by_section = {name: _spans_by_number(content) for name, content in sections.items() if name in _CLEAN_RE}
+        for n in numbers:
+            parts = []
+            for name in ("答案", "分析", "详解"):
+                span = by_section.get(name, {}).get(str(n))
+                if span is None:
+                    continue
+                part = span.strip().rstrip('；;')
+                # 清理可能的重复标记
+                part = _CLEAN_RE[name].sub('', part).strip()
+                if part:
+                    parts.append(f"【{name}】（{n}）{part}")
+            if parts:
+                answers[n] = "\n".join(parts)
+
+    main_answer = text[point:].strip() if point is not None else ""
+    return answers, main_answer
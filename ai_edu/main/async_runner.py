@@ -0,0 +1,183 @@
+"""
+基于 AsyncOpenAI 的异步高并发打标签执行器。
+
+- 同时在途的题目数由 Semaphore 限制（concurrency）
+- 令牌桶分别限制每分钟请求数（rpm）与每分钟 token 数（tpm）
+- 每道题独立重试，退避时间带随机抖动，互不阻塞
+- 结果按输入顺序返回，与完成先后无关
+- base_url 可指向本地 mock 服务做测试/压测
+- token 与耗时记入 model.usage_ledger.LEDGER，按题目归属
+"""
+import asyncio
+import random
+import time
+from typing import Callable, List, Optional, Sequence, Union
+
+from openai import AsyncOpenAI
+from tqdm import tqdm
+
+from model.transport import make_async_openai_client
+from model.usage_ledger import LEDGER
+
+ASYNC_CONCURRENCY = 16   # 同时在途的题目数
+RPM_LIMIT = 300          # 每分钟请求数上限，None 或 0 表示不限
+TPM_LIMIT = 500_000      # 每分钟 token 数上限，None 或 0 表示不限
+RETRY_BASE = 1.0         # 退避基数（秒）
+RETRY_CAP = 30.0         # 单次退避上限（秒）
+
+
+class TokenBucket:
+    """
+    令牌桶：按 rate_per_min 匀速补充，容量为一分钟的额度。
+    允许通过 adjust 记“欠账”（余额为负），用实际用量校正预估值。
+    """
+
+    def __init__(self, rate_per_min: float):
+        self.rate = rate_per_min / 60.0
+        self.capacity = float(rate_per_min)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        amount = min(amount, self.capacity)  # 单次超过容量的请求也要能放行
+        async with self._lock:  # 持锁等待，保证先到先得
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, delta: float):
+        """delta > 0 追加扣减，delta < 0 归还"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class RateLimiter:
+    """RPM + TPM 双令牌桶"""
+
+    def __init__(self, rpm: Optional[int] = RPM_LIMIT, tpm: Optional[int] = TPM_LIMIT):
+        self.rpm = TokenBucket(rpm) if rpm else None
+        self.tpm = TokenBucket(tpm) if tpm else None
+
+    async def acquire(self, est_tokens: int):
+        if self.rpm:
+            await self.rpm.acquire(1)
+        if self.tpm:
+            await self.tpm.acquire(est_tokens)
+
+    def settle(self, est_tokens: int, used_tokens: int):
+        """请求完成后用实际 token 数校正预估"""
+        if self.tpm:
+            self.tpm.adjust(used_tokens - est_tokens)
+
+
+def estimate_tokens(messages: list, max_tokens: Optional[int] = None) -> int:
+    """粗略估算一次请求的 token 数：中文约 1 字 1 token，按字符数保守估计"""
+    chars = 0
+    for m in messages:
+        content = m.get("content") if isinstance(m, dict) else getattr(m, "content", None)
+        if isinstance(content, str):
+            chars += len(content)
+    return chars + (max_tokens or 0)
+
+
+def backoff(attempt: int) -> float:
+    """指数退避 + 全抖动"""
+    return random.uniform(0, min(RETRY_CAP, RETRY_BASE * 2 ** attempt))
+
+
+async def _chat_with_tools(client: AsyncOpenAI, prompt: str, handle_tool_call: Callable,
+                           limiter: RateLimiter, model: str, tools: Optional[list],
+                           create_kwargs: dict) -> str:
+    """单道题的多轮对话：遇到工具调用就在线程池中并发执行，直到模型给出最终回答"""
+    messages = [{"role": "user", "content": prompt}]
+    if tools:
+        create_kwargs = dict(create_kwargs, tools=tools, tool_choice="auto")
+    while True:
+        est = estimate_tokens(messages, create_kwargs.get("max_tokens"))
+        await limiter.acquire(est)
+        start = time.perf_counter()
+        resp = await client.chat.completions.create(model=model, messages=messages, **create_kwargs)
+        LEDGER.record_chat(model, getattr(resp, "usage", None), time.perf_counter() - start)
+        if getattr(resp, "usage", None):
+            limiter.settle(est, resp.usage.total_tokens)
+
+        message = resp.choices[0].message
+        messages.append(message)
+        if not message.tool_calls:
+            return message.content.strip()
+
+        # 工具是同步实现（requests），放到线程中执行，同一轮的多个调用并发
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(asyncio.to_thread(handle_tool_call, tc) for tc in message.tool_calls)
+        )
+        messages.extend(r for r in results if r is not None)
+        LEDGER.record("tool_turn", "parallel", latency=time.perf_counter() - start)
+
+
+async def _run_all(prompts: Sequence[str], handle_tool_call: Callable, model: str,
+                   tools: Optional[list], concurrency: int, rpm: Optional[int], tpm: Optional[int],
+                   max_retry: int, base_url: Optional[str], api_key: Optional[str],
+                   keys: Optional[Sequence], on_result: Optional[Callable], desc: str,
+                   create_kwargs: dict) -> List[Union[str, Exception]]:
+    # 关闭 SDK 自带重试，统一由下面的逐题重试控制；连接池与超时配置见 model.transport
+    client = make_async_openai_client(api_key, base_url, max_retries=0)
+    limiter = RateLimiter(rpm, tpm)
+    sem = asyncio.Semaphore(concurrency)
+    results: List[Union[str, Exception]] = [None] * len(prompts)
+    bar = tqdm(total=len(prompts), desc=desc)
+
+    async def worker(idx: int, prompt: str):
+        # 每个任务有独立的上下文，设置后本题的请求和工具调用都记到该题目下
+        LEDGER.set_question(keys[idx] if keys is not None else idx)
+        async with sem:
+            for attempt in range(max_retry):
+                try:
+                    results[idx] = await _chat_with_tools(client, prompt, handle_tool_call, limiter,
+                                                          model, tools, create_kwargs)
+                    break
+                except Exception as e:
+                    if attempt == max_retry - 1:
+                        results[idx] = e
+                        break
+                    wait = backoff(attempt)
+                    print(f"[warn] 第 {idx} 题: {e}. retry in {wait:.1f}s …")
+                    await asyncio.sleep(wait)
+        if on_result:
+            on_result(idx, results[idx])
+        bar.update(1)
+
+    try:
+        await asyncio.gather(*(worker(i, p) for i, p in enumerate(prompts)))
+    finally:
+        bar.close()
+        await client.close()
+    return results
+
+
+def run_tagging(prompts: Sequence[str], handle_tool_call: Callable, model: str,
+                tools: Optional[list] = None, concurrency: int = ASYNC_CONCURRENCY,
+                rpm: Optional[int] = RPM_LIMIT, tpm: Optional[int] = TPM_LIMIT,
+                max_retry: int = 3, base_url: Optional[str] = None, api_key: Optional[str] = None,
+                keys: Optional[Sequence] = None, on_result: Optional[Callable] = None, desc: str = "异步标注",
+                **create_kwargs) -> List[Union[str, Exception]]:
+    """
+    并发地为一批 prompt 调用模型，返回与 prompts 一一对应的列表：
+    成功为模型最终回答字符串，重试耗尽则为最后一次的异常对象。
+    handle_tool_call(tool_call) 与同步版本共用，返回 tool 消息或 None。
+    keys 为每个 prompt 在用量账本中的题目标识（默认用下标）。
+    on_result(idx, result) 在每道题完成时立即回调，可用于增量写断点。
+    其余关键字参数（temperature、max_tokens 等）原样传给 chat.completions.create。
+    """
+    return asyncio.run(_run_all(prompts, handle_tool_call, model, tools, concurrency, rpm, tpm,
+                                max_retry, base_url, api_key, keys, on_result, desc,
+                                create_kwargs))
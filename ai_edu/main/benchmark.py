@@ -0,0 +1,457 @@
+"""
+性能基准脚本，用法：
+    python -m main.benchmark <name> [参数...]
+不带参数时列出所有可用基准。
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict
+
+from docx import Document
+
+from main.docx_utils import iter_block_items
+from main.rasterize import RASTER_WORKERS, rasterize_many
+
+
+def _timeit(fn: Callable, repeat: int = 3) -> float:
+    """重复执行 fn，返回最短耗时（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+# ---------- user-001：文档 body 遍历 ----------
+def _legacy_document_elements(doc):
+    """旧版 get_document_elements：对每个 body 元素线性查找对应的段落/表格对象"""
+    elements = []
+    for element in doc.element.body:
+        if element.tag.endswith('}p'):
+            for para in doc.paragraphs:
+                if para._element == element:
+                    elements.append(('paragraph', para))
+                    break
+        elif element.tag.endswith('}tbl'):
+            for table in doc.tables:
+                if table._element == element:
+                    elements.append(('table', table))
+                    break
+    return elements
+
+
+def _make_synthetic_doc(n_paragraphs: int, table_every: int = 20):
+    """构造含 n 个段落、每 table_every 段插入一个表格的测试文档"""
+    doc = Document()
+    for i in range(n_paragraphs):
+        doc.add_paragraph(f"{i // 5 + 1}. 已知二次函数 y=x²+{i}x+1，求其顶点坐标。")
+        if table_every and i % table_every == table_every - 1:
+            table = doc.add_table(rows=2, cols=2)
+            table.cell(0, 0).text = "x"
+            table.cell(0, 1).text = str(i)
+    return doc
+
+
+def bench_body_walker(*sizes: str):
+    """对比旧版 O(N²) 查找与 iter_block_items 的遍历耗时"""
+    sizes = [int(s) for s in sizes] or [250, 500, 1000, 2000, 4000]
+    print(f"{'段落数':>8} {'旧版(s)':>10} {'新版(s)':>10} {'加速比':>8}")
+    for n in sizes:
+        doc = _make_synthetic_doc(n)
+        legacy = _timeit(lambda: _legacy_document_elements(doc))
+        walker = _timeit(lambda: list(iter_block_items(doc)))
+        print(f"{n:>8} {legacy:>10.4f} {walker:>10.4f} {legacy / walker:>7.1f}x")
+
+
+# ---------- user-004：WMF/EMF 栅格化 ----------
+def bench_rasterize(src_dir: str, workers: str = str(RASTER_WORKERS)):
+    """对比逐张启动 magick 子进程与 rasterize_many 线程池的总耗时"""
+    sources = [os.path.join(src_dir, f) for f in sorted(os.listdir(src_dir))
+               if f.lower().endswith((".wmf", ".emf"))]
+    if not sources:
+        print(f"{src_dir} 中没有 WMF/EMF 文件")
+        return
+    with tempfile.TemporaryDirectory() as out:
+        def _serial():
+            for i, src in enumerate(sources):
+                subprocess.run(["magick", "convert", src, os.path.join(out, f"s{i}.png")],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        def _pooled():
+            rasterize_many([(src, os.path.join(out, f"p{i}.png")) for i, src in enumerate(sources)],
+                           workers=int(workers))
+
+        serial = _timeit(_serial, repeat=1)
+        pooled = _timeit(_pooled, repeat=1)
+    print(f"{len(sources)} 张图片: 逐张子进程 {serial:.2f}s, 线程池(workers={workers}) {pooled:.2f}s, "
+          f"加速 {serial / pooled:.1f}x")
+
+
+# ---------- user-008：model.py 导入耗时 ----------
+_IMPORT_PROBE = """
+import sys, time
+t0 = time.perf_counter()
+import main.model
+cost = time.perf_counter() - t0
+heavy = [m for m in ("torch", "transformers", "PIL") if m in sys.modules]
+print(f"{cost:.4f} {','.join(heavy)}")
+"""
+
+
+def bench_import(limit: str = "0.5"):
+    """在全新解释器中测量 import main.model 的耗时，超过 limit 秒或导入了重型依赖则退出码为 1"""
+    ai_edu_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, "-c", _IMPORT_PROBE], cwd=ai_edu_root,
+                         capture_output=True, text=True, check=True).stdout.split()
+    cost, heavy = float(out[0]), out[1] if len(out) > 1 else ""
+    print(f"import main.model: {cost * 1000:.1f} ms, 重型依赖: {heavy or '无'}")
+    if cost > float(limit) or heavy:
+        print(f"超出限制（{limit}s，且不应在导入时加载 torch/transformers/PIL）")
+        sys.exit(1)
+
+
+# ---------- user-012：异步打标签执行器 ----------
+def _start_mock_server(latency: float) -> ThreadingHTTPServer:
+    """本地 OpenAI 兼容 mock：/chat/completions 固定延迟后返回一行 JSON 标签"""
+    body = json.dumps({
+        "id": "mock", "object": "chat.completion", "created": 0, "model": "mock",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": '{"D1_L2":"函数"}'}}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 10, "total_tokens": 110},
+    }).encode("utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_async(n: str = "50", latency: str = "0.2", concurrency: str = "16"):
+    """对 mock 服务对比逐题同步请求与 async_runner 并发请求的总耗时"""
+    from openai import OpenAI
+    from main.async_runner import run_tagging
+
+    server = _start_mock_server(float(latency))
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    prompts = [f"题目 {i}" for i in range(int(n))]
+    try:
+        client = OpenAI(api_key="mock", base_url=base_url, max_retries=0)
+        t0 = time.perf_counter()
+        for p in prompts:
+            client.chat.completions.create(model="mock", messages=[{"role": "user", "content": p}])
+        sync_cost = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        results = run_tagging(prompts, lambda tc: None, model="mock", base_url=base_url,
+                              api_key="mock", concurrency=int(concurrency), rpm=None, tpm=None)
+        async_cost = time.perf_counter() - t0
+    finally:
+        server.shutdown()
+    failed = sum(isinstance(r, Exception) for r in results)
+    print(f"{n} 题, 延迟 {latency}s: 同步 {sync_cost:.2f}s, 异步(并发 {concurrency}) {async_cost:.2f}s, "
+          f"加速 {sync_cost / async_cost:.1f}x, 失败 {failed}")
+
+
+# ---------- user-015：上传前图片预处理 ----------
+def bench_image_prep(src_dir: str):
+    """统计目录下图片经 image_prep 处理前后的上传字节数与估算视觉 token 数"""
+    import math
+    from PIL import Image
+    from model.image_prep import IMAGE_PREP, PATCH
+
+    server_max_pixels = 12845056  # Qwen2.5-VL 服务端默认 max_pixels
+    files = [os.path.join(src_dir, f) for f in sorted(os.listdir(src_dir))
+             if f.lower().endswith((".png", ".jpg", ".jpeg", ".bmp", ".gif"))]
+    raw_bytes = raw_tokens = prep_tokens = 0
+    t0 = time.perf_counter()
+    for path in files:
+        with Image.open(path) as img:
+            w, h = img.size
+        scale = min(1.0, math.sqrt(server_max_pixels / (w * h)))
+        raw_tokens += math.ceil(w * scale / PATCH) * math.ceil(h * scale / PATCH)
+        raw_bytes += os.path.getsize(path)
+        prep = IMAGE_PREP.prepare(path)
+        prep_tokens += prep.vision_tokens
+    cost = time.perf_counter() - t0
+    out_bytes = IMAGE_PREP.stats()["bytes_out"]
+    print(f"{len(files)} 张图片, 处理耗时 {cost:.2f}s")
+    print(f"上传字节: {raw_bytes / 1024:.0f}KB -> {out_bytes / 1024:.0f}KB (base64 前)")
+    print(f"估算视觉 token: {raw_tokens} -> {prep_tokens}")
+
+
+# ---------- user-017：提示词 token 数 ----------
+def _script_constant(script: str, name: str) -> str:
+    """从脚本源码中读取字符串常量（这些脚本导入时会连接 API，不能直接 import）"""
+    import ast
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), script)
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and getattr(node.targets[0], "id", None) == name:
+            return ast.literal_eval(node.value)
+    raise KeyError(name)
+
+
+def bench_prompt_tokens(questions_json: str = ""):
+    """对比每道题在 PROMPT_TMPL 全文与紧凑编码下的提示词 token 数（分词器不可用时为估算值）"""
+    from main.prompt_builder import build_prompt, count_tokens, get_tokenizer
+
+    if questions_json:
+        with open(questions_json, encoding="utf-8") as f:
+            blocks = [q.get("content", "") + "".join("\n" + o["text"] for o in q.get("options") or [])
+                      for q in json.load(f)]
+    else:
+        blocks = ["如图，在△ABC中，AB=AC，D是BC的中点，求证：AD⊥BC。[IMG:1_a9791995.png]"] * 10
+    print(f"{len(blocks)} 道题, token 计数: {'Qwen 分词器' if get_tokenizer() else '按字符估算'}")
+    variants = {
+        "test.py PROMPT_TMPL": lambda b: _script_constant("test.py", "PROMPT_TMPL").format(QUESTION_BLOCK=b),
+        "model_process_image.py PROMPT_TMPL":
+            lambda b: _script_constant("model_process_image.py", "PROMPT_TMPL").format(QUESTION_BLOCK=b),
+        "compact（六维度，展开到四级）": lambda b: build_prompt(b),
+        "compact（仅二级，分阶段第一步）": lambda b: build_prompt(b, depth=1),
+    }
+    for name, build in variants.items():
+        counts = [count_tokens(build(b)) for b in blocks]
+        print(f"{name}: 平均 {sum(counts) / len(counts):.0f} tokens/题")
+
+
+# ---------- user-018：分阶段打标签 ----------
+def _question_blocks(questions_json: str, n: int):
+    with open(questions_json, encoding="utf-8") as f:
+        questions = json.load(f)[:n]
+    return [q.get("content", "") + "".join("\n" + o["text"] for o in q.get("options") or [])
+            for q in questions]
+
+
+def bench_staged(questions_json: str, n: str = "50", model: str = "qwen-plus"):
+    """
+    在同一批题目上对比一次性紧凑提示词与 StagedTagger 两步提示词：JSON 解析成功率、得到有效二级标签的维度比例、
+    请求数、接口返回的 token 用量，以及两种方式二级标签的一致率。
+    请求发往 DASHSCOPE_BASE_URL（QWEN_KEY），不带工具调用，temperature=0。
+    """
+    from main.prompt_builder import build_prompt, parse_codes
+    from main.staged_tagger import StagedTagger
+    from main.taxonomy import TAXONOMY
+    from model.transport import get_openai_client
+
+    client = get_openai_client()
+    blocks = _question_blocks(questions_json, int(n))
+    dims = tuple(TAXONOMY)
+
+    def completer(usage: Dict[str, int]):
+        def complete(prompt: str) -> str:
+            resp = client.chat.completions.create(model=model, temperature=0,
+                                                  messages=[{"role": "user", "content": prompt}])
+            usage["calls"] += 1
+            if resp.usage:
+                usage["prompt_tokens"] += resp.usage.prompt_tokens
+                usage["completion_tokens"] += resp.usage.completion_tokens
+            return resp.choices[0].message.content or ""
+        return complete
+
+    results = {}
+    for mode in ("monolithic", "staged"):
+        usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        complete = completer(usage)
+        tagger = StagedTagger(complete, dims, with_tools=False)
+        parsed = 0
+        labels = []
+        for block in blocks:
+            if mode == "monolithic":
+                paths = parse_codes(complete(build_prompt(block, dims, with_tools=False)), dims)
+                ok = paths is not None
+                labels.append({d: (paths or {}).get(d, ())[:1] for d in dims})
+                parsed += ok
+                continue
+            stage1 = complete(tagger.stage1_prompt(block))
+            prompt, paths = tagger.stage2_prompt(block, stage1)
+            ok = parse_codes(stage1, dims) is not None
+            if prompt is not None:
+                ok = parse_codes(complete(prompt), dims) is not None and ok
+            parsed += ok
+            labels.append({d: paths.get(d, ())[:1] for d in dims})
+        valid = sum(1 for l in labels for d in dims if l[d])
+        results[mode] = labels
+        print(f"{mode}: 解析成功 {parsed}/{len(blocks)} ({parsed / len(blocks):.1%}), "
+              f"有效二级标签 {valid}/{len(blocks) * len(dims)} ({valid / (len(blocks) * len(dims)):.1%}), "
+              f"请求 {usage['calls']}, prompt tokens {usage['prompt_tokens']}, "
+              f"completion tokens {usage['completion_tokens']}")
+    same = sum(1 for a, b in zip(results["monolithic"], results["staged"]) for d in dims if a[d] and a[d] == b[d])
+    print(f"二级标签一致: {same}/{len(blocks) * len(dims)}")
+
+
+# ---------- user-020：few-shot 检索 ----------
+def bench_fewshot(pool_json: str = "", k: str = "4", n: str = "200"):
+    """few-shot 示例池的索引构建 / mmap 加载耗时、每题检索耗时，以及全部示例与 top-k 的提示词 token 数"""
+    from main.fewshot_index import FewShotIndex, sample_text
+    from main.prompt_builder import count_tokens
+
+    if pool_json:
+        with open(pool_json, encoding="utf-8") as f:
+            pool = json.load(f)
+    else:
+        stems = ["已知二次函数 y=x^2+bx+c 的图像经过点 ({}, 0)，求解析式。", "如图，在矩形ABCD中，AB={}，求折痕长。[IMG:a.png]",
+                 "某校随机抽取{}名学生调查睡眠时间，绘制统计图。[IMG:b.png]", "计算：√12 - 2sin60° + ({} - π)^0。"]
+        pool = [{"content": stems[i % len(stems)].format(i), "label": {"L1": "数与代数"}} for i in range(500)]
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        FewShotIndex(pool, os.path.join(tmp, "fs"))
+        build = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        index = FewShotIndex(pool, os.path.join(tmp, "fs"))
+        load = time.perf_counter() - t0
+        queries = [pool[i % len(pool)] for i in range(int(n))]
+        chosen = [index.select(q, int(k), 10 ** 9, 10 ** 9) for q in queries]
+        stats = index.stats()
+        del index  # Windows 下 mmap 未释放时无法删除临时目录
+    all_tokens = sum(count_tokens(sample_text(s)) for s in pool)
+    top_tokens = sum(count_tokens(sample_text(s)) for c in chosen for s in c) / len(chosen)
+    print(f"示例池 {len(pool)} 个: 构建 {build * 1000:.1f} ms, mmap 加载 {load * 1000:.1f} ms")
+    print(f"检索 {stats['lookups']} 次: 平均 {stats['avg_lookup_ms']} ms/题")
+    print(f"示例 token 数: 全部 {all_tokens}, top-{k} 平均 {top_tokens:.0f}")
+
+
+def bench_prefill(questions_json: str, n: str = "50"):
+    """
+    在本地 Qwen 模型上端到端对比 static / dynamic few-shot（前缀缓存模式）：
+    共享前缀 token 数与 prefill 耗时、每题需 prefill 的后缀 token 数、逐题推理耗时；
+    题目带 label.L1 时同时统计 L1 准确率。需要 GPU 和 main.model.MODEL_PATH 的模型权重。
+    """
+    import main.model as m
+    from main.qwen_prefix import PrefixCache
+
+    with open(questions_json, encoding="utf-8") as f:
+        questions = json.load(f)[:int(n)]
+    processor, model = m.get_model()
+    original = m.FEWSHOT_MODE
+    try:
+        for mode in ("static", "dynamic"):
+            m.FEWSHOT_MODE = mode
+            prefix_text, prefix_images = m.build_shot_prefix()
+            t0 = time.perf_counter()
+            cache = PrefixCache(processor, model, prefix_text, prefix_images)
+            prefix_cost = time.perf_counter() - t0
+
+            suffixes = [m.build_question_suffix(q) for q in questions]
+            suffix_tokens = sum(processor(text=text, images=images or None, return_tensors="pt")["input_ids"].shape[1]
+                                for text, images in suffixes)
+            correct = labeled = 0
+            t0 = time.perf_counter()
+            for q, (text, images) in zip(questions, suffixes):
+                raw = cache.generate(text, images, max_new_tokens=m.MAX_NEW_TOKENS)
+                gold = (q.get("label") or {}).get("L1")
+                if gold:
+                    labeled += 1
+                    correct += m.parse_reply(raw).get("L1") == gold
+            cost = time.perf_counter() - t0
+            accuracy = f", L1 准确率 {correct}/{labeled} ({correct / labeled:.1%})" if labeled else ""
+            print(f"{mode}: 前缀 {cache.length} tokens（prefill {prefix_cost:.2f}s）, "
+                  f"后缀平均 {suffix_tokens / len(questions):.0f} tokens/题, "
+                  f"逐题推理 {cost / len(questions) * 1000:.0f} ms/题, 总计 {prefix_cost + cost:.1f}s{accuracy}")
+            del cache
+    finally:
+        m.FEWSHOT_MODE = original
+
+
+# ---------- user-021：题目片段分类 ----------
+def _legacy_classify(seg: str):
+    """旧版 extract_doc_content 中对单个片段的逐个正则匹配，返回与 SegmentToken 相同的字段"""
+    m_q = re.match(r'^(\d+)\.', seg)
+    m_sub_q = re.match(r'[\(（](\d+)[\)）]', seg)
+    answer_patterns = [r'^【答案】', r'^【解析】', r'^【解答】', r'^答案[:：]', r'^解析[:：]', r'^解答[:：]']
+    sub_answer_patterns = [
+        r'^\(\s*(\d+)\s*\).*?【答案】', r'^\(\s*(\d+)\s*\).*?【解析】', r'^\(\s*(\d+)\s*\).*?【解答】',
+        r'^\(\s*(\d+)\s*\).*?答案', r'^\(\s*(\d+)\s*\).*?解析',
+        r'^(\d+)\..*?【答案】', r'^(\d+)\..*?【解析】', r'^(\d+)\..*?【解答】',
+    ]
+    sub_answer = None
+    for pattern in sub_answer_patterns:
+        m = re.search(pattern, seg)
+        if m:
+            sub_answer = int(m.group(1))
+            break
+    return (int(m_q.group(1)) if m_q else None, int(m_sub_q.group(1)) if m_sub_q else None, sub_answer,
+            any(re.search(pattern, seg) for pattern in answer_patterns),
+            len(seg) < 10 and ('答案' in seg or '解析' in seg))
+
+
+def _answer_key_lines(n_questions: int):
+    """构造答案卷风格的段落文本：题号、小题、选项、【答案】【解析】、解答过程"""
+    lines = []
+    for i in range(1, n_questions + 1):
+        lines.append(f"{i}.（2023·泰州）如图，在△ABC中，AB=AC，点D在BC上，(1)求证：AD⊥BC；(2)若BC=8，求AD的长。")
+        lines.extend(f"{o}.{o}选项内容 x={i}" for o in "ABCD")
+        lines.append("【答案】(1)见解析；(2)3")
+        lines.append(f"【解析】本题考查等腰三角形的性质，第{i}题。")
+        lines.append("(1)证明：∵AB=AC，D是BC的中点，∴AD⊥BC。【解答】略")
+        lines.append("（2）解：由勾股定理得 AD=√(AB²-BD²)=3。")
+        lines.append(f"{i}.【答案】C")
+        lines.append("答案：略")
+        lines.append("故答案为：3。")
+    return lines
+
+
+def bench_segments(source: str = "2000"):
+    """对比旧版逐个正则与 segment_classifier 的片段分类耗时，并校验两者结果一致；source 为 .docx 路径或题目数"""
+    from main.segment_classifier import SPLIT_RE, classify_segment
+
+    if source.endswith(".docx"):
+        lines = [p.text.strip() for p in Document(source).paragraphs]
+    else:
+        lines = _answer_key_lines(int(source))
+    segs = [seg.strip() for line in lines for seg in SPLIT_RE.split(line) if seg.strip()]
+
+    mismatched = [s for s in segs if tuple(classify_segment(s)) != _legacy_classify(s)]
+    legacy = _timeit(lambda: [_legacy_classify(s) for s in segs])
+    compiled = _timeit(lambda: [classify_segment(s) for s in segs])
+    kinds = {}
+    for s in segs:
+        kind = classify_segment(s).kind
+        kinds[kind] = kinds.get(kind, 0) + 1
+    print(f"{len(lines)} 段, {len(segs)} 个片段: {kinds}")
+    print(f"旧版逐个正则: {legacy * 1000:.1f} ms, segment_classifier: {compiled * 1000:.1f} ms, "
+          f"加速 {legacy / compiled:.1f}x")
+    if mismatched:
+        print(f"分类结果不一致 {len(mismatched)} 个，例如: {mismatched[:3]}")
+        sys.exit(1)
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    "body_walker": bench_body_walker,
+    "rasterize": bench_rasterize,
+    "import": bench_import,
+    "async": bench_async,
+    "image_prep": bench_image_prep,
+    "prompt_tokens": bench_prompt_tokens,
+    "staged": bench_staged,
+    "fewshot": bench_fewshot,
+    "prefill": bench_prefill,
+    "segments": bench_segments,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print("可用基准: " + ", ".join(BENCHMARKS))
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](*sys.argv[2:])
@@ -0,0 +1,70 @@
+"""
+追加写的 JSONL 断点日志：每标注完一道题追加一行 {"id": ..., "label": {...}} 并 fsync，
+重启时回放日志恢复已完成的结果，最后由 compact 一次性生成完整 JSON。
+"""
+import json
+import os
+import threading
+from typing import Dict, List
+
+
+class CheckpointLog:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._fh = None
+
+    def replay(self) -> Dict[str, dict]:
+        """读取已有日志，返回 {str(id): label}；同一 id 以最后一条为准，末尾残缺行忽略"""
+        done: Dict[str, dict] = {}
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 上次中断时写了一半的行
+                done[str(rec["id"])] = rec["label"]
+        return done
+
+    def append(self, qid, label: dict):
+        line = json.dumps({"id": qid, "label": label}, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._fh is None:
+                self._fh = open(self.path, "a", encoding="utf-8")
+                # 上次中断留下的残缺行没有换行符，先补一个，避免和新记录粘在一起
+                if self._fh.tell() > 0:
+                    with open(self.path, "rb") as f:
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b"\n":
+                            self._fh.write("\n")
+            self._fh.write(line)
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+def apply_checkpoint(questions: List[Dict], done: Dict[str, dict]) -> int:
+    """把回放得到的标签写回题目列表，返回恢复的题目数"""
+    restored = 0
+    for q in questions:
+        label = done.get(str(q.get("id")))
+        if label is not None:
+            q["label"] = label
+            restored += 1
+    return restored
+
+
+def compact(questions: List[Dict], out_path: str):
+    """生成最终 JSON：先写临时文件再原子替换，避免中断时留下半个文件"""
+    tmp = out_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(questions, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, out_path)
@@ -0,0 +1,70 @@
+import json
+from typing import Dict, List
+
+from main.taxonomy import Field
+
+
+class LabelGrammar:
+    """
+    标签 JSON 的约束解码语法。
+    输出固定为 {"k1":"v1","k2":"v2",...}：键名和标点是强制 token，
+    每个值只能从候选标签（可依赖前面已选的值）中选，结束后强制 EOS。
+    生成结果必然是合法 JSON，且所有值都在标签体系内，可直接 json.loads。
+    """
+
+    def __init__(self, tokenizer, fields: List[Field]):
+        self.tokenizer = tokenizer
+        self.fields = fields
+        self.eos_token_id = tokenizer.eos_token_id
+        self._token_cache: Dict[str, List[int]] = {}
+        # 每个值前后的固定片段：fixed[i] 出现在第 i 个值之前，fixed[-1] 为结尾
+        keys = [key for key, _ in fields]
+        texts = ['{"' + keys[0] + '":"'] + ['","' + k + '":"' for k in keys[1:]] + ['"}']
+        self.fixed = [self._encode(t) for t in texts]
+
+    def _encode(self, text: str) -> List[int]:
+        if text not in self._token_cache:
+            self._token_cache[text] = self.tokenizer.encode(text, add_special_tokens=False)
+        return self._token_cache[text]
+
+    def allowed_tokens(self, generated: List[int]) -> List[int]:
+        """根据已生成的 token 回放语法状态，返回下一步允许的 token"""
+        pos = 0
+        values: Dict[str, str] = {}
+        for i, (key, choices) in enumerate(self.fields):
+            for token in self.fixed[i]:
+                if pos == len(generated):
+                    return [token]
+                pos += 1
+
+            candidates = [(v, self._encode(v)) for v in choices(values)]
+            prefix: List[int] = []
+            while True:
+                matching = [(v, t) for v, t in candidates if t[:len(prefix)] == prefix]
+                complete = [v for v, t in matching if len(t) == len(prefix)]
+                nexts = {t[len(prefix)] for v, t in matching if len(t) > len(prefix)}
+                if pos == len(generated):
+                    # 值已完整时也允许进入下一个固定片段（其首 token 以引号开头，不会与标签值冲突）
+                    return list(nexts | ({self.fixed[i + 1][0]} if complete else set()))
+                if complete and generated[pos] not in nexts:
+                    values[key] = complete[0]
+                    break
+                prefix.append(generated[pos])
+                pos += 1
+
+        for token in self.fixed[-1]:
+            if pos == len(generated):
+                return [token]
+            pos += 1
+        return [self.eos_token_id]
+
+    def prefix_allowed_tokens_fn(self, prompt_length: int):
+        """生成 model.generate 使用的 prefix_allowed_tokens_fn（batch 内 prompt 已左侧 padding 对齐）"""
+        def _fn(batch_id, input_ids):
+            return self.allowed_tokens(input_ids[prompt_length:].tolist())
+        return _fn
+
+    @staticmethod
+    def parse(reply: str) -> Dict[str, str]:
+        """约束解码的输出必为合法 JSON，直接解析，无需 safe_json_line 修复"""
+        return json.loads(reply)
@@ -1,13 +1,19 @@
 import re
 import uuid
-import subprocess
-import pathlib
+import time
+from concurrent.futures import ProcessPoolExecutor
 from docx import Document
 import os
 import json
 from docx.oxml.ns import nsmap, qn
 from docx.text.paragraph import Paragraph
+from docx.table import Table
 import win32com.client as win32
+from main.answer_splitter import split_answers
+from main.docx_utils import iter_block_items
+from main.image_store import ImageStore
+from main.parse_cache import ParseCache, document_key
+from main.segment_classifier import EMPTY, OPTION_RE, SPLIT_RE, SUB_MARK_RE, SUB_STRIP_RE, classify_segment
 
 def convert_doc_to_docx(folder):
     """
@@ -45,52 +51,44 @@ def iter_textbox_paragraphs(doc):
         for p in txbx.xpath('.//w:p', namespaces=nsmap):
             yield Paragraph(p, doc)
 
-def save_run_image(image_part, qid):
-    """保存图片并返回文件名"""
-    fmt = image_part.content_type.split("/")[-1]  # png / jpeg / x-wmf
-    
-    # 使用图片内容的哈希值作为唯一标识，避免重复保存
-    import hashlib
-    image_hash = hashlib.md5(image_part.blob).hexdigest()[:8]
-    fname = f"{qid}_{image_hash}.{fmt}"
-    
-    out_dir = pathlib.Path(r"E:\NLP_Model\ai_edu\data\processed_data\images")
-    out_dir.mkdir(exist_ok=True)
-    path = out_dir / fname
-    
-    # 如果文件已存在，直接返回文件名，不重复保存
-    if path.exists():
-        print(f"图片已存在，跳过保存: {fname}")
-        return fname
-    
-    path.write_bytes(image_part.blob)
-    
-    # 如果是 WMF，再转 PNG 备份
-    if fmt == "x-wmf":
-        png = out_dir / f"{qid}_{image_hash}.png"
-        try:
-            subprocess.run(
-                ["magick", "convert", str(path), str(png)],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                check=True,
-            )
-            print(f"已将 WMF 转换为 PNG: {png}")
-            os.remove(path)
-            print(f"已删除原始 WMF 文件: {path}")
-            return png.name
-        except subprocess.CalledProcessError as e:
-            print(f"WMF 转换失败: {e}")
-            return fname
-    
-    print("-------------------已运行save_run_image方法---------------------")
-    return fname
+class ParseContext:
+    """
+    单次文档解析的上下文，替代原先的模块级全局状态，
+    使多个文档可以在不同进程中并行解析。
+    """
+
+    def __init__(self, store=None):
+        self.store = store or ImageStore()
+        self.rid_images = {}  # rId -> 图片相对路径（非图片 rId 记为 None）
+
+
+class QuestionRegistry:
+    """
+    解析过程中的题目登记表，按题号和 (题号, 小题号) 建字典索引，
+    查找已有题目 / 小题都是 O(1)。questions 按首次出现的顺序保存，同一题号只登记一次。
+    """
+
+    def __init__(self):
+        self.questions = []
+        self._by_number = {}  # 题号 -> 题目
+        self._subs = {}       # (题号, 小题号) -> 小题
+
+    def get(self, number):
+        return self._by_number.get(number)
 
-# 在文件顶部添加全局变量
-global_processed_rids = set()
+    def add(self, question):
+        self._by_number[question["number"]] = question
+        self.questions.append(question)
 
-def extract_images_from_runs(paragraph, doc, qid):
-    global global_processed_rids
+    def get_sub(self, question, sub_number):
+        return self._subs.get((question["number"], sub_number))
+
+    def add_sub(self, question, sub_question):
+        question["sub_questions"].append(sub_question)
+        self._subs[(question["number"], sub_question["number"])] = sub_question
+
+
+def extract_images_from_runs(paragraph, doc, ctx):
     segment = ""
     
     for run in paragraph.runs:
@@ -102,30 +100,19 @@ def extract_images_from_runs(paragraph, doc, qid):
         # 查找所有图片引用
         rids = re.findall(r'(?:r:id|r:embed)="(rId\d+)"', xml)
         for rid in rids:
-            # 使用全局集合检查是否已处理过此rId
-            if rid in global_processed_rids:
-                # 即使已处理，也要添加占位符
-                try:
-                    if rid in doc.part.related_parts:
-                        part = doc.part.related_parts[rid]
-                        if part.content_type.startswith("image/"):
-                            # 生成相同的文件名但不重复保存
-                            import hashlib
-                            image_hash = hashlib.md5(part.blob).hexdigest()[:8]
-                            fmt = part.content_type.split("/")[-1]
-                            fname = f"{qid}_{image_hash}.png" if fmt == "x-wmf" else f"{qid}_{image_hash}.{fmt}"
-                            segment += f"[IMG:{fname}]"
-                except:
-                    pass
+            # 同一文档中重复引用的 rId 直接复用已保存的路径，不再重新哈希
+            if rid in ctx.rid_images:
+                if ctx.rid_images[rid]:
+                    segment += f"[IMG:{ctx.rid_images[rid]}]"
                 continue
-                
-            global_processed_rids.add(rid)
-            
+
+            ctx.rid_images[rid] = None
             try:
                 if rid in doc.part.related_parts:
                     part = doc.part.related_parts[rid]
                     if part.content_type.startswith("image/"):
-                        fname = save_run_image(part, qid)
+                        fname = ctx.store.put(part.blob, part.content_type)
+                        ctx.rid_images[rid] = fname
                         segment += f"[IMG:{fname}]"
                         print(f"处理图片: {rid} -> {fname}")
             except Exception as e:
@@ -133,6 +120,17 @@ def extract_images_from_runs(paragraph, doc, qid):
     
     return segment
 
+def _replace_image_refs(obj, mapping):
+    """递归改写题目结构中的 [IMG:...] 占位符，mapping 为 {旧路径: 新路径}"""
+    items = obj.items() if isinstance(obj, dict) else enumerate(obj)
+    for key, value in items:
+        if isinstance(value, str):
+            for old, new in mapping.items():
+                value = value.replace(f"[IMG:{old}]", f"[IMG:{new}]")
+            obj[key] = value
+        elif isinstance(value, (dict, list)):
+            _replace_image_refs(value, mapping)
+
 def parse_filename_metadata(filename):
     """从文件名中提取年份、省份、城市、学科、考试类型"""
     # 默认值，如果无法解析
@@ -205,62 +203,54 @@ def create_question_id(metadata, question_number, sub_question_number=None):
 
 def extract_doc_content(doc_path):
     """提取文档中的文本、图片及结构化题目，并在content中按原位置插入图片占位符"""
-    global global_processed_rids
-    global_processed_rids = set()
     filename = os.path.basename(doc_path)
     metadata = parse_filename_metadata(filename)
     print(f"解析文件元数据: {metadata}")
-    
-    doc = Document(doc_path)
-    questions = []
+    ctx = ParseContext()
+    try:
+        questions = _collect_questions(Document(doc_path), ctx, metadata)
+
+        # 批量栅格化本文档中的 WMF/EMF，转换失败的图片占位符退回原始格式
+        failed = ctx.store.flush_rasters()
+        if failed:
+            _replace_image_refs(questions, failed)
+    finally:
+        # 解析中途出错时也要关闭图片索引连接
+        ctx.store.close()
+    return questions, metadata
+
+def _collect_questions(doc, ctx, metadata):
+    """按文档顺序遍历段落和表格，返回结构化题目列表"""
+    registry = QuestionRegistry()
     current = None
     collecting = False
     in_answer_section = False
     current_answer_sub_number = None  # 新增：当前答案对应的小题号
+    m_q = m_sub_q = None  # 题号 / 小题号；空片段沿用上一个片段的结果
 
-    # 获取文档中所有元素的顺序（段落和表格）
-    def get_document_elements():
-        """获取文档中段落和表格的顺序"""
-        elements = []
-        for element in doc.element.body:
-            if element.tag.endswith('}p'):  # 段落
-                # 找到对应的段落对象
-                for para in doc.paragraphs:
-                    if para._element == element:
-                        elements.append(('paragraph', para))
-                        break
-            elif element.tag.endswith('}tbl'):  # 表格
-                # 找到对应的表格对象
-                for table in doc.tables:
-                    if table._element == element:
-                        elements.append(('table', table))
-                        break
-        return elements
-
-    for element_type, element in get_document_elements():
-        if element_type == 'paragraph':
+    # 按文档顺序单次遍历段落和表格
+    for element in iter_block_items(doc):
+        if isinstance(element, Paragraph):
             para = element
             raw = para.text.strip()
-            splits = re.split(r'(?=[（(][一二三四五六七八九十1234567890]+[）)])', raw)
+            splits = SPLIT_RE.split(raw)
+            segment = None  # 本段的 run 内容（含图片占位符），首次用到时提取，各片段共用
             
             for seg in splits:
                 seg = seg.strip()
+                tok = EMPTY
                 if seg:
-                    # 检查本段是否新题号
-                    m_q = re.match(r'^(\d+)\.', seg)
-                    # 检查是否是子题目
-                    m_sub_q = re.match(r'[\(（](\d+)[\)）]', seg)
+                    # 一次分类得到题号、小题号、答案标记
+                    tok = classify_segment(seg)
+                    m_q = tok.question
+                    m_sub_q = tok.sub_question
 
-                if m_q:
-                    qid = m_q.group(1)
+                if m_q is not None:
+                    qid = m_q
                     question_id = create_question_id(metadata, int(qid))
                     
                     # 修改：检查是否已存在相同题号的题目
-                    existing_id = None
-                    for q in questions:
-                        if q["number"] == int(qid):
-                            existing_id = q
-                            break
+                    existing_id = registry.get(int(qid))
                     
                     if existing_id:
                         current = existing_id
@@ -270,12 +260,6 @@ def extract_doc_content(doc_path):
                         in_answer_section = False
                         current_answer_sub_number = None
                         
-                        # 关闭上一个题
-                        if current:
-                            questions.append(current)
-                        qid = m_q.group(1)                     # 对应正则中 第一个括号 (\d+) 捕获的内容
-                        question_id = create_question_id(metadata, int(qid))
-                        
                         # 新题初始化
                         current = {
                             "id": question_id,
@@ -284,13 +268,13 @@ def extract_doc_content(doc_path):
                             "options": [],
                             "answers": ""  # 添加答案字段
                         }
-                        questions.append(current)
+                        registry.add(current)
 
                     collecting = True
                 
                 # 处理子题目的情况
-                elif m_sub_q and current and collecting:
-                    sub_qid = m_sub_q.group(1)
+                elif m_sub_q is not None and current and collecting:
+                    sub_qid = m_sub_q
                     question_id = create_question_id(metadata, current["number"], int(sub_qid))
                     
                     # 先保存当前主题目
@@ -304,12 +288,7 @@ def extract_doc_content(doc_path):
                         current["options"] = []
                         current["sub_questions"] = []
                     
-                    existing_sub = None
-                    if "sub_questions" in current:
-                        for sub_q in current["sub_questions"]:
-                            if sub_q["number"] == int(sub_qid):
-                                existing_sub = sub_q
-                                break
+                    existing_sub = registry.get_sub(current, int(sub_qid))
 
                     if not existing_sub:
                         # 添加新的子题目
@@ -320,65 +299,39 @@ def extract_doc_content(doc_path):
                             "options": [],
                             "answers": ""  # 为子题目也添加答案字段
                         }
-                        current["sub_questions"].append(sub_question)
+                        registry.add_sub(current, sub_question)
                 
                 # 检查是否进入答案解析部分
                 if current and collecting:
-                    # 识别答案解析的关键词和格式
-                    answer_patterns = [
-                        r'^【答案】',
-                        r'^【解析】',
-                        r'^【解答】',
-                        r'^答案[:：]',
-                        r'^解析[:：]',
-                        r'^解答[:：]'
-                    ]
-                    
-                    # 检查是否包含小题号的答案格式
-                    sub_answer_patterns = [
-                        r'^\(\s*(\d+)\s*\).*?【答案】',
-                        r'^\(\s*(\d+)\s*\).*?【解析】',
-                        r'^\(\s*(\d+)\s*\).*?【解答】',
-                        r'^\(\s*(\d+)\s*\).*?答案',
-                        r'^\(\s*(\d+)\s*\).*?解析',
-                        r'^(\d+)\..*?【答案】',
-                        r'^(\d+)\..*?【解析】',
-                        r'^(\d+)\..*?【解答】'
-                    ]
-                    
+                    # 答案解析的关键词和格式见 main.segment_classifier
                     # 检查是否是带小题号的答案
-                    sub_answer_match = None
-                    for pattern in sub_answer_patterns:
-                        sub_answer_match = re.search(pattern, seg)
-                        if sub_answer_match:
-                            current_answer_sub_number = int(sub_answer_match.group(1)) # 提取小题号并转为整数
-                            in_answer_section = True
-                            break
+                    if tok.sub_answer is not None:
+                        current_answer_sub_number = tok.sub_answer
+                        in_answer_section = True
                     
                     # 检查是否是普通的答案开始
-                    if not sub_answer_match:
-                        is_answer_line = any(re.search(pattern, seg) for pattern in answer_patterns) # 任意一个返回非空值，设为True
-                        if is_answer_line:
-                            in_answer_section = True
-                            current_answer_sub_number = None  # 重置小题号
-                        elif not in_answer_section and len(seg) < 10 and ('答案' in seg or '解析' in seg):
-                            # 单独的"答案"或"解析"标题行
-                            in_answer_section = True
-                            current_answer_sub_number = None
-                            continue  # 跳过标题行本身
+                    elif tok.answer_start:
+                        in_answer_section = True
+                        current_answer_sub_number = None  # 重置小题号
+                    elif not in_answer_section and tok.answer_title:
+                        # 单独的"答案"或"解析"标题行
+                        in_answer_section = True
+                        current_answer_sub_number = None
+                        continue  # 跳过标题行本身
                 
                 if not collecting or current is None:
                     continue
 
                 # 按 run 遍历，构造本段 content 片段
-                segment = extract_images_from_runs(para, doc, current["id"])
+                if segment is None:
+                    segment = extract_images_from_runs(para, doc, ctx)
 
                 # 去除纯空白段
                 if not segment.strip():
                     continue
 
                 # 判断是否为选项行
-                m_opt = re.match(r'^[A-D]\.', segment.strip())
+                m_opt = OPTION_RE.match(segment.strip())
 
                 # 确定应该添加内容到主题目还是子题目
                 target = current
@@ -400,22 +353,12 @@ def extract_doc_content(doc_path):
                 else:
                     # 普通题干内容 - 关键修改：根据内容判断归属
                     # 检查内容是否包含小题标记
-                    sub_content_match = re.search(r'[（(](\d+)[）)]', segment)
+                    sub_content_match = SUB_MARK_RE.search(segment)
                     
                     if sub_content_match:
                         sub_num = int(sub_content_match.group(1))
-                        # 查找对应编号的子题目
-                        target_found = False
-                        if "sub_questions" in current:
-                            for sub_q in current["sub_questions"]:
-                                if sub_q["number"] == sub_num:
-                                    target = sub_q
-                                    target_found = True
-                                    break
-                        
-                        # 如果没找到对应的子题目，添加到主题目
-                        if not target_found:
-                            target = current
+                        # 查找对应编号的子题目，没找到时添加到主题目
+                        target = registry.get_sub(current, sub_num) or current
                     else:
                         # 没有小题标记的内容
                         # 如果主题目内容为空，添加到主题目；否则添加到最后一个子题目
@@ -429,7 +372,7 @@ def extract_doc_content(doc_path):
                     # 过滤内容：确保主题目不包含小题内容，小题不包含其他小题内容
                     if target == current:
                         # 主题目：移除所有小题标记的内容
-                        clean_segment = re.sub(r'[（(]\d+[）)][^（(]*', '', segment).strip()
+                        clean_segment = SUB_STRIP_RE.sub('', segment).strip()
                         if clean_segment:
                             if target["content"]:
                                 target["content"] += "\n" + clean_segment
@@ -453,7 +396,7 @@ def extract_doc_content(doc_path):
                             else:
                                 target["content"] = clean_content
             
-        elif element_type == 'table':
+        elif isinstance(element, Table):
             table = element
             if collecting and current is not None:
                 # 提取表格内容并格式化
@@ -464,7 +407,7 @@ def extract_doc_content(doc_path):
                         cell_text = ""
                         # 处理单元格中的段落和图片
                         for cell_para in cell.paragraphs:
-                            cell_segment = extract_images_from_runs(cell_para, doc, current["id"])
+                            cell_segment = extract_images_from_runs(cell_para, doc, ctx)
                             if cell_segment.strip():
                                 cell_text += cell_segment.strip() + " "
                         row_cells.append(cell_text.strip())
@@ -494,13 +437,8 @@ def extract_doc_content(doc_path):
     # if current:
     #     questions.append(current)
 
-    unique_questions = []
-    seen_numbers = set()
-    for q in questions:
-        if q["number"] not in seen_numbers:
-            unique_questions.append(q)
-            seen_numbers.add(q["number"])
-    return unique_questions, metadata
+    # 登记表中同一题号只有一道题，顺序即首次出现的顺序
+    return registry.questions
 
 def prepare_final_questions(questions):
     """准备最终的问题列表，将大题answers分配到对应小题中"""
@@ -522,71 +460,11 @@ def prepare_final_questions(questions):
                     "answers": ""
                 })
             
-            # 从大题answers中提取各小题的答案
-            if all_answers_content:
-                # 1. 优先处理【小问X详解】格式
-                for sub_q in processed_sub_questions:
-                    sub_number = sub_q["number"]
-                    detail_pattern = rf'【小问{sub_number}详解】(.*?)(?=【小问\d+详解】|【点睛】|$)'
-                    detail_match = re.search(detail_pattern, all_answers_content, re.DOTALL)
-                    if detail_match:
-                        sub_q["answers"] = detail_match.group(1).strip()
-                        continue
-                
-                # 2. 如果没有【小问X详解】格式，则综合提取各部分内容
-                if not any(sub_q["answers"] for sub_q in processed_sub_questions):
-                    for sub_q in processed_sub_questions:
-                        sub_number = sub_q["number"]
-                        answer_parts = []
-                        
-                        # 提取【答案】部分对应的小题内容
-                        answer_section = re.search(r'【答案】(.*?)(?=【解析】|【分析】|【详解】|【点睛】|$)', all_answers_content, re.DOTALL)
-                        if answer_section:
-                            answer_content = answer_section.group(1)
-                            pattern = rf'[（(]{sub_number}[）)](.*?)(?=[（(]\d+[）)]|$)'
-                            match = re.search(pattern, answer_content, re.DOTALL)
-                            if match:
-                                sub_answer = match.group(1).strip().rstrip('；;')
-                                # 清理可能的重复标记
-                                sub_answer = re.sub(r'【答案】.*?$', '', sub_answer, flags=re.DOTALL).strip()
-                                if sub_answer:
-                                    answer_parts.append(f"【答案】（{sub_number}）{sub_answer}")
-                        
-                        # 提取【分析】部分对应的小题内容
-                        analysis_section = re.search(r'【分析】(.*?)(?=【详解】|【点睛】|$)', all_answers_content, re.DOTALL)
-                        if analysis_section:
-                            analysis_content = analysis_section.group(1)
-                            pattern = rf'[（(]{sub_number}[）)](.*?)(?=[（(]\d+[）)]|$)'
-                            match = re.search(pattern, analysis_content, re.DOTALL)
-                            if match:
-                                sub_analysis = match.group(1).strip().rstrip('；;')
-                                # 清理可能的重复标记
-                                sub_analysis = re.sub(r'【分析】.*?$', '', sub_analysis, flags=re.DOTALL).strip()
-                                if sub_analysis:
-                                    answer_parts.append(f"【分析】（{sub_number}）{sub_analysis}")
-                        
-                        # 提取【详解】部分对应的小题内容
-                        detail_section = re.search(r'【详解】(.*?)(?=【点睛】|$)', all_answers_content, re.DOTALL)
-                        if detail_section:
-                            detail_content = detail_section.group(1)
-                            pattern = rf'[（(]{sub_number}[）)](.*?)(?=[（(]\d+[）)]|$)'
-                            match = re.search(pattern, detail_content, re.DOTALL)
-                            if match:
-                                sub_detail = match.group(1).strip().rstrip('；;')
-                                # 清理可能的重复标记和多余内容
-                                sub_detail = re.sub(r'【详解】.*?$', '', sub_detail, flags=re.DOTALL).strip()
-                                if sub_detail:
-                                    answer_parts.append(f"【详解】（{sub_number}）{sub_detail}")
-                        
-                        # 组合所有部分
-                        if answer_parts:
-                            sub_q["answers"] = "\n".join(answer_parts)
-            
-            # 提取【点睛】部分作为大题答案
-            main_answer = ""
-            point_match = re.search(r'【点睛】(.*?)$', all_answers_content, re.DOTALL)
-            if point_match:
-                main_answer = point_match.group(0).strip()
+            # 从大题answers中提取各小题的答案，【点睛】部分作为大题答案
+            sub_answers, main_answer = split_answers(
+                all_answers_content, [sub_q["number"] for sub_q in processed_sub_questions])
+            for sub_q in processed_sub_questions:
+                sub_q["answers"] = sub_answers[sub_q["number"]]
             
             # 组装最终题目
             sorted_sub_questions = sorted(processed_sub_questions, key=lambda x: x["number"])
@@ -612,37 +490,108 @@ def prepare_final_questions(questions):
     return final_questions
 
 
-def process_document(doc_path, output_dir):
-    """处理单个文档并保存结果"""
+USE_PARSE_CACHE = True  # 内容未变化的 .docx 直接使用 main.parse_cache 中的解析结果
+
+def output_path_for(doc_path, output_dir):
+    """按文件名中的元数据确定输出 JSON 路径（与 process_document 一致，main.pipeline 用它预先判断目标）"""
+    metadata = parse_filename_metadata(os.path.basename(doc_path))
+    output_filename = f"{metadata['year']}-{metadata['province']}-{metadata['city']}-{metadata['subject']}-{metadata['exam_type']}.json"
+    return os.path.join(output_dir, output_filename)
+
+def output_paths_for(doc_paths, output_dir):
+    """
+    批量确定输出路径，返回 {doc_path: output_path}。
+    元数据相同的文档（如城市不在列表中，都归为“未知城市”）会落到同一路径，
+    按文件名排序后第一个保留原名，其余依次加 _2、_3 后缀，避免互相覆盖
+    """
+    paths, taken = {}, set()
+    for doc_path in sorted(doc_paths, key=os.path.basename):
+        base = output_path_for(doc_path, output_dir)
+        path, n = base, 1
+        while path in taken:
+            n += 1
+            path = f"{os.path.splitext(base)[0]}_{n}.json"
+        if path != base:
+            print(f"警告: {os.path.basename(doc_path)} 与其他文档的输出路径相同，改为 {os.path.basename(path)}")
+        taken.add(path)
+        paths[doc_path] = path
+    return paths
+
+def process_document(doc_path, output_dir, use_cache=None, refresh=False, output_path=None):
+    """
+    处理单个文档并保存结果
+    use_cache 为 None 时按 USE_PARSE_CACHE；refresh=True 时忽略已有缓存重新解析，并用新结果更新缓存；
+    output_path 为 None 时按 output_path_for 命名（批量处理时由 output_paths_for 给出不冲突的路径）
+    """
     print(f"正在处理文档: {doc_path}")
-    questions, metadata = extract_doc_content(doc_path)
-    
-    # 准备最终的问题列表（扁平化子问题）
-    final_questions = prepare_final_questions(questions)
+    if use_cache is None:
+        use_cache = USE_PARSE_CACHE
+    cache = ParseCache() if use_cache else None
+    try:
+        key = document_key(doc_path) if cache else None
+        cached = cache.get(key) if cache and not refresh else None
+        if cached:
+            print(f"命中解析缓存，跳过解析: {os.path.basename(doc_path)}")
+            metadata, final_questions = cached["metadata"], cached["final_questions"]
+        else:
+            questions, metadata = extract_doc_content(doc_path)
+            
+            # 准备最终的问题列表（扁平化子问题）
+            final_questions = prepare_final_questions(questions)
+            if cache:
+                cache.put(key, os.path.basename(doc_path), metadata, final_questions)
+    finally:
+        if cache:
+            cache.close()
     
     # 创建输出目录
     os.makedirs(output_dir, exist_ok=True)
     
-    # 保存JSON文件，按照指定格式命名
-    output_filename = f"{metadata['year']}-{metadata['province']}-{metadata['city']}-{metadata['subject']}-{metadata['exam_type']}.json"
-    output_path = os.path.join(output_dir, output_filename)
-    
-    with open(output_path, "w", encoding="utf-8") as f:
+    # 保存JSON文件，按照指定格式命名；先写临时文件再替换，中断或并发时不会留下半个文件
+    if output_path is None:
+        output_path = output_path_for(doc_path, output_dir)
+    tmp = f"{output_path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
         json.dump(final_questions, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, output_path)
     
     print(f"已保存文件: {output_path}")
     return output_path
 
-def process_documents_in_folder(folder_path, output_dir):
-    """处理文件夹中所有docx文件"""
+def _process_document_timed(doc_path, output_dir, output_path=None):
+    """进程池任务入口：处理单个文档并返回输出路径和耗时"""
+    start = time.perf_counter()
+    output_path = process_document(doc_path, output_dir, output_path=output_path)
+    return output_path, time.perf_counter() - start
+
+def process_documents_in_folder(folder_path, output_dir, workers=1):
+    """
+    处理文件夹中所有docx文件
+    workers > 1 时使用进程池并行解析，每个文档各自写出 JSON，结果与串行一致
+    （输出路径预先由 output_paths_for 分配，不会有两个文档写同一文件）
+    """
+    doc_names = [f for f in os.listdir(folder_path) if f.lower().endswith(".docx")]
+    doc_paths = [os.path.join(folder_path, f) for f in doc_names]
+    targets = output_paths_for(doc_paths, output_dir)
+    output_paths = [targets[p] for p in doc_paths]
+
+    start = time.perf_counter()
+    if workers > 1 and len(doc_paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_process_document_timed, doc_paths,
+                                        [output_dir] * len(doc_paths), output_paths))
+    else:
+        results = [_process_document_timed(p, output_dir, o) for p, o in zip(doc_paths, output_paths)]
+    elapsed = time.perf_counter() - start
+
     processed_files = []
-    
-    for filename in os.listdir(folder_path):
-        if filename.lower().endswith(".docx"):
-            doc_path = os.path.join(folder_path, filename)
-            output_path = process_document(doc_path, output_dir)
-            processed_files.append((filename, output_path))
-    
+    for filename, (output_path, cost) in zip(doc_names, results):
+        print(f"  {filename}: {cost:.2f}s")
+        processed_files.append((filename, output_path))
+
+    if processed_files:
+        print(f"共处理 {len(processed_files)} 个文档，用时 {elapsed:.2f}s，"
+              f"吞吐 {len(processed_files) / elapsed:.2f} 文档/s (workers={workers})")
     return processed_files
 
 if __name__ == "__main__":
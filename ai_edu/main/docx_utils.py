@@ -0,0 +1,20 @@
+from docx.oxml.ns import qn
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+
+_TAG_P = qn("w:p")
+_TAG_TBL = qn("w:tbl")
+
+
+def iter_block_items(doc):
+    """
+    生成器：单次顺序遍历文档 body，按原文顺序 yield Paragraph / Table。
+    直接由 lxml 节点构造对象，不再回到 doc.paragraphs / doc.tables 中逐个比对，
+    整体为 O(N)。
+    """
+    body = doc._body  # Paragraph/Table 的 parent，与 doc.paragraphs 保持一致
+    for child in doc.element.body.iterchildren():
+        if child.tag == _TAG_P:
+            yield Paragraph(child, body)
+        elif child.tag == _TAG_TBL:
+            yield Table(child, body)
@@ -0,0 +1,129 @@
+"""
+few-shot 示例的检索索引：按与待分类题目的相似度为每道题挑选 top-k 示例，代替把全部示例拼进提示词。
+- 每个示例的题干 + 选项规范化后取字符 1/2-gram，哈希到 VECTOR_DIM 维并做 L2 归一化
+- 向量矩阵只在示例池变化时重新计算，保存为 .npy，之后以 mmap_mode="r" 打开，不整体读入内存
+- 每个示例的文本 token 数和图片数一并保存在 .json 元数据中，选择时按 token / 图片预算贪心截断
+一次查询是一次矩阵-向量乘法，千级示例池耗时在毫秒以内。
+"""
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from main.prompt_builder import count_tokens
+from main.question_cache import normalize_text
+
+INDEX_VERSION = "fewshot-v1"
+VECTOR_DIM = 4096
+NGRAMS = (1, 2)
+CANDIDATES_PER_SHOT = 8   # 先按相似度取 k * 该值个候选，再在其中按预算挑选
+
+_IMG_RE = re.compile(r"\[IMG:([^\]]+?)\]")
+
+
+def sample_text(sample: Dict) -> str:
+    """示例 / 题目的题干 + 选项原文（保留 [IMG:...] 占位符，用于统计图片数）"""
+    text = sample.get("content", "") or ""
+    for o in sample.get("options") or []:
+        text += "\n" + (o.get("text", "") if isinstance(o, dict) else str(o))
+    return text
+
+
+def vectorize(text: str) -> np.ndarray:
+    norm = normalize_text(text)
+    vec = np.zeros(VECTOR_DIM, dtype=np.float32)
+    for n in NGRAMS:
+        for i in range(len(norm) - n + 1):
+            h = hashlib.blake2b(norm[i:i + n].encode("utf-8"), digest_size=4).digest()
+            vec[int.from_bytes(h, "little") % VECTOR_DIM] += 1.0
+    norm2 = np.linalg.norm(vec)
+    return vec / norm2 if norm2 else vec
+
+
+def pool_signature(samples: List[Dict]) -> str:
+    h = hashlib.sha256(f"{INDEX_VERSION}:{VECTOR_DIM}:{NGRAMS}".encode("utf-8"))
+    h.update(json.dumps(samples, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+class FewShotIndex:
+    """
+    path 为索引文件前缀，生成 <path>.npy（向量矩阵）和 <path>.json（签名、token 数、图片数）。
+    示例池与已有索引的签名一致时直接 mmap 打开，否则重新构建。
+    """
+
+    def __init__(self, samples: List[Dict], path):
+        self.samples = samples
+        self.npy_path = f"{path}.npy"
+        self.meta_path = f"{path}.json"
+        self.lookups = 0
+        self.lookup_seconds = 0.0
+        signature = pool_signature(samples)
+        meta = self._read_meta()
+        if meta is None or meta["signature"] != signature or not os.path.exists(self.npy_path):
+            meta = self._build(signature)
+        self.tokens: List[int] = meta["tokens"]
+        self.images: List[int] = meta["images"]
+        self.vectors = np.load(self.npy_path, mmap_mode="r")
+
+    def _read_meta(self) -> Optional[dict]:
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _build(self, signature: str) -> dict:
+        print(f"构建 few-shot 索引: {len(self.samples)} 个示例 -> {self.npy_path}")
+        texts = [sample_text(s) for s in self.samples]
+        vectors = np.stack([vectorize(t) for t in texts]) if texts else np.zeros((0, VECTOR_DIM), np.float32)
+        meta = {
+            "signature": signature,
+            "tokens": [count_tokens(_IMG_RE.sub("<img>", t)) for t in texts],
+            "images": [len(_IMG_RE.findall(t)) for t in texts],
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.npy_path)), exist_ok=True)
+        # 先写临时文件再替换，避免中断后留下与签名不符的半个索引
+        with open(self.npy_path + ".tmp", "wb") as f:
+            np.save(f, vectors)
+        os.replace(self.npy_path + ".tmp", self.npy_path)
+        with open(self.meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+        return meta
+
+    def select(self, question: Dict, k: int, token_budget: int, image_budget: int) -> List[Dict]:
+        """
+        按相似度从高到低挑选至多 k 个示例，累计 token 数和图片数不超过预算；
+        与题目文本完全相同的示例（题目本身已在池中）跳过。
+        返回的示例按相似度升序排列，最相似的紧挨着待分类题目。
+        """
+        start = time.perf_counter()
+        text = sample_text(question)
+        chosen = []
+        if len(self.samples) and k > 0:
+            scores = self.vectors @ vectorize(text)
+            m = min(len(scores), k * CANDIDATES_PER_SHOT)
+            top = np.argpartition(-scores, m - 1)[:m]
+            tokens = images = 0
+            for i in top[np.argsort(-scores[top])]:
+                if len(chosen) == k:
+                    break
+                if sample_text(self.samples[i]) == text:
+                    continue
+                if tokens + self.tokens[i] > token_budget or images + self.images[i] > image_budget:
+                    continue
+                tokens += self.tokens[i]
+                images += self.images[i]
+                chosen.append(self.samples[i])
+        self.lookups += 1
+        self.lookup_seconds += time.perf_counter() - start
+        return chosen[::-1]
+
+    def stats(self) -> dict:
+        return {"samples": len(self.samples), "lookups": self.lookups,
+                "avg_lookup_ms": round(self.lookup_seconds / self.lookups * 1000, 3) if self.lookups else 0.0}
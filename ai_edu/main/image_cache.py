@@ -0,0 +1,63 @@
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class ImageCache:
+    """
+    已解码图片的 LRU 缓存，键为 (路径, mtime)，文件被修改后自动失效。
+    按字节数限额（RGB 图片按 宽*高*3 计），超出时淘汰最久未用的条目。
+    返回的对象在多处共享，调用方不要原地修改。
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def _put(self, key, value, nbytes: int):
+        with self._lock:
+            if key in self._entries or nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def open(self, path):
+        """读取并解码为 RGB 图片，命中缓存时不访问磁盘内容"""
+        from PIL import Image
+
+        key = ("image", str(path), os.stat(path).st_mtime_ns)
+        img = self._get(key)
+        if img is None:
+            with Image.open(path) as f:
+                img = f.convert("RGB")
+            self._put(key, img, img.width * img.height * 3)
+        return img
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self._entries), "bytes": self._bytes}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import pathlib
+import sqlite3
+from typing import Dict, Optional
+
+from main.rasterize import RASTER_WORKERS, rasterize_many
+
+IMAGE_ROOT = pathlib.Path(r"E:\NLP_Model\ai_edu\data\processed_data\images")
+
+# 需要先栅格化为 PNG 再供下游使用的矢量格式
+VECTOR_FORMATS = {"x-wmf", "x-emf"}
+
+
+class ImageStore:
+    """
+    按内容寻址的图片仓库：
+    - 文件名为完整 sha256，按前两位十六进制分片存放：ab/abcdef....png
+    - SQLite 索引记录 hash -> 相对路径 / 格式 / 宽高 / 字节数
+    题目中的 [IMG:...] 占位符直接引用相对路径，同一张图片在不同题目、不同试卷间只保存一次，
+    重复入库时既不写盘也不再做格式转换。
+    WMF/EMF 公式图在 put 时只登记，由 flush_rasters 统一批量转换。
+    """
+
+    def __init__(self, root=IMAGE_ROOT):
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.root / "index.sqlite"), timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")  # 允许多个解析进程同时读写
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS images (
+                   hash   TEXT PRIMARY KEY,
+                   path   TEXT NOT NULL,
+                   format TEXT NOT NULL,
+                   width  INTEGER,
+                   height INTEGER,
+                   size   INTEGER
+               )"""
+        )
+        self._conn.commit()
+        self._pending = {}  # hash -> (矢量图路径, PNG 相对路径)，等待批量栅格化
+
+    def close(self):
+        self._conn.close()
+
+    def get(self, image_hash: str) -> Optional[Dict]:
+        """按 hash 查询索引，不存在或文件已丢失时返回 None"""
+        row = self._conn.execute(
+            "SELECT path, format, width, height, size FROM images WHERE hash = ?",
+            (image_hash,),
+        ).fetchone()
+        if row is None or not (self.root / row[0]).exists():
+            return None
+        return {"hash": image_hash, "path": row[0], "format": row[1],
+                "width": row[2], "height": row[3], "size": row[4]}
+
+    def put(self, blob: bytes, content_type: str) -> str:
+        """保存图片并返回相对 root 的路径（用作 [IMG:...] 占位符）"""
+        image_hash = hashlib.sha256(blob).hexdigest()
+        record = self.get(image_hash)
+        if record:
+            return record["path"]
+
+        if image_hash in self._pending:
+            return self._pending[image_hash][1]
+
+        fmt = content_type.split("/")[-1]  # png / jpeg / x-wmf
+        shard = self.root / image_hash[:2]
+        shard.mkdir(exist_ok=True)
+        path = shard / f"{image_hash}.{fmt}"
+        _atomic_write(path, blob)
+
+        # WMF/EMF 先落盘并登记，统一在 flush_rasters 中批量转为 PNG，占位符直接指向 PNG
+        if fmt in VECTOR_FORMATS:
+            png_rel = f"{image_hash[:2]}/{image_hash}.png"
+            self._pending[image_hash] = (path, png_rel)
+            return png_rel
+
+        rel_path = path.relative_to(self.root).as_posix()
+        self._index(image_hash, rel_path, fmt)
+        print(f"已保存图片: {rel_path}")
+        return rel_path
+
+    def flush_rasters(self, workers: int = RASTER_WORKERS) -> Dict[str, str]:
+        """
+        在线程池中批量栅格化本次登记的所有矢量图。
+        返回转换失败的 {PNG 占位路径: 原始矢量图路径}，供调用方改写占位符。
+        多个解析进程可能登记同一张矢量图：PNG 先写临时文件再原子重命名，
+        目标 PNG 已存在时不再转换，源文件已被其它进程删除也不报错。
+        """
+        pending, self._pending = self._pending, {}
+        tmp_suffix = f".{os.getpid()}.tmp.png"  # 保留 .png 后缀，转换工具按后缀确定输出格式
+        jobs = [(str(src), str(self.root / png_rel) + tmp_suffix)
+                for src, png_rel in pending.values() if not (self.root / png_rel).exists()]
+        results = rasterize_many(jobs, workers=workers)
+
+        failed = {}
+        for image_hash, (src, png_rel) in pending.items():
+            png = self.root / png_rel
+            tmp = pathlib.Path(str(png) + tmp_suffix)
+            if str(src) in results and not results[str(src)]:
+                os.replace(tmp, png)
+            elif not png.exists():  # 转换失败，且其它进程也没有生成 PNG
+                _remove_quietly(tmp)
+                src_rel = src.relative_to(self.root).as_posix()
+                self._index(image_hash, src_rel, src.suffix.lstrip("."))
+                failed[png_rel] = src_rel
+                continue
+            else:
+                _remove_quietly(tmp)
+            _remove_quietly(src)
+            self._index(image_hash, png_rel, "png")
+        return failed
+
+    def _index(self, image_hash: str, rel_path: str, fmt: str):
+        path = self.root / rel_path
+        width, height = _image_size(path)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?)",
+            (image_hash, rel_path, fmt, width, height, path.stat().st_size),
+        )
+        self._conn.commit()
+
+
+def _atomic_write(path: pathlib.Path, data: bytes):
+    """先写临时文件再重命名，避免并行进程读到半截文件"""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:  # 已被其它进程删除或从未生成
+        pass
+
+
+def _image_size(path: pathlib.Path):
+    """读取图片宽高，无法识别的格式返回 (None, None)"""
+    try:
+        from PIL import Image
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None, None
@@ -1,12 +1,12 @@
-import json, os, re, time, pathlib, sys, torch
-from typing import List, Dict
-from openai import OpenAI
-from tqdm import tqdm
-from dotenv import load_dotenv
-import os
-from transformers import AutoProcessor, AutoModelForImageTextToText
-from PIL import Image
+import json, os, re, time, pathlib, sys, threading
+from functools import lru_cache
+from itertools import groupby
+from typing import Callable, List, Dict
 from pathlib import Path
+from main.constrained import LabelGrammar
+from main.taxonomy import local_l1_fields
+from main.image_cache import ImageCache
+# torch / transformers / PIL 体积很大，只在首次推理时导入，纯文本辅助函数可快速 import
 
 
 MODEL_PATH =  r"E:\hugging_face_model\qwen2.5-vl-3b\models--Qwen--Qwen2.5-VL-3B-Instruct\snapshots\66285546d2b821cf421d4f5eb2576359d3770cd3"
@@ -14,9 +14,38 @@ JSON_IN         = r"E:\NLP_Model\ai_edu\data\processed_data\nantong2021_question
 JSON_OUT        = r"E:\NLP_Model\ai_edu\data\processed_data\taizhou2023_tagged_third.json"
 IMAGE_DIR       = pathlib.Path(r"E:\NLP_Model\ai_edu\data\processed_data\images")  # 所有图片都在此
 DEVICE_MAP = "auto"
-
-processor = AutoProcessor.from_pretrained(MODEL_PATH)
-model = (AutoModelForImageTextToText.from_pretrained(MODEL_PATH, torch_dtype=torch.float16, device_map=DEVICE_MAP).eval())
+MAX_NEW_TOKENS = 64
+# 推理方式：
+#   prefix：共享前缀（任务说明 + static 示例）只 prefill 一次，逐题复用 KV 缓存，前缀越长越划算
+#   batch ：按图片张数分组、每批 BATCH_SIZE 题一起 generate，前缀很短（dynamic 示例）时吞吐更高
+#   single：逐题调用
+#   auto  ：FEWSHOT_MODE 为 static 时用 prefix，否则用 batch
+INFERENCE_MODE = "auto"
+BATCH_SIZE = 8           # batch 模式每批题数
+USE_CONSTRAINED = True   # 约束解码：输出只能是标签体系内的合法 JSON
+CONSTRAINED_MAX_NEW_TOKENS = 128  # 约束解码结束时强制 EOS，这里只是上限
+IMAGE_CACHE_BYTES = 512 * 1024 * 1024  # 已解码图片缓存上限，few-shot 图片只解码一次
+
+IMAGE_CACHE = ImageCache(max_bytes=IMAGE_CACHE_BYTES)
+
+_model_handle = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """
+    进程级共享的 (processor, model)，首次调用时加载，之后直接复用；
+    加锁保证多线程同时首次调用时只加载一次
+    """
+    global _model_handle
+    if _model_handle is None:
+        with _model_lock:
+            if _model_handle is None:
+                import torch
+                from transformers import AutoProcessor, AutoModelForImageTextToText
+                processor = AutoProcessor.from_pretrained(MODEL_PATH)
+                model = (AutoModelForImageTextToText.from_pretrained(MODEL_PATH, torch_dtype=torch.float16, device_map=DEVICE_MAP).eval())
+                _model_handle = (processor, model)
+    return _model_handle
 
 # ---------- Prompt 模板 ----------
 PROMPT_TMPL = """### 任务
@@ -42,7 +71,37 @@ PROMPT_TMPL = """### 任务
 # 从脚本 E:\NLP_Model\ai_edu\main\model.py 访问
 PROJECT_ROOT = Path(__file__).parent.parent  # 假设脚本在 main/ 目录
 json_fewshot_path = PROJECT_ROOT / "data" / "processed_data" / "few-shot.json"
-FEW_SHOT = json.load(open(json_fewshot_path, encoding="utf-8"))
+FEWSHOT_INDEX_PATH = PROJECT_ROOT / "data" / "processed_data" / "few-shot.index"  # 生成 .npy / .json
+# static ：每题使用全部示例，示例放在共享前缀里，前缀缓存模式下只 prefill 一次
+# dynamic：main.fewshot_index 按相似度为每题检索示例，示例移到逐题后缀，每题都要重新 prefill，
+#          前缀缓存只剩任务说明；准确率收益需先用 python -m main.benchmark prefill 在标注集上确认
+FEWSHOT_MODE = "static"
+FEWSHOT_K = 4                 # dynamic 模式每题最多的示例数
+FEWSHOT_TOKEN_BUDGET = 1200   # 示例题目文本的 token 预算
+FEWSHOT_IMAGE_BUDGET = 4      # 示例图片张数预算
+FEWSHOT_EXTRA_JSON = None     # 可选：已标注题目的 JSON，带有效 L1 标签的题目一并加入示例池
+
+@lru_cache(maxsize=1)
+def get_few_shot() -> List[Dict]:
+    """few-shot 示例，首次使用时读取"""
+    return json.load(open(json_fewshot_path, encoding="utf-8"))
+
+
+@lru_cache(maxsize=1)
+def get_fewshot_index():
+    """few-shot 示例池（+ 可选的已标注题目）的检索索引，首次使用时加载或构建"""
+    from main.fewshot_index import FewShotIndex
+    pool = list(get_few_shot())
+    if FEWSHOT_EXTRA_JSON:
+        tagged = json.load(open(FEWSHOT_EXTRA_JSON, encoding="utf-8"))
+        pool += [t for t in tagged if (t.get("label") or {}).get("L1") not in (None, "", "未分类")]
+    return FewShotIndex(pool, FEWSHOT_INDEX_PATH)
+
+def select_shots(q: Dict) -> List[Dict]:
+    """按 FEWSHOT_MODE 取本题使用的示例"""
+    if FEWSHOT_MODE == "dynamic":
+        return get_fewshot_index().select(q, FEWSHOT_K, FEWSHOT_TOKEN_BUDGET, FEWSHOT_IMAGE_BUDGET)
+    return get_few_shot()
 
 
 _rd_img = re.compile(r"\[IMG:([^\]]+?)\]")
@@ -62,18 +121,22 @@ def make_example_line(sample: Dict[str, str]) -> str:
 {{"L1":"{label}","L2":"","L3":"","L4":""}}
 """, images)
 
-def build_prompt_with_shots(q: Dict) -> tuple[str, list]:
-    """构建完整带有示例的 prompt， 并返回所有相关图片"""
+def build_shot_block(shots: List[Dict] = None) -> tuple[str, list]:
+    """构建示例题目的文本块（默认全部示例），并返回示例中的图片"""
     all_images = []
     example_texts = []
 
     # 收集所有示例文本和图片
-    for s in FEW_SHOT:
+    for s in (get_few_shot() if shots is None else shots):
         example_text, example_images = make_example_line(s)
         example_texts.append(example_text)
         all_images.extend(example_images)
 
-    example_block = "\n".join(example_texts)
+    return "\n".join(example_texts), all_images
+
+def build_prompt_with_shots(q: Dict) -> tuple[str, list]:
+    """构建完整带有示例的 prompt， 并返回所有相关图片"""
+    example_block, all_images = build_shot_block(select_shots(q))
     # 待分类题目
     q_text, q_imgs = md_to_qwen(build_question_block(q))
     all_images.extend(q_imgs)
@@ -86,6 +149,29 @@ def build_prompt_with_shots(q: Dict) -> tuple[str, list]:
 【请输出唯一一行JSON标签】："""
     return prompt, all_images
 
+# PROMPT_TMPL 在 {QUESTION_BLOCK} 处切成两段，前缀缓存模式下分别拼接
+_PROMPT_HEAD, _PROMPT_TAIL = PROMPT_TMPL.split("{QUESTION_BLOCK}")
+
+def build_shot_prefix() -> tuple[str, list]:
+    """
+    所有题目共享的前缀：任务说明 + few-shot 示例 + 待分类题目标题
+    与 build_question_suffix 拼接后等于 PROMPT_TMPL.format(QUESTION_BLOCK=build_prompt_with_shots(q)[0])
+    dynamic 模式下每题的示例不同，前缀只含任务说明，示例放到后缀
+    """
+    if FEWSHOT_MODE == "dynamic":
+        return _PROMPT_HEAD.format(), []
+    example_block, shot_images = build_shot_block()
+    return _PROMPT_HEAD.format() + f"{example_block}\n\n【待分类题目】\n", shot_images
+
+def build_question_suffix(q: Dict) -> tuple[str, list]:
+    """单道题目的后缀：（dynamic 模式下的检索示例 +）题目内容 + 输出要求"""
+    head, images = "", []
+    if FEWSHOT_MODE == "dynamic":
+        example_block, images = build_shot_block(select_shots(q))
+        head = f"{example_block}\n\n【待分类题目】\n"
+    q_text, q_imgs = md_to_qwen(build_question_block(q))
+    return head + f"{q_text}\n\n【请输出唯一一行JSON标签】：" + _PROMPT_TAIL.format(), images + q_imgs
+
 def build_question_block(q: Dict) -> str:
     """
     用题干 + 选项拼出给 LLM 的 markdown 区块
@@ -123,7 +209,7 @@ def md_to_qwen(markdown: str):
     for img_name in img_matches:
         try:
             img_path = IMAGE_DIR / img_name
-            images.append(Image.open(img_path).convert("RGB"))
+            images.append(IMAGE_CACHE.open(img_path))
             print(f"加载图片: {img_path}")
         except Exception as e:
             print(f"[warn] 加载图片 {img_path} 失败: {e}", file=sys.stderr)
@@ -135,6 +221,8 @@ def call_llm(prompt_md: str, max_retry: int = 3) -> str:
     """
     调用 Qwen2.5-VL 模型处理文本和图像
     """
+    import torch
+    processor, model = get_model()
     for i in range(max_retry):
         try:
             text, images = md_to_qwen(prompt_md)
@@ -163,10 +251,13 @@ def call_llm(prompt_md: str, max_retry: int = 3) -> str:
             print(f"[warn] {e}. retry in {wait}s …", file=sys.stderr)
             time.sleep(wait)
 
-def call_llm_with_images(text: str, images:list, max_retry: int = 3) -> str:
+def call_llm_with_images(text: str, images:list, max_retry: int = 3, grammar=None) -> str:
     """
     调用 Qwen2.5-VL 模型处理文本和已预处理的图像
+    传入 grammar 时使用约束解码，只返回新生成的 JSON 文本
     """
+    import torch
+    processor, model = get_model()
     for i in range(max_retry):
         try:
             inputs = processor(
@@ -175,6 +266,18 @@ def call_llm_with_images(text: str, images:list, max_retry: int = 3) -> str:
                 return_tensors="pt",
             ).to(model.device)
 
+            if grammar is not None:
+                prompt_length = inputs["input_ids"].shape[1]
+                with torch.no_grad():
+                    out = model.generate(
+                        **inputs,
+                        max_new_tokens=CONSTRAINED_MAX_NEW_TOKENS,
+                        do_sample=False,
+                        eos_token_id=processor.tokenizer.eos_token_id,
+                        prefix_allowed_tokens_fn=grammar.prefix_allowed_tokens_fn(prompt_length),
+                    )
+                return processor.batch_decode(out[:, prompt_length:], skip_special_tokens=True)[0].strip()
+
             with torch.no_grad():
                 out = model.generate(
                     **inputs,
@@ -197,6 +300,90 @@ def call_llm_with_images(text: str, images:list, max_retry: int = 3) -> str:
             print(f"[warn] {e}. retry in {wait}s …", file=sys.stderr)
             time.sleep(wait)
 
+def _is_oom(e: Exception) -> bool:
+    """判断是否为显存/内存不足错误"""
+    import torch
+    oom_type = getattr(torch.cuda, "OutOfMemoryError", None)
+    return (oom_type is not None and isinstance(e, oom_type)) or "out of memory" in str(e).lower()
+
+def _generate_batch(batch: List[tuple], max_new_tokens: int, grammar=None) -> List[str]:
+    """对一组 (文本, 图片列表) 做左侧 padding 后一次 generate，只解码新生成的部分"""
+    import torch
+    processor, model = get_model()
+    texts = [text for text, _ in batch]
+    images = [img for _, imgs in batch for img in imgs]
+    # 批量生成需要左侧 padding；processor 与 prefix/single 路径共用，只在本次编码期间临时修改
+    tokenizer = processor.tokenizer
+    padding_side, tokenizer.padding_side = tokenizer.padding_side, "left"
+    try:
+        inputs = processor(
+            text=texts,
+            images=images if images else None,
+            padding=True,
+            return_tensors="pt",
+        ).to(model.device)
+    finally:
+        tokenizer.padding_side = padding_side
+    prompt_length = inputs["input_ids"].shape[1]
+
+    extra = {}
+    if grammar is not None:
+        extra["prefix_allowed_tokens_fn"] = grammar.prefix_allowed_tokens_fn(prompt_length)
+    with torch.no_grad():
+        out = model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            eos_token_id=processor.tokenizer.eos_token_id,
+            pad_token_id=processor.tokenizer.pad_token_id,
+            **extra,
+        )
+    new_tokens = out[:, prompt_length:]
+    return [r.strip() for r in processor.batch_decode(new_tokens, skip_special_tokens=True)]
+
+def count_images(q: Dict) -> int:
+    """题目（及 dynamic 模式下检索到的示例）引用的图片张数，只数占位符，不解码图片"""
+    samples = select_shots(q) + [q] if FEWSHOT_MODE == "dynamic" else [q]  # static 示例每题相同
+    return sum(len(_rd_img.findall(s.get("content") or "")) +
+               sum(len(_rd_img.findall(o.get("text") or "")) for o in s.get("options") or [])
+               for s in samples)
+
+def build_full_prompt(q: Dict) -> tuple[str, list]:
+    """逐题 / 批量模式下单道题的完整 prompt 和图片"""
+    prompt_text, all_images = build_prompt_with_shots(q)
+    return PROMPT_TMPL.format(QUESTION_BLOCK=prompt_text), all_images
+
+def call_llm_batch(questions: List[Dict], build_item: Callable[[Dict], tuple] = build_full_prompt,
+                   batch_size: int = BATCH_SIZE, max_new_tokens: int = MAX_NEW_TOKENS, grammar=None) -> List[str]:
+    """
+    批量调用 Qwen2.5-VL：按图片张数分组，同一批内图片数相同；组内按题目长度排序后分批，减少 padding。
+    每批 generate 前才用 build_item 构建 (文本, 图片列表)，同一时刻只持有一批的 prompt 和图片。
+    显存不足时自动减半 batch 重试。返回结果与 questions 顺序一致。
+    """
+    import torch
+    keys = [(count_images(q), len(build_question_block(q))) for q in questions]
+    order = sorted(range(len(questions)), key=keys.__getitem__)
+    replies = [""] * len(questions)
+    for n_images, group in groupby(order, key=lambda i: keys[i][0]):
+        group = list(group)
+        pos = 0
+        while pos < len(group):
+            idx = group[pos:pos + batch_size]
+            try:
+                batch_replies = _generate_batch([build_item(questions[i]) for i in idx], max_new_tokens, grammar)
+            except RuntimeError as e:
+                if not _is_oom(e) or batch_size == 1:
+                    raise
+                torch.cuda.empty_cache()
+                batch_size = max(1, batch_size // 2)
+                print(f"[warn] 显存不足，batch size 降为 {batch_size}", file=sys.stderr)
+                continue
+            for i, reply in zip(idx, batch_replies):
+                replies[i] = reply
+            pos += len(idx)
+            print(f"批量推理（每题 {n_images} 张图片）: {pos}/{len(group)}")
+    return replies
+
 def clean_json_block(s: str) -> str:
     """
      清理模型返回的 JSON 字符串，处理以下情况:
@@ -242,24 +429,69 @@ def safe_json_line(s: str) -> Dict:
             return {"L1": l1_value, "L2":"", "L3":"", "L4":""}
     return {"L1":"", "L2":"", "L3":"", "L4":""}
 
+def parse_reply(raw: str, grammar=None) -> Dict:
+    """约束解码的输出直接 json.loads，自由文本输出走 safe_json_line 修复"""
+    if grammar is not None:
+        return grammar.parse(raw)
+    return safe_json_line(raw)
+
 def main():
+    from tqdm import tqdm
+    from main.qwen_prefix import PrefixCache
+
+    processor, model = get_model()
     questions: List[Dict] = json.load(open(JSON_IN, encoding="utf-8"))
-    for q in tqdm(questions, desc="Tagging with Few-Shot"):
-        # 获取提示文本和所有图片
-        prompt_text, all_images = build_prompt_with_shots(q)
 
-        # 将提示文本替换到模板中
-        full_prompt = PROMPT_TMPL.format(QUESTION_BLOCK=prompt_text)
+    grammar = None
+    max_new_tokens = MAX_NEW_TOKENS
+    if USE_CONSTRAINED:
+        grammar = LabelGrammar(processor.tokenizer, local_l1_fields())
+        max_new_tokens = CONSTRAINED_MAX_NEW_TOKENS
+
+    mode = INFERENCE_MODE
+    if mode == "auto":
+        mode = "prefix" if FEWSHOT_MODE == "static" else "batch"
+    print(f"推理方式: {mode}")
+
+    if mode == "prefix":
+        # 前缀缓存：任务说明和 few-shot 部分只编码一次，逐题只跑后缀
+        prefix_text, prefix_images = build_shot_prefix()
+        prefix_cache = PrefixCache(processor, model, prefix_text, prefix_images)
+        print(f"前缀缓存已建立: {prefix_cache.length} tokens")
+        for q in tqdm(questions, desc="Tagging with Prefix Cache"):
+            suffix_text, suffix_images = build_question_suffix(q)
+            raw = prefix_cache.generate(
+                suffix_text, suffix_images, max_new_tokens=max_new_tokens,
+                allowed_tokens_fn=grammar.allowed_tokens if grammar else None,
+            )
+            q["label"] = parse_reply(raw, grammar)
+
+    elif mode == "batch":
+        # 批量推理：按图片数分组，每批生成前才构建 prompt
+        replies = call_llm_batch(questions, max_new_tokens=max_new_tokens, grammar=grammar)
+        for q, raw in zip(questions, replies):
+            q["label"] = parse_reply(raw, grammar)
+
+    else:
+        for q in tqdm(questions, desc="Tagging with Few-Shot"):
+            # 获取提示文本和所有图片
+            prompt_text, all_images = build_prompt_with_shots(q)
+
+            # 将提示文本替换到模板中
+            full_prompt = PROMPT_TMPL.format(QUESTION_BLOCK=prompt_text)
 
-        # 调用增强版的 call_llm 函数，直接传递预处理的图片
-        raw = call_llm_with_images(full_prompt, all_images)
+            # 调用增强版的 call_llm 函数，直接传递预处理的图片
+            raw = call_llm_with_images(full_prompt, all_images, grammar=grammar)
 
-        # text = md_to_qwen(prompt)
-        # print(text[0])
+            # text = md_to_qwen(prompt)
+            # print(text[0])
 
-        # raw = call_llm(prompt)
-        q["label"] = safe_json_line(raw)
+            # raw = call_llm(prompt)
+            q["label"] = parse_reply(raw, grammar)
     
+    print(f"图片缓存: {IMAGE_CACHE.stats()}")
+    if FEWSHOT_MODE == "dynamic":
+        print(f"few-shot 检索: {get_fewshot_index().stats()}")
     print(json.dumps(questions, ensure_ascii=False, indent=2))
     # json.dump(questions, open(JSON_OUT,"w",encoding="utf8"),
     #           ensure_ascii=False, indent=2)
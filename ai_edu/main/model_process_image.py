@@ -1,28 +1,35 @@
 import json, os, re, time, pathlib, sys
 from typing import List, Dict
-from openai import OpenAI
 from tqdm import tqdm
 from dotenv import load_dotenv
 import os
 from model.vision_tool import VisionDescribe
-
-total_prompt_tokens = 0
-total_completion_tokens = 0
-total_tokens = 0
-
-client = OpenAI(
-    api_key = os.getenv("QWEN_KEY"),
-    base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1",
-)
+from model.tool_executor import run_tool_calls
+from model.transport import LATENCY, get_openai_client
+from model.usage_ledger import LEDGER
+from main.async_runner import run_tagging
+from main.prompt_builder import build_prompt as build_compact_prompt, decode_reply
+from main.checkpoint import compact
+from main.question_cache import QuestionCache, tagger_key
+
+# 与 VisionDescribe 共用连接池配置和延迟统计
+client = get_openai_client()
 # qwen_key = os.getenv("QWEN_KEY")
 # openai.api_key  = os.getenv("QWEN_KEY")
-# MODEL_NAME      = "qwen-vl-plus"       # 改成控制台里实际可用的名字
+MODEL_NAME      = "qwen-vl-plus"       # 改成控制台里实际可用的名字；main.pipeline 也据此判断是否需要重新打标签
 
 vision_tool = VisionDescribe()
 
 JSON_IN         = r"E:\NLP_Model\ai_edu\data\processed_data\taizhou2023.json"
 JSON_OUT        = r"E:\NLP_Model\ai_edu\data\processed_data\taizhou2023_tagged2.json"
+USAGE_CSV       = r"E:\NLP_Model\ai_edu\data\processed_data\taizhou2023_usage.csv"  # 每次请求/工具调用的用量明细
 IMAGE_DIR       = pathlib.Path(r"E:\NLP_Model\ai_edu\data\processed_data\images")  # 所有图片都在此
+PROMPT_MODE     = "full"  # full：使用下方 PROMPT_TMPL；compact：main.prompt_builder 的紧凑代码编码（解析率/准确率尚未评估，按需启用）
+ASYNC_MODE      = False   # True 时使用 main.async_runner 并发打标签
+ASYNC_CONCURRENCY = 16
+# 跨试卷共享的题目缓存，相同模型和提示词下相同/近似题目直接复用标签；设为 None 关闭
+QUESTION_CACHE_PATH = r"E:\NLP_Model\ai_edu\data\processed_data\question_cache.jsonl"
+REUSE_THRESHOLD = 1.0   # 近似复用的最低相似度（需高于 0.875，如 0.9），1.0 只复用完全相同的题目
 
 # ---------- Prompt 模板 ----------
 PROMPT_TMPL = """### 任务
@@ -313,11 +320,45 @@ def build_question_block(q: Dict) -> str:
         return f"{content}\n\n选项：\n{opts}"
     return content
 
+def handle_tool_call(tool_call) -> Dict:
+    """执行单个 vision_describe 工具调用，返回要追加到消息历史的 tool 消息"""
+    if tool_call.function.name != "vision_describe":
+        return None
+    try:
+        # 解析工具调用用参数
+        args = json.loads(tool_call.function.arguments)
+        image_filename = args["image_path"]
+
+        # 构建完整路径
+        full_image_path = str(IMAGE_DIR / image_filename)
+        print(f"正在分析图片: {image_filename}")
+
+        # 调用vision工具
+        vision_params = json.dumps({"image_path": full_image_path})
+        vision_result = vision_tool.call(vision_params)
+        if vision_result is None:
+            raise ValueError("工具调用返回结果为空或格式错误")
+
+        # 添加工具调用结果到消息历史
+        return {
+            "tool_call_id": tool_call.id,
+            "role": "tool",
+            "content": vision_result
+        }
+
+    except Exception as e:
+        print(f"工具调用失败: {e}")
+        # 添加错误信息
+        return {
+            "tool_call_id": tool_call.id,
+            "role": "tool",
+            "content": json.dumps({"error": f"图片分析失败: {str(e)}"}, ensure_ascii=False)
+        }
+
 def call_llm_with_tools(prompt: str, max_retry: int = 3) -> str:
     """
     调用支持工具的LLM，让其智能决定何时调用vision工具
     """
-    global total_completion_tokens, total_prompt_tokens, total_tokens
 
     tools = [
         {
@@ -345,8 +386,9 @@ def call_llm_with_tools(prompt: str, max_retry: int = 3) -> str:
             messages = [{"role": "user", "content": prompt}]
 
             while True:
+                start = time.perf_counter()
                 resp = client.chat.completions.create(
-                    model="qwen-vl-plus",
+                    model=MODEL_NAME,
                     messages=messages,
                     tool_choice="auto",
                     temperature=0.0,
@@ -355,53 +397,21 @@ def call_llm_with_tools(prompt: str, max_retry: int = 3) -> str:
                 message = resp.choices[0].message
                 messages.append(message)
 
-                # 统计token使用
+                # 记录token使用与耗时
+                LEDGER.record_chat(MODEL_NAME, getattr(resp, "usage", None), time.perf_counter() - start)
                 if hasattr(resp, 'usage') and resp.usage:
-                    prompt_tokens = resp.usage.prompt_tokens
-                    completion_tokens = resp.usage.completion_tokens
-                    total_tokens_used = resp.usage.total_tokens
-
-                    total_prompt_tokens += prompt_tokens
-                    total_completion_tokens += completion_tokens
-                    total_tokens += total_tokens_used
-                    print(f"本次请求tokens: 提示={prompt_tokens}, 完成={completion_tokens}, 总计={total_tokens_used}")
+                    print(f"本次请求tokens: 提示={resp.usage.prompt_tokens}, 完成={resp.usage.completion_tokens}, "
+                          f"总计={resp.usage.total_tokens}")
                 
                 # 检查是否有工具调用
                 if message.tool_calls:
                     print(f"检测到 {len(message.tool_calls)} 个工具调用")
 
-                    for tool_call in message.tool_calls:
-                        if tool_call.function.name == "vision_describe":
-                            try:
-                                # 解析工具调用用参数
-                                args = json.loads(tool_call.function.arguments)
-                                image_filename = args["image_path"]
-
-                                # 构建完整路径
-                                full_image_path = str(IMAGE_DIR / image_filename)
-                                print(f"正在分析图片: {image_filename}")
-
-                                # 调用vision工具
-                                vision_params = json.dumps({"image_path": full_image_path})
-                                vision_result = vision_tool.call(vision_params)
-                                if vision_result is None:
-                                    raise ValueError("工具调用返回结果为空或格式错误")
-
-                                # 添加工具调用结果到消息历史
-                                messages.append({
-                                    "tool_call_id": tool_call.id,
-                                    "role": "tool",
-                                    "content": vision_result
-                                })
-
-                            except Exception as e:
-                                print(f"工具调用失败: {e}")
-                                # 添加错误信息
-                                messages.append({
-                                    "tool_call_id": tool_call.id,
-                                    "role": "tool",
-                                    "content": json.dumps({"error": f"图片分析失败: {str(e)}"}, ensure_ascii=False)
-                                })
+                    # 同一轮的多个工具调用并发执行，结果按 tool_call_id 原顺序追加
+                    tool_messages, elapsed = run_tool_calls(message.tool_calls, handle_tool_call)
+                    messages.extend(tool_messages)
+                    LEDGER.record("tool_turn", "parallel", latency=elapsed)
+                    print(f"本轮 {len(message.tool_calls)} 个工具调用耗时 {elapsed:.2f}s")
                     # 继续对话,让模型基于工具结果生成最终答案
                     continue
                 else:
@@ -466,30 +476,115 @@ def safe_json_line(s: str) -> Dict:
             "D6_L1": "难度控制", "D6_L2": "未分类", "D6_L3": "未分类"
         }
 
-def main():
-    questions: List[Dict] = json.load(open(JSON_IN, encoding="utf-8"))
-    for q in tqdm(questions, desc="智能标注处理"):
-        try:
-            prompt = PROMPT_TMPL.format(QUESTION_BLOCK=build_question_block(q))
-            # print(prompt)
-            raw = call_llm_with_tools(prompt)
-            q["label"] = safe_json_line(raw)
-    
-        except Exception as e:
-            print(f"处理题目 {q.get('id', 'unknown')} 时出错: {e}")
-            # 设置默认标签
+def build_prompt(q: Dict) -> str:
+    """按 PROMPT_MODE 构造单道题的提示词"""
+    if PROMPT_MODE == "compact":
+        return build_compact_prompt(build_question_block(q))
+    return PROMPT_TMPL.format(QUESTION_BLOCK=build_question_block(q))
+
+def parse_label(raw: str) -> Dict:
+    """紧凑模式先按标签代码解码，失败时退回 safe_json_line"""
+    if PROMPT_MODE == "compact":
+        label = decode_reply(raw)
+        if label is not None:
+            return label
+    return safe_json_line(raw)
+
+def prompt_template() -> str:
+    """当前 PROMPT_MODE 下与题目无关的提示词模板，题目缓存只复用同一模板给出的标签"""
+    return build_compact_prompt("") if PROMPT_MODE == "compact" else PROMPT_TMPL
+
+question_cache = QuestionCache(QUESTION_CACHE_PATH, IMAGE_DIR, REUSE_THRESHOLD,
+                               tagger_key(MODEL_NAME, prompt_template())) if QUESTION_CACHE_PATH else None
+
+def reuse_cached_label(q: Dict) -> bool:
+    """题目缓存命中时直接写入复用的标签（带 _reused_from / _similarity 审计字段）"""
+    if question_cache is None:
+        return False
+    hit = question_cache.lookup(build_question_block(q))
+    if hit is None:
+        return False
+    q["label"] = hit.reused_label()
+    LEDGER.record("cache", "question_cache", cached=True)
+    return True
+
+def remember_label(q: Dict, source: str, replace: bool = False):
+    if question_cache is not None:
+        question_cache.add(build_question_block(q), q["label"], f"{os.path.basename(source)}#{q.get('id')}",
+                           replace=replace)
+
+def main_async(questions: List[Dict], source: str = JSON_IN, reuse: bool = True):
+    """并发打标签，结果按题目原顺序写回"""
+    pending = [q for q in questions if not (reuse and reuse_cached_label(q))]
+    prompts = [build_prompt(q) for q in pending]
+    raws = run_tagging(prompts, handle_tool_call, model=MODEL_NAME,
+                       concurrency=ASYNC_CONCURRENCY, keys=[q.get("id") for q in pending],
+                       desc="智能标注处理", temperature=0.0)
+    for q, raw in zip(pending, raws):
+        if isinstance(raw, Exception):
+            print(f"处理题目 {q.get('id', 'unknown')} 时出错: {raw}")
             q["label"] = {
                 "D1_L1": "知识点", "D1_L2": "未分类", "D1_L3": "未分类", "D1_L4": "未分类"
             }
+        else:
+            q["label"] = parse_label(raw)
+            remember_label(q, source, replace=not reuse)
+
+def tag_questions(questions: List[Dict], source: str = JSON_IN, reuse: bool = True):
+    """
+    为题目列表打标签，结果写入各题的 label。source 为题目来源文件，记入题目缓存；
+    reuse=False 时不复用题目缓存中的标签，全部重新请求模型，并用新标签覆盖缓存记录
+    """
+    if ASYNC_MODE:
+        main_async(questions, source, reuse)
+    else:
+        for q in tqdm(questions, desc="智能标注处理"):
+            LEDGER.set_question(q.get("id"))
+            try:
+                if reuse and reuse_cached_label(q):
+                    continue
+                prompt = build_prompt(q)
+                # print(prompt)
+                raw = call_llm_with_tools(prompt)
+                q["label"] = parse_label(raw)
+                remember_label(q, source, replace=not reuse)
+
+            except Exception as e:
+                print(f"处理题目 {q.get('id', 'unknown')} 时出错: {e}")
+                # 设置默认标签
+                q["label"] = {
+                    "D1_L1": "知识点", "D1_L2": "未分类", "D1_L3": "未分类", "D1_L4": "未分类"
+                }
+
+def tag_file(json_in, json_out, reuse: bool = True) -> int:
+    """读取题目 JSON，打标签后原子写出到 json_out（供 main.pipeline 调用），返回题目数"""
+    questions: List[Dict] = json.load(open(json_in, encoding="utf-8"))
+    tag_questions(questions, json_in, reuse)
+    os.makedirs(os.path.dirname(os.path.abspath(json_out)), exist_ok=True)
+    compact(questions, json_out)
+    return len(questions)
 
-    # 输出token使用总量统计
+def print_usage_report():
+    """输出token使用与耗时统计"""
     print("\n===== Token使用统计 =====")
-    print(f"提示tokens总计: {total_prompt_tokens}")
-    print(f"完成tokens总计: {total_completion_tokens}")
-    print(f"总计tokens: {total_tokens}")
+    print(LEDGER.summary())
+    if question_cache is not None:
+        question_cache.close()
+        print(question_cache.summary())
+    LEDGER.to_csv(USAGE_CSV)
+    print(f"用量明细已保存到: {USAGE_CSV}")
+    latency_report = LATENCY.summary()
+    if latency_report:
+        print("接口延迟:")
+        print(latency_report)
     # print(f"估算费用: ${total_prompt_tokens/1000 * 0.0015 + total_completion_tokens/1000 * 0.0045:.4f} (按1000tokens $0.001计算)")
     print("=======================\n")
 
+def main():
+    questions: List[Dict] = json.load(open(JSON_IN, encoding="utf-8"))
+    tag_questions(questions)
+    print_usage_report()
+
     print(json.dumps(questions, ensure_ascii=False, indent=2))
     # json.dump(questions, open(JSON_OUT,"w",encoding="utf8"),
     #           ensure_ascii=False, indent=2)
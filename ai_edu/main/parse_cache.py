@@ -0,0 +1,172 @@
+"""
+解析结果缓存：按 .docx 内容 hash + 文件名 + PARSER_VERSION 缓存 process_document 写出的内容（元数据和
+prepare_final_questions 的结果）及其引用的图片列表；extract_doc_content 的中间结果命中时用不到，不保存。文件未变化时 process_document 直接使用缓存，内容变化或解析器升级后自动重新解析。
+- SQLite 存储（WAL，允许多个解析进程同时读写），总字节数超过上限时按最近访问时间淘汰
+- 命中时检查引用的图片仍在图片仓库中，缺失则视为未命中
+命令行：
+    python -m main.parse_cache list
+    python -m main.parse_cache stats
+    python -m main.parse_cache prune [--stale] [--older-than 天数] [--max-bytes 字节数] [--all]
+"""
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import re
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+from main.image_store import IMAGE_ROOT
+
+# 修改 extract_doc_content / prepare_final_questions 的输出格式时加 1，旧缓存随之失效
+PARSER_VERSION = 1
+PARSE_CACHE_PATH = r"E:\NLP_Model\ai_edu\data\processed_data\parse_cache.sqlite"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 512MB
+
+_IMG_RE = re.compile(r"\[IMG:([^\]]+?)\]")
+
+
+def document_key(doc_path) -> str:
+    """缓存键：文件内容 sha256 + 文件名（题目 id 由文件名中的元数据生成）+ 解析器版本"""
+    h = hashlib.sha256()
+    with open(doc_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    h.update(b"\0" + os.path.basename(doc_path).encode("utf-8") + f"\0{PARSER_VERSION}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def referenced_images(questions: List[Dict]) -> List[str]:
+    return sorted(set(_IMG_RE.findall(json.dumps(questions, ensure_ascii=False))))
+
+
+class ParseCache:
+    def __init__(self, path=PARSE_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES, image_root=IMAGE_ROOT):
+        self.max_bytes = max_bytes
+        self.image_root = pathlib.Path(image_root)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(str(path), timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                   key      TEXT PRIMARY KEY,
+                   filename TEXT NOT NULL,
+                   version  INTEGER NOT NULL,
+                   value    TEXT NOT NULL,
+                   created  REAL NOT NULL,
+                   accessed REAL NOT NULL,
+                   size     INTEGER NOT NULL
+               )"""
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """返回 {"metadata", "final_questions", "images"}；未命中或图片缺失时返回 None"""
+        row = self._conn.execute("SELECT value FROM documents WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value = json.loads(row[0])
+        missing = [p for p in value["images"] if not (self.image_root / p).exists()]
+        if missing:
+            print(f"解析缓存引用的 {len(missing)} 张图片已不存在，重新解析")
+            return None
+        self._conn.execute("UPDATE documents SET accessed = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+        return value
+
+    def put(self, key: str, filename: str, metadata: Dict, final_questions: List[Dict]):
+        value = json.dumps({"metadata": metadata, "final_questions": final_questions,
+                            "images": referenced_images(final_questions)}, ensure_ascii=False)
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, filename, PARSER_VERSION, value, now, now, len(value.encode("utf-8"))),
+        )
+        self.prune(max_bytes=self.max_bytes)
+
+    def entries(self) -> List[tuple]:
+        return self._conn.execute(
+            "SELECT key, filename, version, size, created, accessed FROM documents ORDER BY accessed DESC"
+        ).fetchall()
+
+    def stats(self) -> Dict:
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM documents").fetchone()
+        stale = self._conn.execute("SELECT COUNT(*) FROM documents WHERE version != ?",
+                                   (PARSER_VERSION,)).fetchone()[0]
+        return {"entries": count, "bytes": total, "stale": stale, "max_bytes": self.max_bytes,
+                "parser_version": PARSER_VERSION}
+
+    def prune(self, max_bytes: Optional[int] = None, stale: bool = False,
+              older_than: Optional[float] = None, everything: bool = False) -> int:
+        """
+        删除条目，返回删除数：stale 删除其它解析器版本的条目，older_than 删除超过该秒数未访问的条目，
+        max_bytes 按最近访问时间淘汰到上限以内，everything 清空
+        """
+        cur = self._conn.cursor()
+        removed = 0
+        if everything:
+            removed += cur.execute("DELETE FROM documents").rowcount
+        if stale:
+            removed += cur.execute("DELETE FROM documents WHERE version != ?", (PARSER_VERSION,)).rowcount
+        if older_than is not None:
+            removed += cur.execute("DELETE FROM documents WHERE accessed < ?",
+                                   (time.time() - older_than,)).rowcount
+        if max_bytes is not None:
+            total = cur.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+            if total > max_bytes:
+                for key, size in cur.execute(
+                    "SELECT key, size FROM documents ORDER BY accessed ASC"
+                ).fetchall():
+                    cur.execute("DELETE FROM documents WHERE key = ?", (key,))
+                    removed += 1
+                    total -= size
+                    if total <= max_bytes:
+                        break
+        self._conn.commit()
+        return removed
+
+    def close(self):
+        self._conn.close()
+
+
+def _fmt_time(ts: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(ts))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m main.parse_cache", description="查看和清理 .docx 解析结果缓存")
+    parser.add_argument("--path", default=PARSE_CACHE_PATH, help="缓存数据库路径")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="列出缓存条目（按最近访问排序）")
+    sub.add_parser("stats", help="条目数、总字节数、旧版本条目数")
+    prune = sub.add_parser("prune", help="删除条目")
+    prune.add_argument("--stale", action="store_true", help="删除其它解析器版本的条目")
+    prune.add_argument("--older-than", type=float, metavar="DAYS", help="删除超过指定天数未访问的条目")
+    prune.add_argument("--max-bytes", type=int, help="按最近访问时间淘汰到该字节数以内")
+    prune.add_argument("--all", action="store_true", help="清空缓存")
+    args = parser.parse_args(argv)
+
+    cache = ParseCache(args.path)
+    try:
+        if args.command == "list":
+            for key, filename, version, size, created, accessed in cache.entries():
+                flag = "" if version == PARSER_VERSION else " (旧版本)"
+                print(f"{key[:12]}  v{version}{flag}  {size / 1024:8.1f}KB  "
+                      f"创建 {_fmt_time(created)}  访问 {_fmt_time(accessed)}  {filename}")
+        elif args.command == "stats":
+            s = cache.stats()
+            print(f"条目数: {s['entries']}, 总大小: {s['bytes'] / 1024 / 1024:.1f}MB / "
+                  f"{s['max_bytes'] / 1024 / 1024:.0f}MB, 旧版本条目: {s['stale']}, 解析器版本: {s['parser_version']}")
+        else:
+            older_than = args.older_than * 24 * 3600 if args.older_than is not None else None
+            removed = cache.prune(max_bytes=args.max_bytes, stale=args.stale,
+                                  older_than=older_than, everything=args.all)
+            print(f"已删除 {removed} 个条目")
+    finally:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+增量构建：.docx → 题目 JSON（dataprocess）→ 打标签 JSON（model_process_image）。
+状态文件记录每个产物生成时的输入指纹，只重建产物缺失或指纹变化的目标：
+- parse：.docx 内容 hash + 文件名 + PARSER_VERSION（即 main.parse_cache.document_key）
+- tag：题目 JSON 内容 hash + 提示词 hash + 模型名 + TAXONOMY_VERSION
+因此修改 PROMPT_TMPL 只会重新打标签、不会重新解析；新增一份试卷只处理这一份；
+重新解析后题目 JSON 内容没变时也不会重新打标签。
+用法：
+    python -m main.pipeline [--dry-run] [--stage parse|tag|all] [--force] [--only 关键字]
+"""
+import argparse
+import ast
+import hashlib
+import json
+import os
+import pathlib
+from typing import Dict, List, NamedTuple, Optional
+
+DOCX_DIR = r"E:\NLP_Model\ai_edu\data\math_answer"
+PARSED_DIR = r"E:\NLP_Model\ai_edu\data\processed_data\answers"
+TAGGED_DIR = r"E:\NLP_Model\ai_edu\data\processed_data\tagged"
+STATE_PATH = r"E:\NLP_Model\ai_edu\data\processed_data\pipeline_state.json"
+TAGGER_SCRIPT = pathlib.Path(__file__).parent / "model_process_image.py"
+
+
+class Target(NamedTuple):
+    stage: str
+    source: str
+    output: str
+    inputs: Optional[Dict[str, str]]  # 指纹的各组成部分；上游待重建时为 None
+    reason: str                       # 为空表示产物是最新的
+
+
+def file_hash(path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _script_constants(script, names) -> Dict[str, str]:
+    """从脚本源码中读取模块级字符串常量（打标签脚本导入时会创建 API 客户端，判断是否过期时不导入）"""
+    tree = ast.parse(pathlib.Path(script).read_text(encoding="utf-8"))
+    found = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant):
+            for t in node.targets:
+                if isinstance(t, ast.Name) and t.id in names:
+                    found[t.id] = node.value.value
+    return found
+
+
+def tagger_inputs() -> Dict[str, str]:
+    """打标签阶段与题目无关的指纹部分：提示词 hash、模型名、标签体系版本"""
+    from main.taxonomy import TAXONOMY_VERSION
+    consts = _script_constants(TAGGER_SCRIPT, {"PROMPT_MODE", "PROMPT_TMPL", "MODEL_NAME"})
+    if consts.get("PROMPT_MODE") == "compact":
+        from main.prompt_builder import build_prompt
+        prompt = build_prompt("")
+    else:
+        prompt = consts.get("PROMPT_TMPL", "")
+    return {"prompt": _text_hash(prompt), "model": consts.get("MODEL_NAME", ""), "taxonomy": TAXONOMY_VERSION}
+
+
+def fingerprint(inputs: Dict[str, str]) -> str:
+    return _text_hash(json.dumps(inputs, sort_keys=True))
+
+
+class BuildState:
+    """产物路径 -> {"stage", "source", "fingerprint", "inputs"}，每构建完一个目标就原子写回"""
+
+    def __init__(self, path: str = STATE_PATH):
+        self.path = path
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries: Dict[str, dict] = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self.entries = {}
+
+    def stale_reason(self, output: str, inputs: Dict[str, str]) -> str:
+        entry = self.entries.get(output)
+        if not os.path.exists(output):
+            return "产物不存在"
+        if entry is None:
+            return "没有构建记录"
+        if entry["fingerprint"] == fingerprint(inputs):
+            return ""
+        changed = [k for k in inputs if entry.get("inputs", {}).get(k) != inputs[k]]
+        return "输入变化: " + ", ".join(changed or ["指纹"])
+
+    def record(self, target: Target, inputs: Dict[str, str]):
+        self.entries[target.output] = {"stage": target.stage, "source": target.source,
+                                       "fingerprint": fingerprint(inputs), "inputs": inputs}
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+
+def plan_parse(state: BuildState, docx_dir: str, parsed_dir: str, only: str = "", force: bool = False) -> List[Target]:
+    from main.dataprocess import output_paths_for
+    from main.parse_cache import document_key
+    # 输出路径按目录中的全部 .docx 分配（与 process_documents_in_folder 一致），--only 不改变命名
+    sources = [os.path.join(docx_dir, name) for name in sorted(os.listdir(docx_dir))
+               if name.lower().endswith(".docx")]
+    outputs = output_paths_for(sources, parsed_dir)
+    targets = []
+    for source in sources:
+        if only not in os.path.basename(source):
+            continue
+        output = outputs[source]
+        inputs = {"source": document_key(source)}
+        targets.append(Target("parse", source, output, inputs,
+                              "--force" if force else state.stale_reason(output, inputs)))
+    return targets
+
+
+def tagged_path(parsed: str, tagged_dir: str) -> str:
+    stem = os.path.splitext(os.path.basename(parsed))[0]
+    return os.path.join(tagged_dir, f"{stem}_tagged.json")
+
+
+def plan_tag(state: BuildState, parse_targets: List[Target], tagged_dir: str, force: bool = False) -> List[Target]:
+    common = tagger_inputs()
+    targets = []
+    for p in parse_targets:
+        output = tagged_path(p.output, tagged_dir)
+        if p.reason or not os.path.exists(p.output):
+            # 题目 JSON 尚未生成或将被重建，重建后再按内容判断
+            targets.append(Target("tag", p.output, output, None, "上游待重建"))
+            continue
+        inputs = dict(common, source=file_hash(p.output))
+        targets.append(Target("tag", p.output, output, inputs,
+                              "--force" if force else state.stale_reason(output, inputs)))
+    return targets
+
+
+def _print_plan(targets: List[Target]):
+    for t in targets:
+        status = f"重建（{t.reason}）" if t.reason else "最新"
+        print(f"[{t.stage}] {status}: {os.path.basename(t.source)} -> {t.output}")
+    stale = sum(1 for t in targets if t.reason)
+    if targets:
+        print(f"[{targets[0].stage}] 共 {len(targets)} 个目标，需重建 {stale} 个")
+
+
+def run(stage: str = "all", dry_run: bool = False, force: bool = False, only: str = "",
+        docx_dir: str = DOCX_DIR, parsed_dir: str = PARSED_DIR, tagged_dir: str = TAGGED_DIR,
+        state_path: str = STATE_PATH):
+    state = BuildState(state_path)
+    parse_targets = plan_parse(state, docx_dir, parsed_dir, only, force and stage in ("parse", "all"))
+
+    if stage in ("parse", "all"):
+        _print_plan(parse_targets)
+        if not dry_run:
+            from main.dataprocess import process_document
+            for i, t in enumerate(parse_targets):
+                if not t.reason:
+                    continue
+                # --force 时同时绕过解析缓存
+                output = process_document(t.source, parsed_dir, refresh=force, output_path=t.output)
+                state.record(t._replace(output=output), t.inputs)
+                parse_targets[i] = t._replace(output=output, reason="")
+
+    if stage in ("tag", "all"):
+        tag_targets = plan_tag(state, parse_targets, tagged_dir, force and stage in ("tag", "all"))
+        _print_plan(tag_targets)
+        built = 0
+        if not dry_run:
+            for t in tag_targets:
+                if not t.reason or t.inputs is None:
+                    continue
+                # 打标签脚本导入时会创建 API 客户端，只在确实需要打标签时导入
+                from main.model_process_image import tag_file
+                print(f"打标签: {t.source}")
+                # --force 时不复用题目缓存中的旧标签
+                tag_file(t.source, t.output, reuse=not force)
+                state.record(t, t.inputs)
+                built += 1
+            if built:
+                from main.model_process_image import print_usage_report
+                print_usage_report()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m main.pipeline",
+                                     description=".docx → 题目 JSON → 打标签 JSON 的增量构建")
+    parser.add_argument("--stage", choices=["parse", "tag", "all"], default="all")
+    parser.add_argument("--dry-run", action="store_true", help="只列出需要重建的目标，不执行")
+    parser.add_argument("--force", action="store_true", help="忽略指纹，重建所选阶段的全部目标")
+    parser.add_argument("--only", default="", help="只处理文件名包含该关键字的 .docx")
+    parser.add_argument("--docx-dir", default=DOCX_DIR)
+    parser.add_argument("--parsed-dir", default=PARSED_DIR)
+    parser.add_argument("--tagged-dir", default=TAGGED_DIR)
+    parser.add_argument("--state", default=STATE_PATH)
+    args = parser.parse_args(argv)
+    run(args.stage, args.dry_run, args.force, args.only,
+        args.docx_dir, args.parsed_dir, args.tagged_dir, args.state)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,18 @@ import pandas as pd
 import re
 import os
 import zipfile
-import requests
 import json
-import base64
-from wand.image import Image
 import subprocess
 import pathlib
 import uuid
+from docx.text.paragraph import Paragraph
+from main.docx_utils import iter_block_items
+from main.rasterize import rasterize_many
+from model.transport import post_json
+from model.image_prep import IMAGE_PREP
 
 qwen_key = os.getenv("QWEN_KEY")
+RASTER_CACHE_DIR = r"E:\NLP_Model\ai_edu\data\processed_data\raster_cache"  # WMF 转换结果缓存（按内容 hash）
 
 # 提取图片和公式
 def extract_images_from_runs(paragraph, doc, qid):
@@ -43,7 +46,10 @@ def extract_doc_content(doc_path):
     current_question = None
     collecting = False
 
-    for para in doc.paragraphs:
+    for para in iter_block_items(doc):
+        # 表格暂不参与题目解析
+        if not isinstance(para, Paragraph):
+            continue
         raw = para.text.strip()
         # # 遍历文档xml格式
         # for run in paragraph.runs:
@@ -111,6 +117,7 @@ def extract_media(docx_path, output_dir):
     # 创建输出目录（确保media文件夹存在）
     os.makedirs(output_dir, exist_ok=True)
     image_map = {}
+    wmf_jobs = []
 
     with zipfile.ZipFile(docx_path, 'r') as zip_ref:
         media_files = [f for f in zip_ref.namelist() if f.startswith('word/media/')]
@@ -129,42 +136,31 @@ def extract_media(docx_path, output_dir):
                 with zip_ref.open(file) as source, open(temp_path, 'wb') as target:
                     target.write(source.read())
 
-                # 检查是否需要转换格式
-                file_ext = os.path.splitext(filename)[1].lower()
-                if file_ext == '.wmf':
-                    png_filename = filename.replace('.wmf', '.png')
-                    png_path = os.path.join(output_dir, png_filename)
-                    try:
-                        with Image(filename=temp_path) as img:
-                            img.format = 'png'
-                            img.save(filename=png_path)
-
-                        os.unlink(temp_path)  # 删除原WMF文件
-                        print(f"已将 {filename} 转换为 {png_filename}")
-
-                        image_map[filename] = png_path
-                        image_map[png_filename] = png_path
-                    except Exception as e:
-                        print(f"转换 {filename} 时出错: {e}")
-                        image_map[filename] = temp_path
-
-                else:
-                    image_map[filename] = temp_path
+                # WMF 先登记，提取完成后统一批量转换
+                if os.path.splitext(filename)[1].lower() == '.wmf':
+                    wmf_jobs.append((temp_path, os.path.splitext(temp_path)[0] + '.png'))
+                image_map[filename] = temp_path
 
             except Exception as e:
                 print(f"提取 {file} 时出错: {e}")
+
+    # 在线程池中批量转换 WMF，结果按内容 hash 缓存，失败的保留原 WMF
+    results = rasterize_many(wmf_jobs, cache_dir=RASTER_CACHE_DIR)
+    for wmf_path, png_path in wmf_jobs:
+        filename = os.path.basename(wmf_path)
+        if results.get(wmf_path):
+            continue
+        os.unlink(wmf_path)  # 删除原WMF文件
+        image_map[filename] = png_path
+        image_map[os.path.basename(png_path)] = png_path
     return image_map
 
 # qwen-vl图片公式提取
 def qwen_vl_ocr(image_path):
-    # 编码图片为base64
-    with open(image_path, "rb") as img_file:
-        img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
+    # 缩放并按真实格式编码（见 model.image_prep）
+    prep = IMAGE_PREP.prepare(image_path)
     
-    # 调用Qwen-VL API（示例URL）
-    headers = {"Content-Type": "application/json",
-               "Authorization": f"Bearer{qwen_key}"  # 替换为你的API Key
-               }
+    # 调用Qwen-VL API（共享连接池，见 model.transport）
     payload = {
         "model": "qwen-vl-plus",
         "messages": [{
@@ -177,17 +173,13 @@ def qwen_vl_ocr(image_path):
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{img_base64}"
+                            "url": prep.data_url()
                         }
                     }
                 ]
         }]
     }
-    response = requests.post(
-        "https://dashscope.aliyuncs.com/compatible-mode/v1/chat/completions",
-        headers=headers,
-        json=payload
-    )
+    response = post_json("chat/completions", payload, qwen_key, label="qwen_vl_ocr")
     # 打印完整响应，用于调试
     print(f"API响应状态码: {response.status_code}")
     if response.status_code != 200:
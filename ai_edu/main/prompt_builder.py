@@ -0,0 +1,192 @@
+"""
+标签提示词的构造与计量。
+
+PROMPT_TMPL 全文把六个维度的全部标签名逐条写出，每次请求、每轮工具调用都要重复发送。
+这里改为基于 taxonomy.TAXONOMY 生成紧凑编码：
+- 每个标签用层级代码表示，如 D1.3.1.1 = 知识模块/函数/初等函数/待定系数法
+- 模型只需为每个维度输出一个最细层级的代码，解析后再还原成 D*_L1~D*_L4 的标签名
+- 可只渲染部分维度或某个二级/三级标签下的子树（分阶段打标签时使用）
+token 数优先用 Qwen 分词器计算，分词器不可用时按字符估算。
+"""
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from main.taxonomy import TAXONOMY, children
+
+PROMPT_TOKEN_BUDGET = 2000     # 紧凑提示词（不含题目）的 token 上限，超出时少展开一级
+UNCLASSIFIED = "未分类"
+
+_CODE_RE = re.compile(r"^(D\d)((?:\.\d+){0,3})$")
+
+COMPACT_TMPL = """### 任务
+你是资深中学数学命题专家，按下列标签体系为题目在每个维度各选一个最贴切的标签。
+{TOOL_NOTE}
+### 标签体系（代码 = {CODE_FORMAT}）
+{TAXONOMY_BLOCK}
+
+### 输出
+仅输出一行 JSON，键为维度，值为{OUTPUT_LEVEL}，不能自创代码。
+示例：{EXAMPLE}
+
+### 题目
+{QUESTION_BLOCK}
+"""
+
+TOOL_NOTE = "遇到 [IMG:文件名] 时，先调用 vision_describe 工具分析图片内容，再进行分类。\n"
+
+
+# ---------- 编码 ----------
+def label_code(dim: str, *path: str) -> str:
+    """标签路径 -> 代码，如 label_code("D1", "函数", "初等函数") == "D1.3.1" """
+    code = dim
+    for depth in range(len(path)):
+        siblings = children(dim, *path[:depth])
+        code += f".{siblings.index(path[depth]) + 1}"
+    return code
+
+
+def render_dimension(dim: str, path: Sequence[str] = (), depth: int = 3) -> str:
+    """
+    渲染一个维度（或其中 path 指定的子树）的紧凑标签表，每个二级标签一行，
+    下级用序号内联，如 "3 函数：1、初等函数[1、待定系数法 2、函数性质综合 3、参数影响] 2、图像分析[...]"，
+    拼起来即代码 D1.3.1.2。depth 为从 path 往下展开的层数：1 只列出下一级，3 展开到四级。
+    """
+    def inline(prefix: Tuple[str, ...], levels: int) -> str:
+        parts = []
+        for i, n in enumerate(children(dim, *prefix), 1):
+            sub = children(dim, *prefix, n) if levels > 1 else []
+            parts.append(f"{i}、{n}[{inline(prefix + (n,), levels - 1)}]" if sub else f"{i}、{n}")
+        return " ".join(parts)
+
+    header = f"[{label_code(dim, *path)}] {'/'.join((TAXONOMY[dim]['name'],) + tuple(path))}"
+    names = children(dim, *path)
+    if depth == 1 or not children(dim, *path, names[0]):
+        return f"{header}：{inline(tuple(path), 1)}"
+    lines = [header]
+    for i, n in enumerate(names, 1):
+        lines.append(f"{i} {n}：{inline(tuple(path) + (n,), depth - 1)}")
+    return "\n".join(lines)
+
+
+def render_taxonomy(dims: Iterable[str] = tuple(TAXONOMY), depth: int = 3,
+                    subtrees: Optional[Dict[str, Sequence[str]]] = None) -> str:
+    """渲染多个维度；subtrees 给出某些维度已确定的路径，只展开该路径下的子树"""
+    subtrees = subtrees or {}
+    blocks = []
+    for dim in dims:
+        path = tuple(subtrees.get(dim, ()))
+        blocks.append(render_dimension(dim, path, max(1, depth - len(path))))
+    return "\n".join(blocks)
+
+
+def build_prompt(question_block: str, dims: Sequence[str] = tuple(TAXONOMY), with_tools: bool = True,
+                 subtrees: Optional[Dict[str, Sequence[str]]] = None, depth: int = 3,
+                 budget: Optional[int] = PROMPT_TOKEN_BUDGET) -> str:
+    """
+    构造紧凑提示词；模板部分超出 budget 时少展开一级（四级标签记为未分类）。
+    示例和输出要求与实际展开的层数一致：depth=1 且没有子树时只要求二级代码（分阶段第一步）。
+    """
+    def render(depth: int) -> str:
+        example = json.dumps({d: label_code(d, *_first_path(d, subtrees, depth)) for d in dims},
+                             ensure_ascii=False)
+        if depth == 1 and not subtrees:
+            code_format, output_level = "维度.二级序号，如 D1.3", "所选二级标签的代码（只写到二级，如 D1.3）"
+        else:
+            code_format, output_level = "维度.二级序号.三级序号.四级序号，如 D1.3.1.2", "所选的最细一级标签代码"
+        return COMPACT_TMPL.format(TOOL_NOTE=TOOL_NOTE if with_tools else "",
+                                   CODE_FORMAT=code_format, OUTPUT_LEVEL=output_level,
+                                   TAXONOMY_BLOCK=render_taxonomy(dims, depth, subtrees),
+                                   EXAMPLE=example, QUESTION_BLOCK="{QUESTION_BLOCK}")
+
+    template = render(depth)
+    if budget and depth > 1 and count_tokens(template) > budget:
+        template = render(depth - 1)
+    return template.replace("{QUESTION_BLOCK}", question_block)
+
+
+def _first_path(dim: str, subtrees: Optional[Dict[str, Sequence[str]]], depth: int = 3) -> Tuple[str, ...]:
+    """示例输出用的路径：沿已确定的路径往下，每级取第一个子标签，与 render_taxonomy 展开的层数相同"""
+    path = tuple((subtrees or {}).get(dim, ()))
+    for _ in range(max(1, depth - len(path))):
+        if not children(dim, *path):
+            break
+        path += (children(dim, *path)[0],)
+    return path
+
+
+# ---------- 解码 ----------
+def decode_code(code: str) -> Optional[Tuple[str, Tuple[str, ...]]]:
+    """代码 -> (维度, 标签路径)；格式或下标无效时返回 None"""
+    m = _CODE_RE.match(code.strip())
+    if not m or m.group(1) not in TAXONOMY:
+        return None
+    dim, path = m.group(1), ()
+    for idx in filter(None, m.group(2).split(".")):
+        names = children(dim, *path)
+        i = int(idx) - 1
+        if not 0 <= i < len(names):
+            return None
+        path += (names[i],)
+    return dim, path
+
+
+def parse_codes(raw: str, dims: Sequence[str] = tuple(TAXONOMY)) -> Optional[Dict[str, Tuple[str, ...]]]:
+    """
+    解析模型输出的 {"D1": "D1.3.1.1", ...}，返回 {维度: 标签路径}，无效代码的维度不出现在结果中；
+    不是 JSON 或不含任何维度键时返回 None
+    """
+    s = re.sub(r"^```json|^```|```$", "", raw.strip(), flags=re.MULTILINE).strip()
+    try:
+        obj = json.loads(s)
+    except Exception:
+        return None
+    if not isinstance(obj, dict) or not any(d in obj for d in dims):
+        return None
+    paths = {}
+    for dim in dims:
+        decoded = decode_code(str(obj.get(dim, "")))
+        if decoded and decoded[0] == dim:
+            paths[dim] = decoded[1]
+    return paths
+
+
+def labels_from_paths(paths: Dict[str, Sequence[str]], dims: Sequence[str] = tuple(TAXONOMY)) -> Dict[str, str]:
+    """{维度: 标签路径} -> {"D1_L1": "知识模块", "D1_L2": "函数", ...}，缺失的层级记为未分类"""
+    labels = {}
+    for dim in dims:
+        path = tuple(paths.get(dim, ()))
+        labels[f"{dim}_L1"] = TAXONOMY[dim]["name"]
+        for level in range(3):
+            labels[f"{dim}_L{level + 2}"] = path[level] if level < len(path) else UNCLASSIFIED
+    return labels
+
+
+def decode_reply(raw: str, dims: Sequence[str] = tuple(TAXONOMY)) -> Optional[Dict[str, str]]:
+    """解析模型的紧凑输出为标签名；无法解析时返回 None，由调用方走原有的容错解析"""
+    paths = parse_codes(raw, dims)
+    return None if paths is None else labels_from_paths(paths, dims)
+
+
+# ---------- 计量 ----------
+@lru_cache(maxsize=1)
+def get_tokenizer():
+    """加载 Qwen 分词器（QWEN_TOKENIZER_PATH，默认 main.model.MODEL_PATH）；不可用时返回 None"""
+    try:
+        from transformers import AutoTokenizer
+        from main.model import MODEL_PATH
+        return AutoTokenizer.from_pretrained(os.getenv("QWEN_TOKENIZER_PATH", MODEL_PATH))
+    except Exception as e:
+        print(f"[info] 分词器不可用，按字符估算 token 数: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    tokenizer = get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text))
+    # 估算：中日韩字符约 1 字 1 token，其余约 4 字符 1 token
+    cjk = sum(1 for ch in text if "　" <= ch <= "鿿" or "＀" <= ch <= "￯")
+    return cjk + (len(text) - cjk + 3) // 4
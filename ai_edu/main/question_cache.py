@@ -0,0 +1,200 @@
+"""
+题目标签的相似度缓存：各地各年份的试卷经常沿用、轻改同一道题，命中时直接复用已有标签，不再请求模型。
+- 指纹 = 规范化后的题目文本 + 题中 [IMG:...] 图片的内容 hash
+- 完全相同的题目按指纹精确匹配；近似题目用 64 位 SimHash（字符 3-gram）+ 分段索引查找，
+  相似度 = 1 - 海明距离 / 64，达到阈值且图片完全一致才复用
+- 复用的标签带 _reused_from（来源题目）和 _similarity 两个审计字段，便于抽查
+- 缓存以 JSONL 追加写，多份试卷、多次运行共享；记录带 TAXONOMY_VERSION 和打标签配置（模型名 + 提示词 hash，
+  见 tagger_key），只复用同一标签体系、同一模型和提示词给出的标签，修改提示词或换模型后旧记录自动忽略
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from main.taxonomy import TAXONOMY_VERSION
+
+SIMILARITY_THRESHOLD = 1.0    # 近似复用的最低相似度，如 0.9（海明距离 ≤ 6）；默认 1.0 只复用完全相同的题目
+MIN_SIMHASH_CHARS = 20        # 规范化后短于该长度的题目只做精确匹配，短文本的 SimHash 不可靠
+SIMHASH_BITS = 64
+BANDS = 8                     # 分段数，海明距离小于 BANDS 的两道题至少有一段完全相同，
+                              # 因此阈值需高于 1 - BANDS / 64（0.875），否则索引会漏掉候选
+UNLABELED = ("未分类", "处理失败", "解析失败")
+
+_IMG_RE = re.compile(r"\[IMG:([^\]]+?)\]")
+# 题号、来源标注（如 "（2023·泰州）"）、空白和标点不影响题意，规范化时去掉
+_SOURCE_RE = re.compile(r"[（(][^（）()]*?(?:19|20)\d{2}[^（）()]*?[）)]")
+# 题号："12." "12、" "(3)"，以及丢了标点的 "12如图"（数字后紧跟汉字）
+_NUMBER_RE = re.compile(r"^\s*(?:\d+\s*[.、．]|[（(]\d+[）)]|\d+(?=[\u4e00-\u9fff]))")
+_NOISE_RE = re.compile(r"[\s，。、；：？！“”‘’,.;:?!\"'（）()【】\[\]_]+")
+
+
+def normalize_text(text: str) -> str:
+    text = _IMG_RE.sub("", text)
+    text = unicodedata.normalize("NFKC", text)
+    text = _NUMBER_RE.sub("", text)
+    text = _SOURCE_RE.sub("", text)
+    return _NOISE_RE.sub("", text).lower()
+
+
+def simhash(text: str, n: int = 3) -> int:
+    """字符 n-gram 的 SimHash"""
+    weights = [0] * SIMHASH_BITS
+    grams = [text[i:i + n] for i in range(max(1, len(text) - n + 1))]
+    for gram in grams:
+        h = int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+
+def _bands(h: int) -> List[Tuple[int, int]]:
+    width = SIMHASH_BITS // BANDS
+    mask = (1 << width) - 1
+    return [(i, h >> (i * width) & mask) for i in range(BANDS)]
+
+
+def tagger_key(model: str, prompt: str) -> str:
+    """打标签配置的标识：模型名 + 提示词模板的 hash"""
+    return f"{model}:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]}"
+
+
+def is_labeled(label: Optional[Dict]) -> bool:
+    return bool(label) and label.get("D1_L2") not in UNLABELED
+
+
+class CacheHit(NamedTuple):
+    label: Dict[str, str]
+    similarity: float
+    source: str
+
+    def reused_label(self) -> Dict:
+        """带审计字段的标签副本"""
+        label = dict(self.label)
+        label["_reused_from"] = self.source
+        label["_similarity"] = round(self.similarity, 4)
+        return label
+
+
+class QuestionCache:
+    """
+    线程安全。image_dir 为 [IMG:...] 占位符所在目录，图片按文件内容 hash，
+    找不到的图片按文件名参与指纹。tagger 为 tagger_key 的结果，只加载和写入该配置的记录。
+    """
+
+    def __init__(self, path: str, image_dir, threshold: float = SIMILARITY_THRESHOLD, tagger: str = ""):
+        if threshold < 1.0 and threshold <= 1 - BANDS / SIMHASH_BITS:
+            raise ValueError(f"近似复用阈值需高于 {1 - BANDS / SIMHASH_BITS}（BANDS={BANDS}），"
+                             f"否则分段索引会漏掉候选: {threshold}")
+        self.path = path
+        self.tagger = tagger
+        self.image_dir = str(image_dir)
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._exact: Dict[str, dict] = {}
+        self._entries: List[dict] = []
+        self._index: Dict[Tuple[int, int], List[int]] = {}
+        self._image_hashes: Dict[str, str] = {}
+        self._fh = None
+        self.stats = {"lookups": 0, "exact": 0, "near": 0, "added": 0}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if rec.get("taxonomy") == TAXONOMY_VERSION and rec.get("tagger", "") == self.tagger:
+                    self._insert(rec)
+
+    def _insert(self, rec: dict):
+        old = self._exact.get(rec["key"])
+        if old is not None:
+            # 同一题目的后写记录覆盖先写的（强制重新打标签时追加的新标签）
+            old.update(rec)
+            return
+        self._exact[rec["key"]] = rec
+        if rec["simhash"] is not None:
+            self._entries.append(rec)
+            for band in _bands(rec["simhash"]):
+                self._index.setdefault(band, []).append(len(self._entries) - 1)
+
+    def _image_hash(self, name: str) -> str:
+        h = self._image_hashes.get(name)
+        if h is None:
+            try:
+                with open(os.path.join(self.image_dir, name), "rb") as f:
+                    h = hashlib.sha256(f.read()).hexdigest()
+            except OSError:
+                h = "name:" + name
+            self._image_hashes[name] = h
+        return h
+
+    def fingerprint(self, text: str) -> Tuple[str, Optional[int], str]:
+        """题目文本 -> (精确匹配键, SimHash 或 None, 图片 hash 串)"""
+        norm = normalize_text(text)
+        images = "|".join(sorted(self._image_hash(n) for n in _IMG_RE.findall(text)))
+        key = hashlib.sha256(f"{norm}\0{images}".encode("utf-8")).hexdigest()
+        return key, simhash(norm) if len(norm) >= MIN_SIMHASH_CHARS else None, images
+
+    def lookup(self, text: str) -> Optional[CacheHit]:
+        key, h, images = self.fingerprint(text)
+        with self._lock:
+            self.stats["lookups"] += 1
+            rec = self._exact.get(key)
+            if rec is not None:
+                self.stats["exact"] += 1
+                return CacheHit(rec["label"], 1.0, rec["source"])
+            if h is None or self.threshold >= 1.0:
+                return None
+            best, best_dist = None, SIMHASH_BITS
+            for band in _bands(h):
+                for i in self._index.get(band, ()):
+                    rec = self._entries[i]
+                    if rec["images"] != images:
+                        continue
+                    dist = bin(rec["simhash"] ^ h).count("1")
+                    if dist < best_dist:
+                        best, best_dist = rec, dist
+            similarity = 1 - best_dist / SIMHASH_BITS
+            if best is None or similarity < self.threshold:
+                return None
+            self.stats["near"] += 1
+            return CacheHit(best["label"], similarity, best["source"])
+
+    def add(self, text: str, label: Dict, source: str, replace: bool = False):
+        """登记模型给出的有效标签；复用来的标签和失败标签不登记。replace=True 时覆盖已有记录"""
+        if not is_labeled(label) or "_reused_from" in label:
+            return
+        key, h, images = self.fingerprint(text)
+        rec = {"key": key, "simhash": h, "images": images, "source": source,
+               "taxonomy": TAXONOMY_VERSION, "tagger": self.tagger,
+               "label": {k: v for k, v in label.items() if not k.startswith("_")}}
+        with self._lock:
+            if key in self._exact and not replace:
+                return
+            self._insert(rec)
+            self.stats["added"] += 1
+            if self._fh is None:
+                self._fh = open(self.path, "a", encoding="utf-8")
+            self._fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._fh.flush()
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"题目缓存: 查询={s['lookups']}, 精确命中={s['exact']}, 近似命中={s['near']}, "
+                f"新增={s['added']}, 缓存条目={len(self._exact)}")
+
+    def close(self):
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
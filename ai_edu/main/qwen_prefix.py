@@ -0,0 +1,95 @@
+import torch
+
+
+class PrefixCache:
+    """
+    共享前缀（任务说明 + few-shot 文本与图片）的 KV 缓存。
+    前缀只做一次 prefill（含 few-shot 图片的视觉编码），保存 past_key_values；
+    每道题只对题目后缀做 prefill 和贪心解码，结束后把缓存裁回前缀长度复用。
+    """
+
+    def __init__(self, processor, model, prefix_text: str, prefix_images: list):
+        self.processor = processor
+        self.model = model
+        inputs = processor(
+            text=prefix_text,
+            images=prefix_images if prefix_images else None,
+            return_tensors="pt",
+        ).to(model.device)
+        self.input_ids = inputs["input_ids"]
+        self.image_grid_thw = inputs.get("image_grid_thw")
+        self.length = self.input_ids.shape[1]
+
+        with torch.no_grad():
+            out = model(**inputs, use_cache=True)
+        self.past_key_values = out.past_key_values
+
+        eos = model.generation_config.eos_token_id
+        eos = eos if isinstance(eos, (list, tuple)) else [eos]
+        self.eos_token_ids = {e for e in eos if e is not None} | {processor.tokenizer.eos_token_id}
+
+    def _rope_index(self, input_ids, image_grid_thw):
+        """按完整序列（前缀 + 后缀）计算 Qwen2.5-VL 的 3D RoPE 位置"""
+        get_rope_index = getattr(self.model, "get_rope_index", None) or self.model.model.get_rope_index
+        position_ids, _ = get_rope_index(
+            input_ids, image_grid_thw, None, attention_mask=torch.ones_like(input_ids)
+        )
+        return position_ids
+
+    def generate(self, suffix_text: str, suffix_images: list, max_new_tokens: int = 64,
+                 allowed_tokens_fn=None) -> str:
+        """
+        在缓存的前缀之后续写题目后缀，返回新生成的文本
+        allowed_tokens_fn(已生成 token 列表) -> 允许的 token 列表，用于约束解码
+        """
+        suffix = self.processor(
+            text=suffix_text,
+            images=suffix_images if suffix_images else None,
+            return_tensors="pt",
+        ).to(self.model.device)
+        suffix_ids = suffix["input_ids"]
+
+        full_ids = torch.cat([self.input_ids, suffix_ids], dim=1)
+        grids = [g for g in (self.image_grid_thw, suffix.get("image_grid_thw")) if g is not None]
+        position_ids = self._rope_index(full_ids, torch.cat(grids) if grids else None)
+        total = full_ids.shape[1]
+
+        cache = self.past_key_values
+        generated = []
+        try:
+            with torch.no_grad():
+                out = self.model(
+                    input_ids=suffix_ids,
+                    pixel_values=suffix.get("pixel_values"),
+                    image_grid_thw=suffix.get("image_grid_thw"),
+                    position_ids=position_ids[:, :, self.length:],
+                    past_key_values=cache,
+                    cache_position=torch.arange(self.length, total, device=self.model.device),
+                    use_cache=True,
+                )
+                # 纯文本 token 的三个 RoPE 轴位置相同，续写时从当前最大位置递增
+                next_pos = position_ids.max().item() + 1
+                for step in range(max_new_tokens):
+                    logits = out.logits[:, -1, :]
+                    if allowed_tokens_fn is not None:
+                        mask = torch.full_like(logits, float("-inf"))
+                        mask[:, allowed_tokens_fn(generated)] = 0
+                        logits = logits + mask
+                    next_token = logits.argmax(dim=-1, keepdim=True)
+                    token_id = next_token.item()
+                    if token_id in self.eos_token_ids:
+                        break
+                    generated.append(token_id)
+                    pos = torch.full((3, 1, 1), next_pos + step, device=self.model.device, dtype=torch.long)
+                    out = self.model(
+                        input_ids=next_token,
+                        position_ids=pos,
+                        past_key_values=cache,
+                        cache_position=torch.tensor([total + step], device=self.model.device),
+                        use_cache=True,
+                    )
+        finally:
+            # 丢弃本题写入的 KV，只保留共享前缀
+            cache.crop(self.length)
+
+        return self.processor.tokenizer.decode(generated, skip_special_tokens=True).strip()
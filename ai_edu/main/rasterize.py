@@ -0,0 +1,74 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    from wand.image import Image as WandImage
+except ImportError:  # 未安装 Wand 时退回 magick 命令行
+    WandImage = None
+
+RASTER_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def rasterize_one(src: str, dst: str) -> Optional[str]:
+    """把单个 WMF/EMF 转为 PNG，成功返回 None，失败返回错误信息"""
+    try:
+        if WandImage is not None:
+            # Wand 通过 ctypes 调用 MagickWand，转换期间会释放 GIL，可在线程池中并行
+            with WandImage(filename=src) as img:
+                img.format = "png"
+                img.save(filename=dst)
+        else:
+            subprocess.run(
+                ["magick", "convert", src, dst],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                check=True,
+            )
+        return None
+    except subprocess.CalledProcessError as e:
+        return e.stderr.decode(errors="ignore").strip() or str(e)
+    except Exception as e:
+        return str(e)
+
+
+def rasterize_many(jobs: Iterable[Tuple[str, str]], workers: int = RASTER_WORKERS,
+                   cache_dir: Optional[str] = None) -> Dict[str, Optional[str]]:
+    """
+    批量栅格化：jobs 为 (src, dst) 列表，在有界线程池中并发转换。
+    指定 cache_dir 时按源文件内容 hash 缓存转换结果，相同内容只转换一次。
+    返回 {src: None 或错误信息}，由调用方逐张处理失败。
+    """
+    jobs = list(jobs)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _run(job):
+        src, dst = job
+        if not cache_dir:
+            return src, rasterize_one(src, dst)
+        with open(src, "rb") as f:
+            cached = os.path.join(cache_dir, hashlib.sha256(f.read()).hexdigest() + ".png")
+        if not os.path.exists(cached):
+            tmp = f"{cached}.{threading.get_ident()}.png"  # 先写临时文件，避免并发读到半截结果
+            error = rasterize_one(src, tmp)
+            if error:
+                return src, error
+            os.replace(tmp, cached)
+        shutil.copyfile(cached, dst)
+        return src, None
+
+    if not jobs:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(jobs)))) as executor:
+        results = dict(executor.map(_run, jobs))
+
+    failed = [src for src, error in results.items() if error]
+    print(f"栅格化完成: {len(jobs) - len(failed)}/{len(jobs)} 成功")
+    for src in failed:
+        print(f"  转换失败 {os.path.basename(src)}: {results[src]}")
+    return results
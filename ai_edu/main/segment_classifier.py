@@ -0,0 +1,76 @@
+"""
+extract_doc_content 状态机的段落片段分类器。
+原实现对每个片段依次 re.match 题号、小题号，再逐个 re.search 8 个小题答案模式和 6 个答案模式；
+这里按首字符分派，只对可能匹配的分支跑一次预编译正则，大部分题干片段（汉字开头）不跑任何正则。
+分类结果与原来的逐个匹配完全一致：
+- question      ^(\\d+)\\.                                  新题号
+- sub_question  ^[(（](\\d+)[)）]                            小题号
+- sub_answer    ^\\(\\s*(\\d+)\\s*\\).*?(答案|解析|【解答】)
+                或 ^(\\d+)\\..*?【(答案|解析|解答)】          带小题号的答案
+- answer_start  ^(【答案】|【解析】|【解答】|答案：|解析：|解答：)  答案开始
+- answer_title  长度 < 10 且含"答案"或"解析"                 单独的答案标题行
+一个片段可以同时属于多类（如 "3.【答案】" 既是题号也是小题答案），由状态机按原顺序处理。
+"""
+import re
+from typing import NamedTuple, Optional
+
+# 按 (一)、(1)、（2） 等小题标记把段落切成片段
+SPLIT_RE = re.compile(r'(?=[（(][一二三四五六七八九十1234567890]+[）)])')
+# 以下三个作用于 extract_images_from_runs 得到的段落内容
+OPTION_RE = re.compile(r'^[A-D]\.')
+SUB_MARK_RE = re.compile(r'[（(](\d+)[）)]')
+SUB_STRIP_RE = re.compile(r'[（(]\d+[）)][^（(]*')
+
+_QUESTION_RE = re.compile(r'(\d+)\.(.*?【(?:答案|解析|解答)】)?')
+_SUB_QUESTION_RE = re.compile(r'[(（](\d+)[)）]')
+_PAREN_ANSWER_RE = re.compile(r'\(\s*(\d+)\s*\).*?(?:答案|解析|【解答】)')
+_ANSWER_RE = re.compile(r'【(?:答案|解析|解答)】|(?:答案|解析|解答)[:：]')
+
+
+class SegmentToken(NamedTuple):
+    question: Optional[int] = None
+    sub_question: Optional[int] = None
+    sub_answer: Optional[int] = None
+    answer_start: bool = False
+    answer_title: bool = False
+
+    @property
+    def kind(self) -> str:
+        """主类别，仅用于统计和调试；状态机使用各字段"""
+        if self.question is not None:
+            return "new-question"
+        if self.sub_answer is not None:
+            return "sub-answer"
+        if self.sub_question is not None:
+            return "sub-question"
+        if self.answer_start or self.answer_title:
+            return "answer-start"
+        return "body"
+
+
+EMPTY = SegmentToken()
+
+
+def classify_segment(seg: str) -> SegmentToken:
+    """seg 为 strip 后的非空片段"""
+    c = seg[0]
+    question = sub_question = sub_answer = None
+    answer_start = False
+    if c.isdecimal():  # 与 \d 相同，包括全角数字
+        m = _QUESTION_RE.match(seg)
+        if m:
+            question = int(m.group(1))
+            if m.group(2) is not None:
+                sub_answer = question
+    elif c == "(" or c == "（":
+        m = _SUB_QUESTION_RE.match(seg)
+        if m:
+            sub_question = int(m.group(1))
+        if c == "(":
+            m = _PAREN_ANSWER_RE.match(seg)
+            if m:
+                sub_answer = int(m.group(1))
+    elif c == "【" or c == "答" or c == "解":
+        answer_start = _ANSWER_RE.match(seg) is not None
+    answer_title = len(seg) < 10 and ("答案" in seg or "解析" in seg)
+    return SegmentToken(question, sub_question, sub_answer, answer_start, answer_title)
@@ -0,0 +1,94 @@
+"""
+分阶段打标签：
+1. 第一阶段只给出各维度的二级标签（提示词很短），模型为每个维度选一个二级代码
+2. 第二阶段只发送所选二级标签下的子树，一次请求补全三级、四级标签
+只有一个子标签的层级直接确定，不再询问模型；第二阶段没有需要询问的维度时整次请求跳过。
+第一阶段未能解析的维度在第二阶段按完整子树重新询问。
+
+complete(prompt) -> str 由调用方提供（如 test.call_llm_with_tools），第一阶段可单独指定
+更便宜的 stage1_complete（短提示词的小模型或本地模型）。
+同步场景用 tag()；异步批量场景用 stage1_prompt / stage2_prompt / finish 分步调用。
+"""
+import threading
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from main.prompt_builder import build_prompt, labels_from_paths, parse_codes
+from main.taxonomy import TAXONOMY, children
+
+Paths = Dict[str, Tuple[str, ...]]
+
+
+def extend_determined(dim: str, path: Tuple[str, ...]) -> Tuple[str, ...]:
+    """沿着只有唯一子标签的层级往下补全路径"""
+    while len(children(dim, *path)) == 1:
+        path += (children(dim, *path)[0],)
+    return path
+
+
+class StagedTagger:
+    def __init__(self, complete: Callable[[str], str], dims: Sequence[str] = tuple(TAXONOMY),
+                 with_tools: bool = True, stage1_complete: Optional[Callable[[str], str]] = None):
+        self.complete = complete
+        self.stage1_complete = stage1_complete or complete
+        self.dims = tuple(dims)
+        self.with_tools = with_tools
+        self._lock = threading.Lock()
+        self.stats = {"questions": 0, "stage1_calls": 0, "stage2_calls": 0, "stage2_skipped": 0,
+                      "determined_dims": 0, "parse_failures": 0}
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self.stats[key] += n
+
+    # ---------- 分步接口 ----------
+    def stage1_prompt(self, question_block: str) -> str:
+        self._count("questions")
+        self._count("stage1_calls")
+        return build_prompt(question_block, self.dims, self.with_tools, depth=1)
+
+    def stage2_prompt(self, question_block: str, stage1_reply: str) -> Tuple[Optional[str], Paths]:
+        """
+        解析第一阶段结果，返回 (第二阶段提示词, 已确定的路径)。
+        所有维度都已确定时提示词为 None，直接用 finish(paths) 得到标签。
+        """
+        parsed = parse_codes(stage1_reply, self.dims)
+        if parsed is None:
+            self._count("parse_failures")
+            parsed = {}
+        paths: Paths = {dim: extend_determined(dim, path[:1]) for dim, path in parsed.items()}
+        pending = [d for d in self.dims if d not in paths or children(d, *paths[d])]
+        self._count("determined_dims", len(self.dims) - len(pending))
+        if not pending:
+            self._count("stage2_skipped")
+            return None, paths
+        self._count("stage2_calls")
+        subtrees = {d: paths[d] for d in pending if d in paths}
+        return build_prompt(question_block, pending, self.with_tools, subtrees=subtrees), paths
+
+    def finish(self, paths: Paths, stage2_reply: Optional[str] = None) -> Dict[str, str]:
+        """合并第二阶段结果：代码必须落在第一阶段所选的子树内，否则保留第一阶段的路径"""
+        paths = dict(paths)
+        if stage2_reply is not None:
+            parsed = parse_codes(stage2_reply, self.dims)
+            if parsed is None:
+                self._count("parse_failures")
+                parsed = {}
+            for dim, path in parsed.items():
+                prefix = paths.get(dim, ())
+                if path[:len(prefix)] == prefix and len(path) >= len(prefix):
+                    paths[dim] = extend_determined(dim, path)
+        return labels_from_paths(paths, self.dims)
+
+    # ---------- 同步接口 ----------
+    def tag(self, question_block: str) -> Dict[str, str]:
+        stage1_reply = self.stage1_complete(self.stage1_prompt(question_block))
+        prompt, paths = self.stage2_prompt(question_block, stage1_reply)
+        if prompt is None:
+            return self.finish(paths)
+        return self.finish(paths, self.complete(prompt))
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"分阶段打标签: 题目={s['questions']}, 第一阶段请求={s['stage1_calls']}, "
+                f"第二阶段请求={s['stage2_calls']}（跳过 {s['stage2_skipped']}）, "
+                f"自动确定维度={s['determined_dims']}, 解析失败={s['parse_failures']}")
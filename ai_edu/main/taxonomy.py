@@ -0,0 +1,184 @@
+"""
+六维度标签体系（与 test.py / model_process_image.py 中 PROMPT_TMPL 的文字描述一致），
+以及本地模型 model.py 使用的一级知识模块标签。
+结构：维度 -> {"name": 一级标签, "children": {二级: {三级: [四级, ...]}}}
+"""
+from typing import Callable, Dict, List, Tuple
+
+TAXONOMY_VERSION = "1"
+
+TAXONOMY: Dict[str, Dict] = {
+    "D1": {
+        "name": "知识模块",
+        "children": {
+            "数与式": {
+                "有理数": ["运算律", "绝对值应用", "科学计数法"],
+                "实数": ["无理数识别", "数轴比大小", "根式化简"],
+                "代数式": ["整式运算", "因式分解(4法)", "分式化简"],
+            },
+            "方程不等式": {
+                "线性方程": ["含参方程", "应用题建模", "解的关系"],
+                "二次方程": ["判别式应用", "韦达定理", "整数根问题"],
+                "不等式": ["含参不等式组", "绝对值不等式", "区域解"],
+            },
+            "函数": {
+                "初等函数": ["待定系数法", "函数性质综合", "参数影响"],
+                "图像分析": ["交点问题", "动态图像", "最值区域"],
+            },
+            "几何性质": {
+                "三角形": ["全等模型", "相似模型", "勾股定理应用"],
+                "四边形": ["判定定理", "对角线性质", "中点四边形"],
+                "圆": ["垂径定理", "圆周角定理", "切线长定理"],
+            },
+            "几何变换": {
+                "对称变换": ["折叠问题", "对称最值", "性质应用"],
+                "旋转变换": ["旋转构图", "轨迹分析", "综合变换"],
+            },
+        },
+    },
+    "D2": {
+        "name": "认知操作",
+        "children": {
+            "识别再现": {
+                "概念识别": ["直接辨认定义/定理"],
+                "公式调用": ["直接套用公式计算结果"],
+            },
+            "关联转换": {
+                "符号·图形互译": ["函数式↔图像特征", "几何条件↔方程"],
+                "条件等价转换": ["换元法", "参数消去", "等量代换"],
+            },
+            "推理论证": {
+                "直接演绎": ["定理链式推导(≤3步)"],
+                "复杂演绎": ["多分支证明(2–4步以上)"],
+                "归纳类比": ["从特例总结规律/结构类比迁移"],
+            },
+            "建模求解": {
+                "问题数学化": ["实际问题→数学模型(方程/函数)"],
+                "模型优化": ["参数调整", "约束条件处理"],
+            },
+            "批判验证": {
+                "解域检验": ["范围验证(定义域/几何约束)"],
+                "反例构造": ["举反例证伪命题"],
+            },
+        },
+    },
+    "D3": {
+        "name": "解题策略",
+        "children": {
+            "直接策略": {
+                "公式代入法": ["直接套用公式(如求根公式)"],
+                "定理直推法": ["使用单一定理直接推导"],
+            },
+            "构造策略": {
+                "辅助线构造": ["几何—做平行线/补形/倍长中线"],
+                "辅助函数法": ["引入新函数(如判别式构造)"],
+                "参数设定法": ["设未知参数简化关系"],
+            },
+            "转化策略": {
+                "等价转化法": ["同解变形/等面积转换"],
+                "数形转换法": ["代数问题几何化/几何问题坐标化"],
+                "降维分解法": ["高次→低次、复合→基本"],
+            },
+            "分类策略": {
+                "参数分类法": ["依据参数取值讨论(k存在性等)"],
+                "位置分类法": ["几何动态点位置分类"],
+            },
+            "逆向策略": {
+                "反证法": ["假设结论不成立推导矛盾"],
+                "逆推分析法": ["从结论反向寻找条件"],
+            },
+        },
+    },
+    "D4": {
+        "name": "数学思想",
+        "children": {
+            "数形结合": {
+                "以数解形": ["坐标系解几何问题"],
+                "以形助数": ["图像法解代数最值"],
+            },
+            "分类讨论": {
+                "概念分类": ["定义域分类(如绝对值)"],
+                "过程分类": ["多情况解题路径"],
+            },
+            "转化化归": {
+                "等价化归": ["复杂→简单(如换元)"],
+                "特殊化归": ["一般→特殊(如极端位置)"],
+            },
+            "函数方程": {
+                "函数思想": ["动态问题函数建模"],
+                "方程思想": ["等量关系建模"],
+            },
+            "极限思想": {
+                "边界分析": ["取值范围临界点"],
+                "逼近思想": ["无限逼近精确解"],
+            },
+        },
+    },
+    "D5": {
+        "name": "作答形式",
+        "children": {
+            "客观题型": {
+                "单选题": ["唯一正确答案"],
+                "多选题": ["多选全对得分"],
+                "填空题": ["结果唯一性"],
+            },
+            "主观题型": {
+                "计算题": ["过程分步骤赋分"],
+                "证明题": ["逻辑链完整性评分"],
+                "探究题": ["创新性解法加分"],
+            },
+        },
+    },
+    "D6": {
+        "name": "难度控制",
+        "children": {
+            "知识量": {
+                "单点知识": ["仅1个核心知识点"],
+                "双知识链": ["2个知识点串联"],
+                "多模块综合": ["2–3个模块知识交织"],
+            },
+            "思维步数": {
+                "直接步骤(≤3)": ["≤3步，无需转化"],
+                "中等步骤(4–5)": ["4–5步，含1–2次转化"],
+                "复杂步骤(>6)": ["多数转化+构造（如23次转化+构造）"],
+            },
+            "障碍密度": {
+                "无干扰项": ["条件直给"],
+                "单一干扰": ["1个隐含条件/陷阱"],
+                "多重干扰": ["≥2个干扰项+临界分析"],
+            },
+        },
+    },
+}
+
+# model.py 本地模型只判断一级知识模块
+LOCAL_L1_LABELS = ["数与代数", "图形与几何", "统计与概率"]
+
+# 约束解码的字段描述：(键名, 根据已选值返回候选值列表的函数)
+Field = Tuple[str, Callable[[Dict[str, str]], List[str]]]
+
+
+def children(dim: str, *path: str) -> List[str]:
+    """返回某维度下给定路径的子标签列表，路径无效时返回空列表"""
+    node = TAXONOMY[dim]["children"]
+    for name in path:
+        if not isinstance(node, dict) or name not in node:
+            return []
+        node = node[name]
+    return list(node)
+
+
+def taxonomy_fields(dims=tuple(TAXONOMY)) -> List[Field]:
+    """六维度标签的字段序列：L1 固定，L2/L3/L4 依次取上一级所选标签的子节点"""
+    fields: List[Field] = []
+    for dim in dims:
+        fields.append((f"{dim}_L1", lambda v, d=dim: [TAXONOMY[d]["name"]]))
+        fields.append((f"{dim}_L2", lambda v, d=dim: children(d)))
+        fields.append((f"{dim}_L3", lambda v, d=dim: children(d, v[f"{d}_L2"])))
+        fields.append((f"{dim}_L4", lambda v, d=dim: children(d, v[f"{d}_L2"], v[f"{d}_L3"])))
+    return fields
+
+
+def local_l1_fields() -> List[Field]:
+    """model.py 的输出格式：L1 取一级知识模块，L2-L4 留空"""
+    return [("L1", lambda v: LOCAL_L1_LABELS)] + [(k, lambda v: [""]) for k in ("L2", "L3", "L4")]
@@ -1,11 +1,10 @@
 import json, os, re, time, pathlib, sys
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any
 import docx
 from docx.document import Document as DocxDocument
 from docx.parts.image import ImagePart
 import io
 from PIL import Image
-from openai import OpenAI
 from tqdm import tqdm
 from dotenv import load_dotenv
 import base64
@@ -21,6 +20,14 @@ print(f"添加路径: {MODEL_DIR.parent}")
 # 导入与model_process_image.py相同的VisionDescribe工具
 try:
     from model.vision_tool import VisionDescribe
+    from model.tool_executor import run_tool_calls
+    from model.transport import LATENCY, get_openai_client
+    from model.usage_ledger import LEDGER
+    from main.async_runner import run_tagging
+    from main.checkpoint import CheckpointLog, apply_checkpoint, compact
+    from main.prompt_builder import build_prompt as build_compact_prompt, decode_reply
+    from main.staged_tagger import StagedTagger
+    from main.question_cache import QuestionCache, tagger_key
     vision_tool = VisionDescribe()
     print("成功导入VisionDescribe工具")
 except Exception as e:
@@ -34,14 +41,9 @@ try:
 except Exception as e:
     print(f"VisionTool连接测试失败: {e}")
 
-total_prompt_tokens = 0
-total_completion_tokens = 0
-total_tokens = 0
 
-client = OpenAI(
-    api_key = os.getenv("QWEN_KEY"),
-    base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1",
-)
+# 与 VisionDescribe 共用连接池配置和延迟统计
+client = get_openai_client()
 
 # 输入文件和输出目录
 QUESTIONS_JSON = r"E:\NLP_Model\ai_edu\data\processed_data\suzhou2024\suzhou2024_questions.json"
@@ -49,6 +51,16 @@ ANSWERS_JSON = r"E:\NLP_Model\ai_edu\data\processed_data\suzhou2024\suzhou2024_q
 OUTPUT_DIR = r"E:\NLP_Model\ai_edu\data\processed_data\suzhou2024"
 JSON_OUT = os.path.join(OUTPUT_DIR, "suzhou2024_labeled_question.json")
 IMAGES_DIR = os.path.join(OUTPUT_DIR, "images")
+USAGE_CSV = os.path.join(OUTPUT_DIR, "suzhou2024_usage.csv")  # 每次请求/工具调用的用量明细
+CHECKPOINT_LOG = os.path.join(OUTPUT_DIR, "suzhou2024_labeled_question.ckpt.jsonl")  # 断点日志，重启时据此续跑
+MODEL_NAME = "qwen-plus"
+PROMPT_MODE = "full"  # full：使用下方 PROMPT_TMPL；compact：main.prompt_builder 的紧凑代码编码（解析率/准确率尚未评估，按需启用）
+TAGGING_MODE = "monolithic"  # monolithic：一次请求全部维度；staged：main.staged_tagger 分阶段打标签
+ASYNC_MODE = False  # True 时使用 main.async_runner 并发打标签
+ASYNC_CONCURRENCY = 16
+# 跨试卷共享的题目缓存，相同模型和提示词下相同/近似题目直接复用标签；设为 None 关闭
+QUESTION_CACHE_PATH = r"E:\NLP_Model\ai_edu\data\processed_data\question_cache.jsonl"
+REUSE_THRESHOLD = 1.0  # 近似复用的最低相似度（需高于 0.875，如 0.9），1.0 只复用完全相同的题目
 
 # 确保输出目录存在
 os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -458,29 +470,94 @@ def build_answer_block(q: Dict) -> str:
     
     return answer_content
 
-def call_llm_with_tools(prompt: str, max_retry: int = 3) -> str:
-    """调用支持工具的LLM - 支持从images目录读取图片"""
-    global total_completion_tokens, total_prompt_tokens, total_tokens
-
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "vision_describe",
-                "description": "分析数学题目或答案图片，识别其中的文本内容、数学公式、几何图形、解题步骤等",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "image_path": {
-                            "type": "string",
-                            "description": "图片文件路径或占位符"
-                        }
-                    },
-                    "required": ["image_path"]
-                }
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "vision_describe",
+            "description": "分析数学题目或答案图片，识别其中的文本内容、数学公式、几何图形、解题步骤等",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "image_path": {
+                        "type": "string",
+                        "description": "图片文件路径或占位符"
+                    }
+                },
+                "required": ["image_path"]
             }
         }
-    ]
+    }
+]
+
+def handle_tool_call(tool_call) -> Dict:
+    """执行单个 vision_describe 工具调用，返回要追加到消息历史的 tool 消息"""
+    if tool_call.function.name != "vision_describe":
+        return None
+    args = {}
+    try:
+        print(f"调用工具参数: {tool_call.function.arguments}")
+        args = json.loads(tool_call.function.arguments)
+        image_placeholder = args["image_path"]
+        
+        # 清理图片占位符，获取实际文件名
+        image_filename = image_placeholder
+        if image_filename.startswith("[IMG:") and image_filename.endswith("]"):
+            image_filename = image_filename[5:-1]
+        
+        # 在images目录中查找图片
+        full_image_path = os.path.join(IMAGES_DIR, image_filename)
+        
+        # 如果直接路径不存在，尝试不同的扩展名
+        if not os.path.exists(full_image_path):
+            base_name = os.path.splitext(image_filename)[0]
+            for ext in ['.png', '.jpg', '.jpeg', '.bmp', '.gif']:
+                test_path = os.path.join(IMAGES_DIR, base_name + ext)
+                if os.path.exists(test_path):
+                    full_image_path = test_path
+                    break
+        
+        print(f"分析图片: {full_image_path}")
+        
+        if not os.path.exists(full_image_path):
+            error_msg = f"图片文件不存在: {full_image_path}"
+            print(error_msg)
+            tool_result = json.dumps({
+                "error": error_msg,
+                "image_path": image_placeholder
+            }, ensure_ascii=False)
+        else:
+            # 调用vision工具
+            vision_params = json.dumps({"image_path": full_image_path})
+            tool_result = vision_tool.call(vision_params)
+            print(f"工具返回结果长度: {len(tool_result)}")
+            print(f"工具返回结果前200字符: {tool_result[:200]}")
+
+        # 添加工具调用结果到消息历史
+        return {
+            "tool_call_id": tool_call.id,
+            "role": "tool",
+            "content": tool_result
+        }
+
+    except Exception as e:
+        print(f"工具调用失败: {e}")
+        import traceback
+        traceback.print_exc()
+        
+        error_result = json.dumps({
+            "error": f"图片分析失败: {str(e)}",
+            "image_path": args.get("image_path", "unknown")
+        }, ensure_ascii=False)
+        
+        return {
+            "tool_call_id": tool_call.id,
+            "role": "tool",
+            "content": error_result
+        }
+
+def call_llm_with_tools(prompt: str, max_retry: int = 3) -> str:
+    """调用支持工具的LLM - 支持从images目录读取图片"""
 
     for attempt in range(max_retry):
         try:
@@ -488,10 +565,11 @@ def call_llm_with_tools(prompt: str, max_retry: int = 3) -> str:
             print(f"发送请求到LLM (尝试 {attempt + 1}/{max_retry})")
 
             while True:
+                start = time.perf_counter()
                 resp = client.chat.completions.create(
-                    model="qwen-plus",
+                    model=MODEL_NAME,
                     messages=messages,
-                    tools=tools,
+                    tools=TOOLS,
                     tool_choice="auto",
                     temperature=0.0,
                     max_tokens=4096
@@ -500,84 +578,21 @@ def call_llm_with_tools(prompt: str, max_retry: int = 3) -> str:
                 message = resp.choices[0].message
                 messages.append(message)
 
-                # 统计token
+                # 统计token与耗时
+                LEDGER.record_chat(MODEL_NAME, getattr(resp, "usage", None), time.perf_counter() - start)
                 if hasattr(resp, 'usage') and resp.usage:
-                    prompt_tokens = resp.usage.prompt_tokens
-                    completion_tokens = resp.usage.completion_tokens
-                    total_tokens_used = resp.usage.total_tokens
-
-                    total_prompt_tokens += prompt_tokens
-                    total_completion_tokens += completion_tokens
-                    total_tokens += total_tokens_used
-                    print(f"Token使用: prompt={prompt_tokens}, completion={completion_tokens}")
+                    print(f"Token使用: prompt={resp.usage.prompt_tokens}, completion={resp.usage.completion_tokens}")
 
                 # 处理工具调用
                 if message.tool_calls:
                     print(f"检测到 {len(message.tool_calls)} 个工具调用")
                     
-                    for tool_call in message.tool_calls:
-                        if tool_call.function.name == "vision_describe":
-                            try:
-                                print(f"调用工具参数: {tool_call.function.arguments}")
-                                args = json.loads(tool_call.function.arguments)
-                                image_placeholder = args["image_path"]
-                                
-                                # 清理图片占位符，获取实际文件名
-                                image_filename = image_placeholder
-                                if image_filename.startswith("[IMG:") and image_filename.endswith("]"):
-                                    image_filename = image_filename[5:-1]
-                                
-                                # 在images目录中查找图片
-                                full_image_path = os.path.join(IMAGES_DIR, image_filename)
-                                
-                                # 如果直接路径不存在，尝试不同的扩展名
-                                if not os.path.exists(full_image_path):
-                                    base_name = os.path.splitext(image_filename)[0]
-                                    for ext in ['.png', '.jpg', '.jpeg', '.bmp', '.gif']:
-                                        test_path = os.path.join(IMAGES_DIR, base_name + ext)
-                                        if os.path.exists(test_path):
-                                            full_image_path = test_path
-                                            break
-                                
-                                print(f"分析图片: {full_image_path}")
-                                
-                                if not os.path.exists(full_image_path):
-                                    error_msg = f"图片文件不存在: {full_image_path}"
-                                    print(error_msg)
-                                    tool_result = json.dumps({
-                                        "error": error_msg,
-                                        "image_path": image_placeholder
-                                    }, ensure_ascii=False)
-                                else:
-                                    # 调用vision工具
-                                    vision_params = json.dumps({"image_path": full_image_path})
-                                    tool_result = vision_tool.call(vision_params)
-                                    print(f"工具返回结果长度: {len(tool_result)}")
-                                    print(f"工具返回结果前200字符: {tool_result[:200]}")
-
-                                # 添加工具调用结果到消息历史
-                                messages.append({
-                                    "tool_call_id": tool_call.id,
-                                    "role": "tool",
-                                    "content": tool_result
-                                })
-
-                            except Exception as e:
-                                print(f"工具调用失败: {e}")
-                                import traceback
-                                traceback.print_exc()
-                                
-                                error_result = json.dumps({
-                                    "error": f"图片分析失败: {str(e)}",
-                                    "image_path": args.get("image_path", "unknown")
-                                }, ensure_ascii=False)
-                                
-                                messages.append({
-                                    "tool_call_id": tool_call.id,
-                                    "role": "tool",
-                                    "content": error_result
-                                })
-                    
+                    # 同一轮的多个工具调用并发执行，结果按 tool_call_id 原顺序追加
+                    tool_messages, elapsed = run_tool_calls(message.tool_calls, handle_tool_call)
+                    messages.extend(tool_messages)
+                    LEDGER.record("tool_turn", "parallel", latency=elapsed)
+                    print(f"本轮 {len(message.tool_calls)} 个工具调用耗时 {elapsed:.2f}s")
+
                     # 继续对话，让模型基于工具结果生成最终答案
                     print("继续对话，等待最终答案...")
                     continue
@@ -653,6 +668,128 @@ def safe_json_line(s: str) -> Dict:
             "D6_L1": "难度控制", "D6_L2": "解析失败", "D6_L3": "解析失败"
         }
 
+FAILED_LABEL = {
+    "D1_L1": "知识模块", "D1_L2": "处理失败", "D1_L3": "处理失败",
+    "D2_L1": "认知操作", "D2_L2": "处理失败", "D2_L3": "处理失败",
+    "D3_L1": "解题策略", "D3_L2": "处理失败", "D3_L3": "处理失败",
+    "D4_L1": "数学思想", "D4_L2": "处理失败", "D4_L3": "处理失败",
+    "D5_L1": "作答形式", "D5_L2": "处理失败", "D5_L3": "处理失败",
+    "D6_L1": "难度控制", "D6_L2": "处理失败", "D6_L3": "处理失败"
+}
+
+def build_prompt(q: Dict) -> str:
+    """按 PROMPT_MODE 构造单道题的提示词"""
+    if PROMPT_MODE == "compact":
+        return build_compact_prompt(build_question_block(q))
+    return PROMPT_TMPL.format(
+        QUESTION_BLOCK=build_question_block(q),
+        ANSWER_BLOCK=build_answer_block(q)  # 答案块
+    )
+
+def parse_label(raw: str) -> Dict:
+    """紧凑模式先按标签代码解码，失败时退回 safe_json_line"""
+    if PROMPT_MODE == "compact":
+        label = decode_reply(raw)
+        if label is not None:
+            return label
+    return safe_json_line(raw)
+
+def is_labeled(q: Dict) -> bool:
+    """题目是否已有有效标签（未分类/失败的需要重新标注）"""
+    return bool(q.get('label')) and q['label'].get('D1_L2') not in ['未分类', '处理失败', '解析失败']
+
+def prompt_template() -> str:
+    """当前 TAGGING_MODE / PROMPT_MODE 下与题目无关的提示词模板，题目缓存只复用同一模板给出的标签"""
+    if TAGGING_MODE == "staged":
+        return "staged\0" + build_compact_prompt("", depth=1)
+    return build_compact_prompt("") if PROMPT_MODE == "compact" else PROMPT_TMPL
+
+question_cache = QuestionCache(QUESTION_CACHE_PATH, IMAGES_DIR, REUSE_THRESHOLD,
+                               tagger_key(MODEL_NAME, prompt_template())) if QUESTION_CACHE_PATH else None
+
+def reuse_cached_label(q: Dict) -> bool:
+    """题目缓存命中时直接写入复用的标签（带 _reused_from / _similarity 审计字段）"""
+    if question_cache is None:
+        return False
+    hit = question_cache.lookup(build_question_block(q))
+    if hit is None:
+        return False
+    q["label"] = hit.reused_label()
+    LEDGER.record("cache", "question_cache", cached=True)
+    print(f"题目 {q.get('id', 'unknown')} 复用 {hit.source} 的标签 (相似度 {hit.similarity:.2f})")
+    return True
+
+def remember_label(q: Dict):
+    if question_cache is not None:
+        question_cache.add(build_question_block(q), q["label"],
+                           f"{os.path.basename(QUESTIONS_JSON)}#{q.get('id')}")
+
+# 分阶段打标签：先选二级标签，再只发送所选分支的子树
+staged_tagger = StagedTagger(call_llm_with_tools)
+ASYNC_KWARGS = dict(model=MODEL_NAME, tools=TOOLS, concurrency=ASYNC_CONCURRENCY,
+                    temperature=0.0, max_tokens=4096)
+
+def main_async(questions: List[Dict], ckpt: CheckpointLog):
+    """并发为尚未成功标注的题目打标签，每完成一道立即写入断点日志"""
+    pending = []
+    for q in questions:
+        if is_labeled(q):
+            continue
+        if reuse_cached_label(q):
+            ckpt.append(q["id"], q["label"])
+        else:
+            pending.append(q)
+    print(f"异步模式: 待标注 {len(pending)} 题，并发 {ASYNC_CONCURRENCY}")
+
+    def save(q: Dict, label: Dict):
+        q["label"] = label
+        ckpt.append(q["id"], q["label"])
+        remember_label(q)
+
+    def fail(q: Dict, e: Exception):
+        print(f"处理题目 {q.get('id', 'unknown')} 失败: {e}")
+        save(q, dict(FAILED_LABEL))
+
+    if TAGGING_MODE == "staged":
+        main_async_staged(pending, save, fail)
+        return
+
+    def on_result(idx: int, raw):
+        if isinstance(raw, Exception):
+            fail(pending[idx], raw)
+        else:
+            save(pending[idx], parse_label(raw))
+
+    run_tagging([build_prompt(q) for q in pending], handle_tool_call,
+                keys=[q.get("id") for q in pending], on_result=on_result, **ASYNC_KWARGS)
+
+def main_async_staged(pending: List[Dict], save: Callable, fail: Callable):
+    """分阶段模式的异步版本：第一阶段全部完成后，只为仍需细分的题目发起第二阶段"""
+    blocks = [build_question_block(q) for q in pending]
+    replies = run_tagging([staged_tagger.stage1_prompt(b) for b in blocks], handle_tool_call,
+                          keys=[q.get("id") for q in pending], desc="第一阶段", **ASYNC_KWARGS)
+    second = []  # (题目, 第二阶段提示词, 第一阶段确定的路径)
+    for q, block, reply in zip(pending, blocks, replies):
+        if isinstance(reply, Exception):
+            fail(q, reply)
+            continue
+        prompt, paths = staged_tagger.stage2_prompt(block, reply)
+        if prompt is None:
+            save(q, staged_tagger.finish(paths))
+        else:
+            second.append((q, prompt, paths))
+
+    def on_result(idx: int, raw):
+        q, _, paths = second[idx]
+        if isinstance(raw, Exception):
+            fail(q, raw)
+        else:
+            save(q, staged_tagger.finish(paths, raw))
+
+    run_tagging([prompt for _, prompt, _ in second], handle_tool_call,
+                keys=[q.get("id") for q, _, _ in second], on_result=on_result,
+                desc="第二阶段", **ASYNC_KWARGS)
+
 def main():
     print("开始处理已提取的JSON数据...")
     
@@ -672,85 +809,98 @@ def main():
     else:
         image_files = os.listdir(IMAGES_DIR)
         print(f"图片目录包含 {len(image_files)} 个文件")
+
+    # 回放断点日志，已标注的题目不再请求
+    ckpt = CheckpointLog(CHECKPOINT_LOG)
+    restored = apply_checkpoint(questions, ckpt.replay())
+    if restored:
+        print(f"从断点日志恢复 {restored} 道题目的标签: {CHECKPOINT_LOG}")
     
-    # 为每道题目打标签
-    for i, q in enumerate(questions):
-        try:
-            print(f"\n{'='*60}")
-            print(f"处理题目 {i+1}/{len(questions)}: ID={q.get('id', 'unknown')}")
-            
-            # 显示题目和答案图片信息
-            if q.get('question_images'):
-                print(f"题目图片: {', '.join(q['question_images'])}")
-                for img in q['question_images']:
-                    img_path = os.path.join(IMAGES_DIR, img)
-                    if os.path.exists(img_path):
-                        img_size = os.path.getsize(img_path)
-                        print(f"  ✓ {img} 存在 (大小: {img_size/1024:.1f}KB)")
-                    else:
-                        print(f"  ✗ {img} 不存在")
-            
-            if q.get('answer_images'):
-                print(f"答案图片: {', '.join(q['answer_images'])}")
-                for img in q['answer_images']:
-                    img_path = os.path.join(IMAGES_DIR, img)
-                    if os.path.exists(img_path):
-                        img_size = os.path.getsize(img_path)
-                        print(f"  ✓ {img} 存在 (大小: {img_size/1024:.1f}KB)")
-                    else:
-                        print(f"  ✗ {img} 不存在")
+    if ASYNC_MODE:
+        main_async(questions, ckpt)
+    else:
+        # 为每道题目打标签
+        for i, q in enumerate(questions):
+            LEDGER.set_question(q.get("id"))
+            try:
+                print(f"\n{'='*60}")
+                print(f"处理题目 {i+1}/{len(questions)}: ID={q.get('id', 'unknown')}")
             
-            # 跳过已经处理过的题目
-            if q.get('label') and q['label'].get('D1_L2') not in ['未分类', '处理失败', '解析失败']:
-                print(f"题目已处理过，跳过: {q['label']['D1_L2']}, {q['label']['D5_L2']}")
-                continue
+                # 显示题目和答案图片信息
+                if q.get('question_images'):
+                    print(f"题目图片: {', '.join(q['question_images'])}")
+                    for img in q['question_images']:
+                        img_path = os.path.join(IMAGES_DIR, img)
+                        if os.path.exists(img_path):
+                            img_size = os.path.getsize(img_path)
+                            print(f"  ✓ {img} 存在 (大小: {img_size/1024:.1f}KB)")
+                        else:
+                            print(f"  ✗ {img} 不存在")
             
-            # 构建包含题目和答案的prompt
-            question_block = build_question_block(q)
-            answer_block = build_answer_block(q)  # 注释掉答案块构建
-            prompt = PROMPT_TMPL.format(
-                QUESTION_BLOCK=question_block,
-                ANSWER_BLOCK=answer_block  # 答案块
-            )
+                if q.get('answer_images'):
+                    print(f"答案图片: {', '.join(q['answer_images'])}")
+                    for img in q['answer_images']:
+                        img_path = os.path.join(IMAGES_DIR, img)
+                        if os.path.exists(img_path):
+                            img_size = os.path.getsize(img_path)
+                            print(f"  ✓ {img} 存在 (大小: {img_size/1024:.1f}KB)")
+                        else:
+                            print(f"  ✗ {img} 不存在")
             
-            print("调用LLM进行标注...")
-            raw_response = call_llm_with_tools(prompt)
+                # 跳过已经处理过的题目
+                if is_labeled(q):
+                    print(f"题目已处理过，跳过: {q['label']['D1_L2']}, {q['label']['D5_L2']}")
+                    continue
+
+                # 相同/近似题目已标注过时直接复用
+                if reuse_cached_label(q):
+                    ckpt.append(q["id"], q["label"])
+                    continue
             
-            # 解析结果
-            q["label"] = safe_json_line(raw_response)
-            print(f"标注完成: {q['label']['D1_L2']}, {q['label']['D5_L2']}")
+                print("调用LLM进行标注...")
+                if TAGGING_MODE == "staged":
+                    q["label"] = staged_tagger.tag(build_question_block(q))
+                else:
+                    # 构建包含题目和答案的prompt
+                    prompt = build_prompt(q)
+                    raw_response = call_llm_with_tools(prompt)
+                    # 解析结果
+                    q["label"] = parse_label(raw_response)
+                print(f"标注完成: {q['label']['D1_L2']}, {q['label']['D5_L2']}")
             
-            # 每处理一个题目就保存一次结果
-            with open(JSON_OUT, 'w', encoding='utf-8') as f:
-                json.dump(questions, f, ensure_ascii=False, indent=2)
-                print(f"中间结果已保存到: {JSON_OUT}")
+                # 每处理一个题目追加一行断点日志
+                ckpt.append(q["id"], q["label"])
+                remember_label(q)
             
-        except Exception as e:
-            print(f"处理题目失败: {e}")
-            import traceback
-            traceback.print_exc()
+            except Exception as e:
+                print(f"处理题目失败: {e}")
+                import traceback
+                traceback.print_exc()
             
-            q["label"] = {
-                "D1_L1": "知识模块", "D1_L2": "处理失败", "D1_L3": "处理失败",
-                "D2_L1": "认知操作", "D2_L2": "处理失败", "D2_L3": "处理失败",
-                "D3_L1": "解题策略", "D3_L2": "处理失败", "D3_L3": "处理失败",
-                "D4_L1": "数学思想", "D4_L2": "处理失败", "D4_L3": "处理失败",
-                "D5_L1": "作答形式", "D5_L2": "处理失败", "D5_L3": "处理失败",
-                "D6_L1": "难度控制", "D6_L2": "处理失败", "D6_L3": "处理失败"
-            }
+                q["label"] = dict(FAILED_LABEL)
+                ckpt.append(q["id"], q["label"])
 
-    # 保存最终结果
-    with open(JSON_OUT, 'w', encoding='utf-8') as f:
-        json.dump(questions, f, ensure_ascii=False, indent=2)
+    # 由内存中的完整结果一次性生成最终 JSON
+    ckpt.close()
+    compact(questions, JSON_OUT)
 
     # 输出统计信息
     print(f"\n{'='*60}")
     print("处理完成统计:")
     print(f"总题目数: {len(questions)}")
     print(f"Token使用:")
-    print(f"  提示tokens: {total_prompt_tokens}")
-    print(f"  完成tokens: {total_completion_tokens}")
-    print(f"  总tokens: {total_tokens}")
+    print(LEDGER.summary())
+    if TAGGING_MODE == "staged":
+        print(staged_tagger.summary())
+    if question_cache is not None:
+        question_cache.close()
+        print(question_cache.summary())
+    LEDGER.to_csv(USAGE_CSV)
+    print(f"用量明细已保存到: {USAGE_CSV}")
+    latency_report = LATENCY.summary()
+    if latency_report:
+        print("接口延迟:")
+        print(latency_report)
     print(f"结果保存到: {JSON_OUT}")
 
     # 输出标签统计
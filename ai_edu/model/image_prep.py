@@ -0,0 +1,155 @@
+"""
+上传视觉模型前的图片预处理：
+- 按文件内容识别真实格式，给出正确的 MIME（不再一律标成 image/jpeg）
+- 超过 MAX_SIDE / MAX_PIXELS 时等比缩小，宽高取 28 的倍数（Qwen-VL 14px patch × 2x2 合并）
+- 颜色少的线稿/公式图保存为调色板 PNG，照片类保存为 JPEG
+- 处理结果按内容 hash 缓存在内存中，同一张图只处理一次
+"""
+import base64
+import hashlib
+import io
+import math
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+MAX_SIDE = 1288                  # 最长边上限（46 * 28）
+MAX_PIXELS = 1024 * 28 * 28      # 像素预算，约 1024 个视觉 token
+PATCH = 28                       # Qwen-VL 一个视觉 token 覆盖 28x28 像素
+JPEG_QUALITY = 90
+PALETTE_COLORS = 256             # 颜色数不超过该值时按调色板 PNG 无损保存
+CACHE_MAX_BYTES = 128 * 1024 * 1024
+# 预处理参数签名，写入响应缓存键，参数变化后旧的描述结果自动失效
+PREP_SIGNATURE = f"prep-v1:{MAX_SIDE}:{MAX_PIXELS}:{JPEG_QUALITY}:{PALETTE_COLORS}"
+
+_MAGIC = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"RIFF", "image/webp"),
+]
+
+
+class PreparedImage(NamedTuple):
+    data: bytes
+    mime: str
+    width: int
+    height: int
+    orig_bytes: int
+
+    def data_url(self) -> str:
+        return f"data:{self.mime};base64,{base64.b64encode(self.data).decode('utf-8')}"
+
+    @property
+    def vision_tokens(self) -> int:
+        """按 28x28 一个 token 估算的视觉 token 数"""
+        return math.ceil(self.width / PATCH) * math.ceil(self.height / PATCH)
+
+
+def sniff_mime(raw: bytes) -> str:
+    """按文件头识别格式，无法识别时退回 application/octet-stream"""
+    for magic, mime in _MAGIC:
+        if raw.startswith(magic):
+            return mime
+    return "application/octet-stream"
+
+
+def target_size(width: int, height: int):
+    """超出上限时等比缩小到 MAX_SIDE / MAX_PIXELS 以内，并向下取整到 PATCH 的倍数；否则原样返回"""
+    scale = min(1.0, MAX_SIDE / max(width, height), math.sqrt(MAX_PIXELS / (width * height)))
+    if scale >= 1.0:
+        return width, height
+    return (max(PATCH, int(width * scale) // PATCH * PATCH),
+            max(PATCH, int(height * scale) // PATCH * PATCH))
+
+
+def _encode(img) -> PreparedImage:
+    """颜色少的图（公式、几何图）转调色板 PNG 无损保存，其余转 JPEG"""
+    buf = io.BytesIO()
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        if img.getchannel("A").getextrema()[0] < 255:
+            # 透明背景铺白，避免被当成黑底
+            from PIL import Image
+            bg = Image.new("RGB", img.size, (255, 255, 255))
+            bg.paste(img, mask=img.getchannel("A"))
+            img = bg
+    img = img.convert("RGB") if img.mode != "L" else img
+    if img.getcolors(PALETTE_COLORS) is not None:
+        img.quantize(PALETTE_COLORS).save(buf, format="PNG", optimize=True)
+        mime = "image/png"
+    else:
+        img.save(buf, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+        mime = "image/jpeg"
+    return PreparedImage(buf.getvalue(), mime, img.width, img.height, 0)
+
+
+class ImagePrep:
+    """带 LRU 缓存（按字节数限额）的预处理器，线程安全"""
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # sha256 -> PreparedImage
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def prepare_bytes(self, raw: bytes) -> PreparedImage:
+        key = hashlib.sha256(raw).hexdigest()
+        with self._lock:
+            prep = self._entries.get(key)
+            if prep is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if prep is None:
+            prep = self._prepare(raw)
+            with self._lock:
+                self.misses += 1
+                if key not in self._entries and len(prep.data) <= self.max_bytes:
+                    self._entries[key] = prep
+                    self._bytes += len(prep.data)
+                    while self._bytes > self.max_bytes:
+                        _, evicted = self._entries.popitem(last=False)
+                        self._bytes -= len(evicted.data)
+        with self._lock:
+            self.bytes_in += len(raw)
+            self.bytes_out += len(prep.data)
+        return prep
+
+    def prepare(self, path) -> PreparedImage:
+        with open(path, "rb") as f:
+            return self.prepare_bytes(f.read())
+
+    def _prepare(self, raw: bytes) -> PreparedImage:
+        from PIL import Image
+        try:
+            with Image.open(io.BytesIO(raw)) as img:
+                img.load()
+                fmt = (img.format or "").upper()
+                width, height = img.size
+                size = target_size(width, height)
+                if size != (width, height):
+                    img = img.resize(size, Image.LANCZOS)
+                elif fmt in ("PNG", "JPEG"):
+                    # 尺寸合规的 PNG/JPEG 直接上传原文件，只修正 MIME
+                    return PreparedImage(raw, Image.MIME[fmt], width, height, len(raw))
+                prep = _encode(img)
+        except Exception:
+            # PIL 无法解码（如未栅格化的 WMF），原样上传
+            return PreparedImage(raw, sniff_mime(raw), 0, 0, len(raw))
+        if len(prep.data) >= len(raw) and size == (width, height):
+            # 重新编码没有变小（如已压缩好的 GIF/WebP），保留原文件
+            return PreparedImage(raw, Image.MIME.get(fmt) or sniff_mime(raw), width, height, len(raw))
+        return prep._replace(orig_bytes=len(raw))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                    "bytes_in": self.bytes_in, "bytes_out": self.bytes_out}
+
+
+IMAGE_PREP = ImagePrep()
@@ -0,0 +1,89 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+DEFAULT_TTL = 30 * 24 * 3600          # 30 天
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 256MB
+
+
+def make_key(image_bytes: bytes, model: str, prompt: str, variant: str = "") -> str:
+    """缓存键：图片内容 hash + 模型名 + 提示词 + 预处理签名等附加信息"""
+    h = hashlib.sha256()
+    h.update(hashlib.sha256(image_bytes).digest())
+    h.update(model.encode("utf-8") + b"\0" + prompt.encode("utf-8"))
+    if variant:
+        h.update(b"\0" + variant.encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """
+    基于 SQLite 的持久化响应缓存：
+    - 条目超过 ttl 秒视为过期
+    - 总字节数超过 max_bytes 时按最近访问时间淘汰
+    线程安全，可在并发工具调用中共享。
+    """
+
+    def __init__(self, path, ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   key      TEXT PRIMARY KEY,
+                   value    TEXT NOT NULL,
+                   created  REAL NOT NULL,
+                   accessed REAL NOT NULL,
+                   size     INTEGER NOT NULL
+               )"""
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, value, now, now, size),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """删除过期条目，再按最近访问时间淘汰到 max_bytes 以内"""
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed ASC"
+        ).fetchall():
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def close(self):
+        self._conn.close()
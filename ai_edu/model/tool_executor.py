@@ -0,0 +1,24 @@
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+TOOL_CONCURRENCY = 4  # 单轮工具调用的最大并发数
+
+
+def run_tool_calls(tool_calls, handler: Callable[[object], Optional[dict]],
+                   max_workers: int = TOOL_CONCURRENCY) -> Tuple[List[dict], float]:
+    """
+    并发执行一轮 assistant 消息中的全部 tool_calls。
+    handler(tool_call) 返回要追加到 messages 的 tool 消息（返回 None 表示忽略该调用）。
+    结果按 tool_calls 的原始顺序返回，同时返回本轮耗时（秒）。
+    """
+    start = time.perf_counter()
+    if max_workers <= 1 or len(tool_calls) <= 1:
+        results = [handler(tc) for tc in tool_calls]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(tool_calls))) as executor:
+            # 每个任务携带当前上下文（如正在处理的题目 id），线程池默认不会传递 contextvars
+            futures = [executor.submit(contextvars.copy_context().run, handler, tc) for tc in tool_calls]
+            results = [f.result() for f in futures]
+    return [r for r in results if r is not None], time.perf_counter() - start
@@ -0,0 +1,215 @@
+"""
+DashScope 调用的共享传输层：
+- 全进程共用一个 requests.Session（连接池 + keep-alive），给 VisionDescribe / qwen_vl_ocr 使用
+- 共用的 OpenAI 客户端（按 api_key + base_url 各一个），底层 httpx 连接池大小与超时和上面一致
+- 显式的连接/读取超时
+- 按 "接口 调用方" 统计延迟直方图（调用方默认取请求的模型名，同一模型的不同用途可显式传 label）：
+  headers 为收到响应头的耗时（网络 + 模型推理），total 含读取响应体
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_API_BASE = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+CONNECT_TIMEOUT = 5.0    # 建连超时（秒）
+READ_TIMEOUT = 120.0     # 读取超时（秒），视觉模型生成较慢
+POOL_CONNECTIONS = 4     # 缓存的主机连接池个数
+POOL_MAXSIZE = 32        # 每个主机的最大连接数，需不小于并发工具调用数
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60]  # 直方图桶上界（秒）
+
+
+class LatencyStats:
+    """按接口记录请求耗时，线程安全"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, List[float]] = {}
+
+    def record(self, endpoint: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(endpoint, []).append(seconds)
+
+    def histogram(self, endpoint: str) -> List[int]:
+        """各桶计数，最后一个桶为超过最大上界的请求"""
+        counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        with self._lock:
+            for s in self._samples.get(endpoint, []):
+                counts[bisect.bisect_left(LATENCY_BUCKETS, s)] += 1
+        return counts
+
+    def summary(self) -> str:
+        with self._lock:
+            snapshot = {k: sorted(v) for k, v in self._samples.items()}
+        lines = []
+        for endpoint, samples in sorted(snapshot.items()):
+            n = len(samples)
+            p50, p95 = samples[n // 2], samples[min(n - 1, int(n * 0.95))]
+            lines.append(f"{endpoint}: n={n}, p50={p50:.2f}s, p95={p95:.2f}s, max={samples[-1]:.2f}s")
+            labels = [f"≤{b}s" for b in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}s"]
+            hist = self.histogram(endpoint)
+            lines.append("    " + "  ".join(f"{l}:{c}" for l, c in zip(labels, hist) if c))
+        return "\n".join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+LATENCY = LatencyStats()
+
+
+def api_base() -> str:
+    """接口地址，每次调用时读取 DASHSCOPE_BASE_URL，可指向其它区域或本地 mock"""
+    return os.getenv("DASHSCOPE_BASE_URL", DEFAULT_API_BASE)
+
+_session: Optional[requests.Session] = None
+_openai_clients: Dict[tuple, object] = {}
+_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """进程内共享的 requests.Session"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                _session = s
+    return _session
+
+
+def latency_key(endpoint: str, label: Optional[str]) -> str:
+    return f"{endpoint} {label}" if label else endpoint
+
+
+def post_json(endpoint: str, payload: dict, api_key: str, base_url: Optional[str] = None,
+              label: Optional[str] = None) -> requests.Response:
+    """
+    通过共享 Session POST 一个 JSON 请求到 {base_url}/{endpoint}，并记录延迟；
+    label 区分同一接口、同一模型的不同用途（如 vision_describe / qwen_vl_ocr），默认为模型名
+    """
+    base_url = base_url or api_base()
+    key = latency_key(endpoint, label or payload.get("model"))
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}",
+    }
+    start = time.perf_counter()
+    response = get_session().post(f"{base_url.rstrip('/')}/{endpoint}", headers=headers, json=payload,
+                                  timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    LATENCY.record(f"{key} headers", response.elapsed.total_seconds())
+    LATENCY.record(f"{key} total", time.perf_counter() - start)
+    return response
+
+
+def _latency_key_of(request) -> str:
+    """httpx 请求 → 与 post_json 一致的统计键：接口名（去掉 base_url 的路径前缀）+ 请求体中的模型名"""
+    path = request.url.path
+    endpoint = path.split("/v1/", 1)[-1] if "/v1/" in path else path.lstrip("/")
+    try:
+        model = json.loads(request.content).get("model")
+    except Exception:  # 流式请求体未读取 / 非 JSON 请求体时只按接口统计
+        model = None
+    return latency_key(endpoint, model)
+
+
+def _httpx_options():
+    import httpx
+
+    class TimedStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+        """包装响应体，关闭（读完）时记录 total 耗时"""
+
+        def __init__(self, stream, key: str, start: float):
+            self._stream, self._key, self._start = stream, key, start
+            self._done = False
+
+        def _record(self):
+            if not self._done:
+                self._done = True
+                LATENCY.record(f"{self._key} total", time.perf_counter() - self._start)
+
+        def __iter__(self):
+            yield from self._stream
+
+        def close(self):
+            try:
+                self._stream.close()
+            finally:
+                self._record()
+
+        async def __aiter__(self):
+            async for chunk in self._stream:
+                yield chunk
+
+        async def aclose(self):
+            try:
+                await self._stream.aclose()
+            finally:
+                self._record()
+
+    def on_request(request):
+        request.extensions["start_time"] = time.perf_counter()
+
+    def on_response(response):
+        start = response.request.extensions.get("start_time")
+        if start is not None:
+            key = _latency_key_of(response.request)
+            LATENCY.record(f"{key} headers", time.perf_counter() - start)
+            response.stream = TimedStream(response.stream, key, start)
+
+    async def on_request_async(request):
+        on_request(request)
+
+    async def on_response_async(response):
+        on_response(response)
+
+    limits = httpx.Limits(max_connections=POOL_MAXSIZE, max_keepalive_connections=POOL_MAXSIZE)
+    timeout = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+    sync_hooks = {"request": [on_request], "response": [on_response]}
+    async_hooks = {"request": [on_request_async], "response": [on_response_async]}
+    return httpx, limits, timeout, sync_hooks, async_hooks
+
+
+def get_openai_client(api_key: Optional[str] = None, base_url: Optional[str] = None):
+    """进程内共享的同步 OpenAI 兼容客户端，每组 (api_key, base_url) 一个"""
+    api_key = api_key or os.getenv("QWEN_KEY")
+    base_url = base_url or api_base()
+    key = (api_key, base_url)
+    client = _openai_clients.get(key)
+    if client is None:
+        with _lock:
+            client = _openai_clients.get(key)
+            if client is None:
+                from openai import OpenAI
+                httpx, limits, timeout, hooks, _ = _httpx_options()
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    http_client=httpx.Client(limits=limits, timeout=timeout, event_hooks=hooks),
+                )
+                _openai_clients[key] = client
+    return client
+
+
+def make_async_openai_client(api_key: Optional[str] = None, base_url: Optional[str] = None, **kwargs):
+    """
+    新建异步客户端。httpx.AsyncClient 绑定事件循环，不能跨 asyncio.run 复用，
+    因此每个事件循环新建一个，用完由调用方 close。
+    """
+    from openai import AsyncOpenAI
+    httpx, limits, timeout, _, hooks = _httpx_options()
+    return AsyncOpenAI(
+        api_key=api_key or os.getenv("QWEN_KEY"),
+        base_url=base_url or api_base(),
+        http_client=httpx.AsyncClient(limits=limits, timeout=timeout, event_hooks=hooks),
+        **kwargs,
+    )
@@ -0,0 +1,129 @@
+"""
+用量账本：记录每次模型请求 / 工具调用的 token 与耗时，按题目、模型、工具汇总。
+当前题目通过 contextvar 传递，线程池（tool_executor）和 asyncio 任务都会继承，
+因此并发场景下也能正确归属。
+"""
+import contextvars
+import csv
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional
+
+CURRENT_QUESTION = contextvars.ContextVar("current_question", default=None)
+
+
+class UsageRecord(NamedTuple):
+    question: Optional[str]
+    kind: str                 # chat：对话模型请求；tool：单次工具调用；tool_turn：一轮并发工具调用；cache：复用缓存的题目标签
+    name: str                 # chat 为模型名，tool 为工具名
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    latency: float
+    cached: bool
+    timestamp: float
+
+
+def _pct(values: List[float], q: float) -> float:
+    """最近秩百分位数"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class UsageLedger:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records: List[UsageRecord] = []
+
+    def set_question(self, qid):
+        """设置当前上下文中的题目 id，之后的记录都归到该题目"""
+        return CURRENT_QUESTION.set(None if qid is None else str(qid))
+
+    def record(self, kind: str, name: str, model: str = "", prompt_tokens: int = 0,
+               completion_tokens: int = 0, total_tokens: Optional[int] = None,
+               latency: float = 0.0, cached: bool = False):
+        if total_tokens is None:
+            total_tokens = prompt_tokens + completion_tokens
+        rec = UsageRecord(CURRENT_QUESTION.get(), kind, name, model or name, prompt_tokens,
+                          completion_tokens, total_tokens, latency, cached, time.time())
+        with self._lock:
+            self._records.append(rec)
+
+    def record_chat(self, model: str, usage, latency: float):
+        """记录一次对话请求，usage 为 OpenAI SDK 返回的 usage 对象（可能为 None）"""
+        self.record("chat", model, model,
+                    getattr(usage, "prompt_tokens", 0) or 0,
+                    getattr(usage, "completion_tokens", 0) or 0,
+                    getattr(usage, "total_tokens", None),
+                    latency)
+
+    def records(self) -> List[UsageRecord]:
+        with self._lock:
+            return list(self._records)
+
+    def totals(self) -> Dict[str, int]:
+        recs = [r for r in self.records() if r.kind != "tool_turn"]
+        return {
+            "prompt_tokens": sum(r.prompt_tokens for r in recs),
+            "completion_tokens": sum(r.completion_tokens for r in recs),
+            "total_tokens": sum(r.total_tokens for r in recs),
+        }
+
+    def summary(self) -> str:
+        recs = self.records()
+        if not recs:
+            return "无用量记录"
+        lines = []
+        t = self.totals()
+        lines.append(f"总计 tokens: 提示={t['prompt_tokens']}, 完成={t['completion_tokens']}, "
+                     f"合计={t['total_tokens']}")
+
+        groups = defaultdict(list)
+        for r in recs:
+            groups[(r.kind, r.name)].append(r)
+        for (kind, name), rs in sorted(groups.items()):
+            lat = [r.latency for r in rs]
+            label = {"chat": "模型", "tool": "工具", "tool_turn": "工具轮次", "cache": "缓存"}.get(kind, kind)
+            line = (f"{label} {name}: 次数={len(rs)}, tokens={sum(r.total_tokens for r in rs)}, "
+                    f"延迟 p50={_pct(lat, 0.5):.2f}s p95={_pct(lat, 0.95):.2f}s")
+            hits = sum(r.cached for r in rs)
+            if hits:
+                line += f", 缓存命中={hits}"
+            lines.append(line)
+
+        per_q_tokens, per_q_latency = defaultdict(int), defaultdict(float)
+        for r in recs:
+            if r.question is None or r.kind == "tool_turn":
+                continue
+            per_q_tokens[r.question] += r.total_tokens
+            if r.kind == "chat" or r.kind == "tool":
+                per_q_latency[r.question] += r.latency
+        if per_q_tokens:
+            tok = list(per_q_tokens.values())
+            lat = list(per_q_latency.values())
+            lines.append(f"每题 tokens: 题目数={len(tok)}, p50={_pct(tok, 0.5):.0f}, "
+                         f"p95={_pct(tok, 0.95):.0f}, max={max(tok)}")
+            lines.append(f"每题请求耗时: p50={_pct(lat, 0.5):.2f}s, p95={_pct(lat, 0.95):.2f}s")
+        return "\n".join(lines)
+
+    def to_csv(self, path: str):
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(UsageRecord._fields)
+            writer.writerows(self.records())
+
+    def to_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([r._asdict() for r in self.records()], f, ensure_ascii=False, indent=2)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+LEDGER = UsageLedger()
@@ -1,5 +1,13 @@
-import json, torch, os, base64, requests
+import json, os, pathlib, time
 from qwen_agent.tools.base import BaseTool, register_tool
+from model.response_cache import ResponseCache, make_key
+from model.transport import post_json
+from model.image_prep import IMAGE_PREP, PREP_SIGNATURE
+from model.usage_ledger import LEDGER
+
+VISION_MODEL = "qwen-vl-plus"
+VISION_PROMPT = "Describe and OCR this image"
+DEFAULT_CACHE_PATH = str(pathlib.Path(__file__).parent.parent / "data" / "cache" / "vision_cache.sqlite")
 
 @register_tool("vision_describe")
 class VisionDescribe(BaseTool):
@@ -7,35 +15,43 @@ class VisionDescribe(BaseTool):
     parameters  = [{"name": "image_path", "type": "string",
                     "description": "本地路径或 http(s) URL", "required": True}]
 
-    def __init__(self):
+    def __init__(self, cache: ResponseCache = None):
         self.qwen_key = os.getenv("QWEN_KEY")
         if not self.qwen_key:
             raise ValueError("请设置 QWEN_KEY 环境变量")
+        # 按 图片内容 hash + 模型 + 提示词 缓存描述结果，重复图片不再请求网络
+        self.cache = cache or ResponseCache(os.getenv("VISION_CACHE_PATH", DEFAULT_CACHE_PATH))
 
     def call(self, params: str, **kw):
         path = json.loads(params)["image_path"]
+        start = time.perf_counter()
 
         with open(path, "rb") as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
+            img_bytes = img_file.read()
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.qwen_key}"
-        }
+        # 预处理参数变化会改变上传内容，签名一并计入缓存键
+        cache_key = make_key(img_bytes, VISION_MODEL, VISION_PROMPT, PREP_SIGNATURE)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            LEDGER.record("tool", "vision_describe", VISION_MODEL, latency=time.perf_counter() - start, cached=True)
+            return json.dumps({"caption": cached}, ensure_ascii=False)
+
+        # 缩放到 Qwen-VL 合适的尺寸并按真实格式编码
+        prep = IMAGE_PREP.prepare_bytes(img_bytes)
 
         payload = {
-            "model": "qwen-vl-plus",
+            "model": VISION_MODEL,
             "messages": [{
                 "role": "user",
                 "content": [
                     {
                         "type": "text",
-                        "text": "Describe and OCR this image"
+                        "text": VISION_PROMPT
                     },
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{img_base64}"
+                            "url": prep.data_url()
                         }
                     }
                 ]
@@ -43,21 +59,22 @@ class VisionDescribe(BaseTool):
         }
 
         try:
-            response = requests.post(
-                "https://dashscope.aliyuncs.com/compatible-mode/v1/chat/completions",
-                headers=headers,
-                json=payload
-            )
+            response = post_json("chat/completions", payload, self.qwen_key, label="vision_describe")
 
             if response.status_code != 200:
                 return json.dumps({"error": f"API错误: {response.text}"}, ensure_ascii=False)
-            
+
             result = response.json()
+            usage = result.get("usage") or {}
+            LEDGER.record("tool", "vision_describe", VISION_MODEL,
+                          usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0),
+                          usage.get("total_tokens"), time.perf_counter() - start)
             if "choices" in result and len(result["choices"]) > 0:
                 caption = result["choices"][0]["message"]["content"]
+                self.cache.put(cache_key, caption)
                 return json.dumps({"caption": caption}, ensure_ascii=False)
             else:
                 return json.dumps({"error": "未知响应格式"}, ensure_ascii=False)
-            
+
         except Exception as e:
-            return json.dumps({"error": f"请求失败: {str(e)}"}, ensure_ascii=False)
\ No newline at end of file
+            return json.dumps({"error": f"请求失败: {str(e)}"}, ensure_ascii=False)
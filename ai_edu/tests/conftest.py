@@ -0,0 +1,76 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# 与脚本一致，以 ai_edu/ 为根导入 main.* / model.*
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def chat_reply(content: str, prompt_tokens: int = 10, completion_tokens: int = 5) -> dict:
+    return {
+        "id": "stub", "object": "chat.completion", "created": 0, "model": "stub",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+class StubAPI:
+    """
+    本地 OpenAI 兼容 mock。每个 POST 的 JSON 请求体记入 requests，
+    由 respond(body, n) 返回 (状态码, 响应 dict, 延迟秒数)，n 为该请求的序号（从 0 开始）。
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.times = []  # 每个请求到达的 time.monotonic()
+        self.respond = lambda body, n: (200, chat_reply(f"reply {n}"), 0)
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub._lock:
+                    n = len(stub.requests)
+                    stub.requests.append(body)
+                    stub.times.append(time.monotonic())
+                status, reply, delay = stub.respond(body, n)
+                time.sleep(delay)
+                data = json.dumps(reply).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def calls(self) -> int:
+        return len(self.requests)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_api(monkeypatch):
+    stub = StubAPI()
+    monkeypatch.setenv("DASHSCOPE_BASE_URL", stub.url)
+    monkeypatch.setenv("QWEN_KEY", "test-key")
+    yield stub
+    stub.close()
@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("openai")
+
+from main import async_runner
+from main.async_runner import TokenBucket, run_tagging
+from model import transport
+
+from conftest import chat_reply
+
+
+def _prompt(body):
+    return body["messages"][0]["content"]
+
+
+def _no_tools(tool_call):
+    return None
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(async_runner, "RETRY_BASE", 0.01)
+
+
+def _empty_bucket(monkeypatch):
+    """令牌桶从空桶开始，跳过一分钟额度的初始突发，直接按速率放行"""
+    class EmptyBucket(TokenBucket):
+        def __init__(self, rate_per_min):
+            super().__init__(rate_per_min)
+            self.tokens = 0.0
+
+    monkeypatch.setattr(async_runner, "TokenBucket", EmptyBucket)
+
+
+def test_results_in_submission_order(stub_api):
+    n = 6
+    # 越靠前的题目响应越慢，完成顺序与提交顺序相反
+    stub_api.respond = lambda body, _: (200, chat_reply(f"echo {_prompt(body)}"),
+                                        0.05 * (n - int(_prompt(body)[1:])))
+    finished = []
+    results = run_tagging([f"p{i}" for i in range(n)], _no_tools, "stub", concurrency=n,
+                          rpm=None, tpm=None, on_result=lambda idx, _: finished.append(idx))
+
+    assert results == [f"echo p{i}" for i in range(n)]
+    assert finished != sorted(finished)
+
+
+def test_rate_limited_request_is_retried(stub_api):
+    stub_api.respond = lambda body, n: ((429, {"error": {"message": "rate limited"}}, 0) if n == 0
+                                        else (200, chat_reply("ok"), 0))
+    assert run_tagging(["p0"], _no_tools, "stub", rpm=None, tpm=None) == ["ok"]
+    assert stub_api.calls == 2
+
+
+def test_timeout_is_retried(stub_api, monkeypatch):
+    monkeypatch.setattr(transport, "READ_TIMEOUT", 0.2)
+    stub_api.respond = lambda body, n: (200, chat_reply("late" if n == 0 else "ok"), 1.0 if n == 0 else 0)
+    assert run_tagging(["p0"], _no_tools, "stub", rpm=None, tpm=None) == ["ok"]
+    assert stub_api.calls == 2
+
+
+def test_exhausted_retries_return_exception(stub_api):
+    stub_api.respond = lambda body, n: (500, {"error": {"message": "boom"}}, 0)
+    results = run_tagging(["p0", "p1"], _no_tools, "stub", rpm=None, tpm=None, max_retry=2)
+    assert all(isinstance(r, Exception) for r in results)
+    assert stub_api.calls == 4
+
+
+def test_rpm_bucket_caps_request_rate(stub_api, monkeypatch):
+    _empty_bucket(monkeypatch)
+    # 600 次/分钟 = 每 0.1s 放行一个，并发数不限制时 6 个请求至少跨 0.5s
+    run_tagging([f"p{i}" for i in range(6)], _no_tools, "stub", concurrency=6, rpm=600, tpm=None)
+    assert stub_api.calls == 6
+    gaps = [b - a for a, b in zip(stub_api.times, stub_api.times[1:])]
+    assert stub_api.times[-1] - stub_api.times[0] >= 0.45
+    assert min(gaps) >= 0.05
+
+
+def test_tpm_bucket_caps_token_rate(stub_api, monkeypatch):
+    _empty_bucket(monkeypatch)
+    # 每个请求预估 len("pN") + max_tokens = 50 token，实际用量相同；
+    # 6000 token/分钟 = 100 token/s，3 个并发请求至少跨 1s
+    stub_api.respond = lambda body, n: (200, chat_reply("ok", prompt_tokens=45, completion_tokens=5), 0)
+    run_tagging([f"p{i}" for i in range(3)], _no_tools, "stub", concurrency=3, rpm=None, tpm=6000,
+                max_tokens=48)
+    assert stub_api.calls == 3
+    assert stub_api.times[-1] - stub_api.times[0] >= 0.9
+
+
+def test_token_bucket_rate():
+    async def drain():
+        bucket = TokenBucket(600)  # 每秒 10 个
+        bucket.tokens = 0.0
+        start = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire(1)
+        return time.monotonic() - start
+
+    assert asyncio.run(drain()) >= 0.45
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("requests")
+
+from model import transport
+from model.transport import LATENCY, get_openai_client, make_async_openai_client, post_json
+
+
+@pytest.fixture(autouse=True)
+def clean_latency():
+    LATENCY.clear()
+    yield
+    LATENCY.clear()
+
+
+def _keys():
+    return set(LATENCY._samples)
+
+
+def test_latency_keyed_by_endpoint_and_caller(stub_api):
+    client = get_openai_client()
+    client.chat.completions.create(model="qwen-vl-plus", messages=[{"role": "user", "content": "hi"}])
+    post_json("chat/completions", {"model": "qwen-vl-plus", "messages": []}, "test-key", label="vision_describe")
+    post_json("chat/completions", {"model": "qwen-vl-max", "messages": []}, "test-key")
+
+    assert _keys() == {
+        "chat/completions qwen-vl-plus headers", "chat/completions qwen-vl-plus total",
+        "chat/completions vision_describe headers", "chat/completions vision_describe total",
+        "chat/completions qwen-vl-max headers", "chat/completions qwen-vl-max total",
+    }
+
+
+def test_async_client_records_total(stub_api):
+    async def call():
+        client = make_async_openai_client()
+        try:
+            await client.chat.completions.create(model="stub", messages=[{"role": "user", "content": "hi"}])
+        finally:
+            await client.close()
+
+    asyncio.run(call())
+    assert _keys() == {"chat/completions stub headers", "chat/completions stub total"}
+    assert LATENCY._samples["chat/completions stub total"][0] >= LATENCY._samples["chat/completions stub headers"][0]
+
+
+def test_openai_client_shared_per_key_and_url(stub_api, monkeypatch):
+    monkeypatch.setattr(transport, "_openai_clients", {})
+    default = get_openai_client()
+    assert get_openai_client() is default
+    assert get_openai_client("test-key", stub_api.url) is default
+    other = get_openai_client("other-key")
+    assert other is not default and other.api_key == "other-key"
+    assert get_openai_client(base_url="http://127.0.0.1:1/v1") is not default
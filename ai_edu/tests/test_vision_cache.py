@@ -0,0 +1,90 @@
+import io
+import json
+import types
+
+import pytest
+
+pytest.importorskip("qwen_agent")
+pytest.importorskip("requests")
+from PIL import Image
+
+from model import response_cache
+from model.response_cache import ResponseCache
+from model.vision_tool import VisionDescribe
+
+
+def _png(path, color):
+    buf = io.BytesIO()
+    Image.new("RGB", (32, 32), color).save(buf, format="PNG")
+    path.write_bytes(buf.getvalue())
+    return str(path)
+
+
+def _describe(tool, path):
+    return json.loads(tool.call(json.dumps({"image_path": path})))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ResponseCache 使用的时钟，每次读取前进 1 秒；now[0] 可手动快进"""
+    now = [1000.0]
+
+    def tick():
+        now[0] += 1
+        return now[0]
+
+    monkeypatch.setattr(response_cache, "time", types.SimpleNamespace(time=tick))
+    return now
+
+
+def test_miss_then_hit(stub_api, tmp_path, monkeypatch):
+    monkeypatch.setenv("VISION_CACHE_PATH", str(tmp_path / "vision.sqlite"))
+    red, blue = _png(tmp_path / "red.png", "red"), _png(tmp_path / "blue.png", "blue")
+
+    tool = VisionDescribe()
+    first = _describe(tool, red)
+    assert first == {"caption": "reply 0"}
+    assert _describe(tool, red) == first
+    assert stub_api.calls == 1
+
+    # 同内容的另一份文件同样命中；不同图片会请求
+    copy = tmp_path / "copy.png"
+    copy.write_bytes(open(red, "rb").read())
+    assert _describe(tool, str(copy)) == first
+    assert _describe(tool, blue) == {"caption": "reply 1"}
+    assert stub_api.calls == 2
+
+    # 缓存落盘，新实例（新进程）直接命中
+    tool.cache.close()
+    assert _describe(VisionDescribe(), red) == first
+    assert stub_api.calls == 2
+
+
+def test_ttl_expiry(stub_api, tmp_path, clock):
+    red = _png(tmp_path / "red.png", "red")
+    tool = VisionDescribe(cache=ResponseCache(tmp_path / "vision.sqlite", ttl=60))
+
+    _describe(tool, red)
+    _describe(tool, red)
+    assert stub_api.calls == 1
+
+    clock[0] += 61
+    assert _describe(tool, red) == {"caption": "reply 1"}
+    assert stub_api.calls == 2
+
+
+def test_byte_cap_evicts_least_recently_used(stub_api, tmp_path, clock):
+    paths = {c: _png(tmp_path / f"{c}.png", c) for c in ("red", "green", "blue")}
+    # 每条描述 "reply N" 为 7 字节，上限 15 字节只能保留两条
+    tool = VisionDescribe(cache=ResponseCache(tmp_path / "vision.sqlite", max_bytes=15))
+
+    _describe(tool, paths["red"])
+    _describe(tool, paths["green"])
+    _describe(tool, paths["red"])    # 命中，red 变为最近使用
+    _describe(tool, paths["blue"])   # 超出上限，淘汰最久未用的 green
+    assert stub_api.calls == 3
+
+    _describe(tool, paths["red"])
+    assert stub_api.calls == 3
+    _describe(tool, paths["green"])
+    assert stub_api.calls == 4